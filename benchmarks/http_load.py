@@ -0,0 +1,96 @@
+"""
+Load test for the MCP server's SSE transport.
+
+Opens many concurrent MCP sessions against one running server and issues
+tool calls from each of them, then reports session setup time, throughput
+and latency percentiles.
+
+Start the server first:
+    uv run src/main.py --transport sse --port 8000
+Then:
+    uv run benchmarks/http_load.py --sessions 50 --calls 20
+    uv run benchmarks/http_load.py --tool get_employee_count --arguments '{"only_active": true}'
+
+Without --tool each call is a `tools/list` request, which exercises the
+transport and JSON handling without touching the Dingtalk API.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+
+async def run_session(url: str, calls: int, tool: str | None, arguments: dict[str, Any] | None,
+                      stats: dict[str, list]) -> None:
+    start = time.perf_counter()
+    async with sse_client(url) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            stats["connect"].append(time.perf_counter() - start)
+            for _ in range(calls):
+                call_start = time.perf_counter()
+                try:
+                    if tool is None:
+                        await session.list_tools()
+                    else:
+                        result = await session.call_tool(tool, arguments or {})
+                        if result.content and result.content[0].text.startswith("Error:"):
+                            stats["errors"].append(result.content[0].text)
+                except Exception as e:
+                    stats["errors"].append(str(e))
+                stats["latency"].append(time.perf_counter() - call_start)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run_load(url: str, sessions: int, calls: int, tool: str | None = None,
+                   arguments: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Run `sessions` concurrent clients doing `calls` calls each and return the measurements."""
+    stats: dict[str, list] = {"connect": [], "latency": [], "errors": []}
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_session(url, calls, tool, arguments, stats) for _ in range(sessions)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+    failed_sessions = [r for r in results if isinstance(r, BaseException)]
+    total_calls = len(stats["latency"])
+    return {
+        "sessions": sessions,
+        "failed_sessions": len(failed_sessions),
+        "calls": total_calls,
+        "errors": len(stats["errors"]),
+        "elapsed_s": round(elapsed, 3),
+        "calls_per_s": round(total_calls / elapsed, 1) if elapsed else 0.0,
+        "connect_mean_ms": round(statistics.mean(stats["connect"]) * 1000, 2) if stats["connect"] else 0.0,
+        "latency_p50_ms": round(percentile(stats["latency"], 0.50) * 1000, 2),
+        "latency_p95_ms": round(percentile(stats["latency"], 0.95) * 1000, 2),
+        "latency_p99_ms": round(percentile(stats["latency"], 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/sse")
+    parser.add_argument("--sessions", type=int, default=20, help="number of concurrent MCP sessions")
+    parser.add_argument("--calls", type=int, default=20, help="calls per session")
+    parser.add_argument("--tool", default=None, help="tool to call; defaults to tools/list")
+    parser.add_argument("--arguments", default="{}", help="tool arguments as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.url, args.sessions, args.calls, args.tool, json.loads(args.arguments)))
+    print(json.dumps(result, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Set algebra over department and role memberships of a synthetic organization.
+
+Builds MembershipSets for `--users` users spread over a department tree,
+with a tenth of them also in a second department and `--roles` roles of
+random members, then prints the build time, the size of the bitsets and
+the mean latency of typical expressions.
+
+    uv run benchmarks/member_sets.py --users 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from dingtalk.mirror.membership import MembershipSets, parse_expression
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+from org_crawl import SyntheticOrg
+
+EXPRESSIONS = [
+    "dept:2 - role:1",
+    "group:1 & dept:3",
+    "dept:1 - role:1 - role:2",
+    "(role:1 | role:2) & (dept:2 | dept:4)",
+    "all - dept:2",
+    "direct:100 | direct:200",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--users-per-dept", type=int, default=50)
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    org = SyntheticOrg(args.users, args.users_per_dept, 10)
+    members = {d: [f"user{n}" for n in org.members(d)] for d in range(1, org.departments + 1)}
+    for n in random.sample(range(args.users), args.users // 10):
+        members[random.randint(1, org.departments)].append(f"user{n}")
+
+    store = MirrorStore(":memory:")
+    roles = RoleIndex(store)
+    roles.save([{"id": r, "name": f"角色{r}", "groupId": r % 5} for r in range(1, args.roles + 1)],
+               {r: [{"userid": f"user{n}"} for n in random.sample(range(args.users), args.users // 20)]
+                for r in range(1, args.roles + 1)})
+    tree = DepartmentTree()
+    tree.load((d, org.department(d).get("parent_id")) for d in range(1, org.departments + 1))
+    sets = MembershipSets(store, tree, roles)
+
+    start = time.perf_counter()
+    sets.build(members)
+    print(f"{args.users} users, {org.departments} departments, {args.roles} roles")
+    print(f"build: {time.perf_counter() - start:.2f}s, bitsets: {sets.nbytes() / 2 ** 20:.1f} MiB")
+
+    print(f"{'expression':<40} {'members':>8} {'mean':>10}")
+    for expression in EXPRESSIONS:
+        node = parse_expression(expression)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            count = len(sets.evaluate(node))
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{expression:<40} {count:>8} {elapsed * 1e6:>8.1f}us")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
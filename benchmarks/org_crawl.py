@@ -0,0 +1,178 @@
+"""
+Organization mirror crawl against a local stub of the Dingtalk API.
+
+The stub serves a synthetic organization (100k users by default, spread
+over a department tree) from a separate process, adding a fixed latency to
+every call to stand in for the network. The script crawls it into a fresh
+SQLite mirror at each concurrency level and prints throughput.
+
+    uv run benchmarks/org_crawl.py --users 100000 --latency 0.02 --concurrency 1,8,32
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.mirror.crawler import Crawler
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.rate_limiter import RateLimiter
+from worker_scaling import wait_for_port
+
+API = "https://oapi.dingtalk.com"
+
+
+class SyntheticOrg:
+    """
+    Departments numbered breadth-first from 1 with `fanout` children each,
+    and `users_per_dept` users in every department.
+    """
+
+    def __init__(self, users: int, users_per_dept: int, fanout: int):
+        self.users_per_dept = users_per_dept
+        self.fanout = fanout
+        self.departments = -(-users // users_per_dept)
+        self.users = users
+
+    def department(self, dept_id: int) -> dict:
+        dept = {"dept_id": dept_id, "name": f"部门{dept_id}", "auto_add_user": False, "create_dept_group": False}
+        if dept_id > 1:
+            dept["parent_id"] = (dept_id - 2) // self.fanout + 1
+        return dept
+
+    def children(self, dept_id: int) -> list[dict]:
+        first = (dept_id - 1) * self.fanout + 2
+        return [self.department(d) for d in range(first, min(first + self.fanout, self.departments + 1))]
+
+    def members(self, dept_id: int) -> range:
+        start = (dept_id - 1) * self.users_per_dept
+        return range(start, min(start + self.users_per_dept, self.users))
+
+    def user(self, n: int, dept_id: int) -> dict:
+        return {
+            "userid": f"user{n}",
+            "unionid": f"union{n:08d}",
+            "name": f"用户{n}",
+            "mobile": f"138{n:08d}",
+            "job_number": f"E{n:06d}",
+            "title": "工程师",
+            "email": f"user{n}@example.com",
+            "dept_id_list": [dept_id],
+            "active": True,
+            "admin": False,
+            "boss": False,
+            "leader": False,
+            "hired_date": 1600000000000 + n,
+        }
+
+
+def run_stub(port: int, users: int, users_per_dept: int, fanout: int, latency: float):
+    org = SyntheticOrg(users, users_per_dept, fanout)
+
+    def ok(result) -> web.Response:
+        return web.json_response({"errcode": 0, "errmsg": "ok", "result": result})
+
+    async def gettoken(request):
+        return web.json_response({"errcode": 0, "access_token": "stub", "expires_in": 7200})
+
+    async def department_get(request):
+        await asyncio.sleep(latency)
+        return ok(org.department((await request.json())["dept_id"]))
+
+    async def listsub(request):
+        await asyncio.sleep(latency)
+        return ok(org.children((await request.json()).get("dept_id", 1)))
+
+    async def user_list(request):
+        await asyncio.sleep(latency)
+        body = await request.json()
+        members = org.members(body["dept_id"])
+        cursor, size = body.get("cursor") or 0, min(body.get("size") or 100, 100)
+        page = members[cursor:cursor + size]
+        result = {"has_more": cursor + size < len(members), "list": [org.user(n, body["dept_id"]) for n in page]}
+        if result["has_more"]:
+            result["next_cursor"] = cursor + size
+        return ok(result)
+
+    app = web.Application()
+    app.router.add_get("/gettoken", gettoken)
+    app.router.add_post("/topapi/v2/department/get", department_get)
+    app.router.add_post("/topapi/v2/department/listsub", listsub)
+    app.router.add_post("/topapi/v2/user/list", user_list)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+class StubSession:
+    """Client session sending Dingtalk API requests to the stub instead."""
+
+    def __init__(self, base: str, limit: int):
+        self.base = base
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit))
+        self.headers = self.session.headers
+
+    def get(self, url: str, **kwargs):
+        return self.session.get(url.replace(API, self.base), **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.session.post(url.replace(API, self.base), **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+
+async def crawl_once(base: str, concurrency: int, page_size: int, qps: float) -> dict:
+    contacts = DingtalkContactsServer(app_key="bench", app_secret="bench", qps=qps, rate_limiter=RateLimiter(qps))
+    contacts.session = StubSession(base, limit=max(concurrency, 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MirrorStore(os.path.join(tmp, "mirror.db"))
+        try:
+            report = await Crawler(contacts, store, concurrency, page_size, checkpoint_interval=1).run()
+            report["users"] = store.status()["users"]
+        finally:
+            store.close()
+            await contacts.cleanup()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--users-per-dept", type=int, default=40)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every stub call")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated concurrency levels")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--qps", type=float, default=0, help="rate limit, 0 to disable")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    stub = multiprocessing.Process(
+        target=run_stub, args=(args.port, args.users, args.users_per_dept, args.fanout, args.latency), daemon=True)
+    stub.start()
+    try:
+        wait_for_port("127.0.0.1", args.port)
+        base = f"http://127.0.0.1:{args.port}"
+        print(f"{'concurrency':>11} {'departments':>11} {'users':>8} {'calls':>7} {'seconds':>8} "
+              f"{'users/s':>9} {'calls/s':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            start = time.perf_counter()
+            r = asyncio.run(crawl_once(base, concurrency, args.page_size, args.qps))
+            elapsed = time.perf_counter() - start
+            print(f"{concurrency:>11} {r['departments']:>11} {r['users']:>8} {r['calls']:>7} {elapsed:>8.2f} "
+                  f"{r['users'] / elapsed:>9.0f} {r['calls'] / elapsed:>8.1f}", flush=True)
+    finally:
+        stub.terminate()
+        stub.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Upstream calls of a tool-driven directory walk at the tools' default page sizes.
+
+Pages through every department's users with get_department_user_details and
+get_department_user_simple, and through the roles and external contacts,
+the way an agent does: at the small page sizes the tool descriptions
+suggest. Runs against an in-process fake of the Dingtalk API, once with the
+page cache off and once with it on, and prints the upstream calls each took.
+
+    uv run benchmarks/page_sizes.py --users 20000 --users-per-dept 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results
+from dingtalk.pagination import PageCache
+from dingtalk.rate_limiter import RateLimiter
+from org_crawl import SyntheticOrg
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def json(self):
+        return self.data
+
+
+class FakeSession:
+    """Answers the offset-paged endpoints from a SyntheticOrg and counts the calls."""
+
+    def __init__(self, org: SyntheticOrg, roles: int, contacts: int):
+        self.org = org
+        self.roles = [{"groupId": g, "name": f"角色组{g}", "roles": [{"id": g, "name": f"角色{g}"}]}
+                      for g in range(roles)]
+        self.contacts = [{"userid": f"ext{n}", "name": f"外部联系人{n}"} for n in range(contacts)]
+        self.calls = 0
+
+    def post(self, url, params=None, json=None):
+        self.calls += 1
+        endpoint = url.rsplit("/topapi/", 1)[1]
+        if endpoint == "extcontact/list":
+            return FakeResponse({"errcode": 0, "results": self.contacts[json["offset"]:json["offset"] + json["size"]]})
+        if endpoint == "role/list":
+            offset, size = json["offset"], json["size"]
+            return FakeResponse({"errcode": 0, "result": {"hasMore": offset + size < len(self.roles),
+                                                          "list": self.roles[offset:offset + size]}})
+        cursor, size = json["cursor"], json["size"]
+        members = self.org.members(json["dept_id"])
+        users = [self.org.user(n, json["dept_id"]) for n in members[cursor:cursor + size]]
+        if endpoint == "user/listsimple":
+            users = [{"userid": u["userid"], "name": u["name"]} for u in users]
+        result = {"has_more": cursor + size < len(members), "list": users}
+        if result["has_more"]:
+            result["next_cursor"] = cursor + size
+        return FakeResponse({"errcode": 0, "result": result})
+
+
+async def walk(contacts: DingtalkContactsServer, departments: int) -> int:
+    """Page through everything at the default sizes; returns the number of tool calls."""
+    calls = 0
+    for dept_id in range(1, departments + 1):
+        for method in (contacts.get_department_user_details, contacts.get_department_user_simple):
+            cursor = 0
+            while True:
+                page = await method(dept_id, cursor, 10)
+                calls += 1
+                if not page["has_more"]:
+                    break
+                cursor = page["next_cursor"]
+    offset = 0
+    while True:
+        page = await contacts.get_role_list(20, offset)
+        calls += 1
+        if not page["hasMore"]:
+            break
+        offset += len(page["list"])
+    offset = 0
+    while True:
+        page = await contacts.get_external_contact_list(20, offset)
+        calls += 1
+        if len(page) < 20:
+            break
+        offset += 20
+    return calls
+
+
+async def run(args, cache: bool) -> tuple[int, int, float]:
+    org = SyntheticOrg(args.users, args.users_per_dept, 10)
+    contacts = DingtalkContactsServer(app_key="bench", app_secret="bench", rate_limiter=RateLimiter(10 ** 9))
+    contacts.session = FakeSession(org, args.roles, args.external_contacts)
+    contacts.access_token, contacts.token_expires = "bench", 2 ** 40
+    contacts.pages = PageCache() if cache else None
+    token = raw_results.set(True)
+    try:
+        start = time.perf_counter()
+        calls = await walk(contacts, org.departments)
+        return calls, contacts.session.calls, time.perf_counter() - start
+    finally:
+        raw_results.reset(token)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--users-per-dept", type=int, default=50)
+    parser.add_argument("--roles", type=int, default=300)
+    parser.add_argument("--external-contacts", type=int, default=2000)
+    args = parser.parse_args()
+    # the server logs every request at INFO
+    logging.disable(logging.INFO)
+
+    print(f"{'page cache':>10} {'tool calls':>11} {'upstream':>9} {'time':>8}")
+    for cache in (False, True):
+        calls, upstream, elapsed = await run(args, cache)
+        print(f"{'on' if cache else 'off':>10} {calls:>11} {upstream:>9} {elapsed:>7.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
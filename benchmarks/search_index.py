@@ -0,0 +1,79 @@
+"""
+Query latency of the offline user search index over a synthetic directory.
+
+Builds a SearchIndex over `--users` generated users (Chinese names,
+English nicknames, job numbers and titles) and prints the mean latency of
+typical exact, prefix and fuzzy queries.
+
+    uv run benchmarks/search_index.py --users 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from dingtalk.mirror import search
+from dingtalk.mirror.search import SearchIndex, USER_FIELDS
+
+SURNAMES = "张王李赵刘陈杨黄周吴徐孙马朱胡郭何林高罗"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华"
+ENGLISH = ["Zhang", "Wang", "Li", "Zhao", "Liu", "Chen", "Yang", "Huang", "Zhou", "Wu",
+           "Amy", "Bob", "Carol", "David", "Eric", "Frank", "Grace", "Helen", "Ivan", "Jack"]
+TITLES = ["工程师", "高级工程师", "产品经理", "设计师", "销售", "人力资源专员", "财务"]
+
+QUERIES = [
+    ("张伟", "exact"),
+    ("E012345", "exact"),
+    ("张", "prefix"),
+    ("E0123", "prefix"),
+    ("高级", "prefix"),
+    ("张伟", "fuzzy"),
+    ("zhang", "fuzzy"),
+    ("grace wang", "fuzzy"),
+    ("grcae wang", "fuzzy"),
+]
+
+
+def synthetic_users(count: int) -> list[dict]:
+    rng = random.Random(0)
+    return [
+        {
+            "userid": f"user{n}",
+            "name": rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice([1, 2]))),
+            "nickname": f"{rng.choice(ENGLISH)} {rng.choice(ENGLISH)}",
+            "job_number": f"E{n:06d}",
+            "title": rng.choice(TITLES),
+        }
+        for n in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--size", type=int, default=20, help="results per query")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    users = synthetic_users(args.users)
+    index = SearchIndex(USER_FIELDS)
+    start = time.perf_counter()
+    for user in users:
+        index.set(user["userid"], user)
+    index.build()
+    print(f"indexed {args.users} users ({len(index.keys)} keys) in {time.perf_counter() - start:.2f}s, "
+          f"pinyin {'on' if search.lazy_pinyin else 'off (pypinyin not installed)'}")
+
+    print(f"{'query':<14} {'mode':<7} {'hits':>5} {'more':>5} {'mean_ms':>8}")
+    for query, mode in QUERIES:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            hits, more = index.search(query, mode, limit=args.size)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{query:<14} {mode:<7} {len(hits):>5} {str(more):>5} {elapsed * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
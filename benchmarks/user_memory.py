@@ -0,0 +1,99 @@
+"""
+Memory footprint of mirrored users as plain dicts versus UserColumns.
+
+Generates topapi/v2/user/list-shaped records, decoded from JSON one at a
+time as the API client does, and measures with tracemalloc the memory held
+by a list of the dicts and by a UserColumns holding the same users.
+
+    uv run benchmarks/user_memory.py --users 10000 100000 500000
+"""
+import argparse
+import gc
+import json as JSON
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from dingtalk.mirror.columns import UserColumns
+
+SURNAMES = "张王李赵刘陈杨黄周吴徐孙马朱胡郭何林高罗"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华"
+TITLES = ["工程师", "高级工程师", "产品经理", "设计师", "销售", "人力资源专员", "财务"]
+PLACES = ["杭州", "北京", "上海", "深圳"]
+
+
+def synthetic_records(count: int):
+    """JSON-encoded user records, like the bodies the API returns."""
+    rng = random.Random(0)
+    for n in range(count):
+        yield JSON.dumps({
+            "userid": f"{rng.getrandbits(60):016x}",
+            "unionid": f"{rng.getrandbits(120):030x}iE",
+            "name": rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice([1, 2]))),
+            "avatar": f"https://static-legacy.dingtalk.com/media/{rng.getrandbits(80):020x}.jpg",
+            "mobile": f"1{rng.randrange(3, 10)}{rng.randrange(10 ** 9):09d}",
+            "hide_mobile": False,
+            "job_number": f"E{n:07d}",
+            "title": rng.choice(TITLES),
+            "email": f"user{n}@example.com",
+            "work_place": rng.choice(PLACES),
+            "state_code": "86",
+            "manager_userid": f"manager{rng.randrange(count // 20 + 1)}",
+            "dept_id_list": [rng.randrange(2, 5000) for _ in range(rng.choice([1, 1, 1, 2]))],
+            "dept_order_list": [{"dept_id": 1, "order": rng.getrandbits(40)}],
+            "extension": "{}",
+            "hired_date": 1500000000000 + rng.randrange(2 * 10 ** 11),
+            "active": rng.random() < 0.95,
+            "admin": False,
+            "boss": False,
+            "leader": rng.random() < 0.1,
+            "exclusive_account": False,
+        }, ensure_ascii=False)
+
+
+def measure(build) -> tuple[int, float]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000, 500000])
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'dicts_mb':>9} {'columns_mb':>11} {'ratio':>6} {'dicts_s':>8} {'columns_s':>10} {'lookup_us':>10}")
+    for count in args.users:
+        dicts, dicts_s = measure(lambda: [JSON.loads(r) for r in synthetic_records(count)])
+
+        def build_columns():
+            columns = UserColumns()
+            columns.extend((JSON.loads(r), None) for r in synthetic_records(count))
+            return columns
+        columns, columns_s = measure(build_columns)
+
+        users = build_columns()
+        userids = [users.value("userid", i) for i in range(0, count, max(count // 1000, 1))]
+        users.find(userids[0])
+        start = time.perf_counter()
+        for userid in userids:
+            users.get(userid)
+        lookup = (time.perf_counter() - start) / len(userids)
+        del users
+
+        print(f"{count:>8} {dicts / 2 ** 20:>9.1f} {columns / 2 ** 20:>11.1f} {dicts / columns:>6.1f} "
+              f"{dicts_s:>8.2f} {columns_s:>10.2f} {lookup * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
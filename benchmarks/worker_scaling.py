@@ -0,0 +1,108 @@
+"""
+Throughput scaling of the multi-worker SSE server at 1/2/4/8 workers.
+
+For each worker count the script starts `src/main.py --transport sse
+--workers N`, drives it with several load-generator processes (so the
+client side is not the bottleneck) and prints calls/s per configuration.
+
+    uv run benchmarks/worker_scaling.py --clients 8 --sessions 10 --calls 50
+
+The default workload is `tools/list`, whose large JSON payload makes it a
+CPU-bound stand-in for JSON-heavy tool results.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from http_load import run_load
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def wait_for_port(host: str, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Server on {host}:{port} did not start")
+
+
+def client_process(url: str, sessions: int, calls: int, tool: str | None, arguments: dict, queue):
+    queue.put(asyncio.run(run_load(url, sessions, calls, tool, arguments)))
+
+
+def run_clients(url: str, clients: int, sessions: int, calls: int, tool: str | None, arguments: dict) -> dict:
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=client_process, args=(url, sessions, calls, tool, arguments, queue))
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for p in processes:
+        p.start()
+    results = [queue.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.join()
+    total_calls = sum(r["calls"] for r in results)
+    return {
+        "calls": total_calls,
+        "errors": sum(r["errors"] + r["failed_sessions"] for r in results),
+        "elapsed_s": round(elapsed, 3),
+        "calls_per_s": round(total_calls / elapsed, 1),
+        "latency_p95_ms": max(r["latency_p95_ms"] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts")
+    parser.add_argument("--clients", type=int, default=8, help="load generator processes")
+    parser.add_argument("--sessions", type=int, default=10, help="sessions per load generator")
+    parser.add_argument("--calls", type=int, default=50, help="calls per session")
+    parser.add_argument("--tool", default=None)
+    parser.add_argument("--arguments", default="{}")
+    args = parser.parse_args()
+
+    rows = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        server = subprocess.Popen(
+            [sys.executable, "main.py", "--transport", "sse", "--host", args.host,
+             "--port", str(args.port), "--workers", str(workers)],
+            cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(args.host, args.port)
+            result = run_clients(f"http://{args.host}:{args.port}/sse", args.clients, args.sessions,
+                                 args.calls, args.tool, json.loads(args.arguments))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+        rows.append({"workers": workers, **result})
+        print(json.dumps(rows[-1]), flush=True)
+
+    base = rows[0]["calls_per_s"]
+    print(f"\n{'workers':>8} {'calls/s':>10} {'speedup':>8} {'p95 ms':>8} {'errors':>7}")
+    for row in rows:
+        print(f"{row['workers']:>8} {row['calls_per_s']:>10} {row['calls_per_s'] / base:>8.2f} "
+              f"{row['latency_p95_ms']:>8} {row['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
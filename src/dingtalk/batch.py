@@ -0,0 +1,158 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+import mcp.types as types
+
+from dingtalk.dingtalk_server import raw_results
+
+def resolve_path(value: Any, path: list[str]) -> Any:
+    """
+    Walk `path` into a step result. Keys index dicts, integers index lists
+    and `*` maps the rest of the path over every element of a list.
+    """
+    for i, key in enumerate(path):
+        if key == "*":
+            return [resolve_path(item, path[i + 1:]) for item in value]
+        if isinstance(value, list):
+            value = value[int(key)]
+        elif isinstance(value, dict):
+            value = value[key]
+        else:
+            raise KeyError(key)
+    return value
+
+def find_refs(value: Any) -> set[str]:
+    """Return the ids of the steps referenced anywhere in `value`."""
+    if isinstance(value, dict):
+        if set(value) == {"$ref"}:
+            return {value["$ref"].split(".", 1)[0]}
+        return set().union(*(find_refs(v) for v in value.values()))
+    if isinstance(value, list):
+        return set().union(*(find_refs(v) for v in value))
+    return set()
+
+def substitute_refs(value: Any, results: dict[str, Any]) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"$ref"}:
+            step_id, _, path = value["$ref"].partition(".")
+            return resolve_path(results[step_id], path.split(".") if path else [])
+        return {k: substitute_refs(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [substitute_refs(v, results) for v in value]
+    return value
+
+def check_dependencies(deps: dict[str, set[str]]):
+    """Raise ValueError on references to unknown steps or cycles."""
+    for step_id, refs in deps.items():
+        for ref in refs - deps.keys():
+            raise ValueError(f"Step {step_id} references unknown step {ref}")
+
+    visiting, done = set(), set()
+
+    def visit(step_id: str):
+        if step_id in done:
+            return
+        if step_id in visiting:
+            raise ValueError(f"Steps form a cycle through {step_id}")
+        visiting.add(step_id)
+        for ref in deps[step_id]:
+            visit(ref)
+        visiting.discard(step_id)
+        done.add(step_id)
+
+    for step_id in deps:
+        visit(step_id)
+
+async def run_batch(calls: list[dict[str, Any]],
+                    call_tool: Callable[[str, dict[str, Any]], Awaitable[Any]],
+                    max_concurrency: int = 10) -> list[dict[str, Any]]:
+    """
+    Run several tool calls concurrently and collect their results.
+
+    Each call is `{"id": ..., "tool": ..., "arguments": {...}}`; `id` defaults
+    to the call's position. An argument value `{"$ref": "<id>.<path>"}` is
+    replaced by part of an earlier step's result, which makes the step wait
+    for that one. Independent steps run concurrently, at most
+    `max_concurrency` at a time; API calls still go through the tenant's
+    rate limiter.
+
+    A failing step doesn't stop the batch: its entry carries `error` instead
+    of `result`, and steps depending on it fail too.
+    """
+    steps = {str(call.get("id", i)): call for i, call in enumerate(calls)}
+    if len(steps) != len(calls):
+        raise ValueError("Step ids must be unique")
+    deps = {step_id: find_refs(call.get("arguments", {})) for step_id, call in steps.items()}
+    check_dependencies(deps)
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results: dict[str, Any] = {}
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run_step(step_id: str, call: dict[str, Any]) -> Any:
+        for ref in deps[step_id]:
+            try:
+                await tasks[ref]
+            except Exception:
+                raise Exception(f"Depends on failed step {ref}")
+        arguments = substitute_refs(call.get("arguments", {}), results)
+        async with semaphore:
+            raw_results.set(True)
+            results[step_id] = await call_tool(call["tool"], arguments)
+        return results[step_id]
+
+    for step_id, call in steps.items():
+        tasks[step_id] = asyncio.create_task(run_step(step_id, call))
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    output = []
+    for step_id, call in steps.items():
+        entry = {"id": step_id, "tool": call.get("tool")}
+        if (e := tasks[step_id].exception()) is not None:
+            entry["error"] = str(e)
+        else:
+            entry["result"] = tasks[step_id].result()
+        output.append(entry)
+    return output
+
+def list_tools() -> list[types.Tool]:
+    return [
+        types.Tool(
+            name="batch_call",
+            description="在一次请求中并发调用多个工具，返回每个调用的结果或错误。"
+                        "参数中可以使用 {\"$ref\": \"<步骤id>.<路径>\"} 引用之前步骤的结果，"
+                        "路径中的数字表示列表下标，* 表示对列表中的每一项取值，引用了其他步骤的调用会在被引用的步骤完成后执行。",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "calls": {
+                        "type": "array",
+                        "description": "要调用的工具列表。",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {
+                                    "type": "string",
+                                    "description": "步骤ID，用于引用该步骤的结果，默认为该调用在列表中的序号。",
+                                },
+                                "tool": {
+                                    "type": "string",
+                                    "description": "工具名称。",
+                                },
+                                "arguments": {
+                                    "type": "object",
+                                    "description": "工具参数。",
+                                },
+                            },
+                            "required": ["tool"],
+                        },
+                    },
+                    "max_concurrency": {
+                        "type": "number",
+                        "description": "最大并发调用数，默认为10。",
+                    },
+                },
+                "required": ["calls"],
+            },
+        )
+    ]
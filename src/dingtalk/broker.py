@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+import json as JSON
+import logging
+import os
+import time
+from typing import Any, Callable
+
+class TokenBroker:
+    """
+    Serves one access token and one rate-limit budget per tenant to several
+    worker processes over a local Unix socket.
+
+    `token_sources` maps a tenant name to the DingtalkServer that fetches its
+    token and owns its rate limiter.
+
+    The protocol is newline-delimited JSON. Each request carries an `id`, an
+    `op` and a `tenant`; the reply echoes the id with either the result fields
+    or `error`:
+
+        {"id": 1, "op": "token", "tenant": "default"}           -> {"id": 1, "access_token": "...", "expires": 1700000000.0}
+        {"id": 2, "op": "acquire", "tenant": "default", "n": 1} -> {"id": 2}
+    """
+
+    def __init__(self, path: str, token_sources: Callable[[str | None], Any]):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.token_sources = token_sources
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_connection, path=self.path)
+        self.logger.info(f"Token broker listening on {self.path}")
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self.handle_request(JSON.loads(line), writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def handle_request(self, request: dict[str, Any], writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        reply: dict[str, Any] = {"id": request.get("id")}
+        try:
+            source = self.token_sources(request.get("tenant"))
+            match request.get("op"):
+                case "token":
+                    reply["access_token"] = await source.get_access_token()
+                    reply["expires"] = source.token_expires
+                case "acquire":
+                    await source.rate_limiter.acquire(request.get("n", 1))
+                case op:
+                    raise ValueError(f"Unknown broker op: {op}")
+        except Exception as e:
+            self.logger.error(f"Broker request failed: {e}")
+            reply["error"] = str(e)
+
+        async with write_lock:
+            writer.write(JSON.dumps(reply).encode() + b"\n")
+            await writer.drain()
+
+class BrokerClient:
+    """
+    Worker-side connection to a TokenBroker.
+
+    Requests are multiplexed over one connection. The token is cached locally
+    until it expires, so only rate-limit permits cost a round trip per call.
+    """
+
+    def __init__(self, path: str, tenant: str = "default"):
+        self.path = path
+        self.tenant = tenant
+        self.access_token: str | None = None
+        self.token_expires = 0.0
+        self._ids = itertools.count()
+        self._pending: dict[int, asyncio.Future] = {}
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+            reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self._reader_task = asyncio.create_task(self._read_replies(reader))
+
+    async def _read_replies(self, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                reply = JSON.loads(line)
+                future = self._pending.pop(reply.pop("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Token broker connection closed"))
+            self._pending.clear()
+
+    async def request(self, op: str, **kwargs) -> dict[str, Any]:
+        await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(JSON.dumps({"id": request_id, "op": op, "tenant": self.tenant, **kwargs}).encode() + b"\n")
+        await self._writer.drain()
+        reply = await future
+        if "error" in reply:
+            raise Exception(f"Token broker error: {reply['error']}")
+        return reply
+
+    async def get_token(self) -> tuple[str, float]:
+        if self.access_token and time.time() < self.token_expires:
+            return self.access_token, self.token_expires
+        reply = await self.request("token")
+        self.access_token = reply["access_token"]
+        self.token_expires = reply["expires"]
+        return self.access_token, self.token_expires
+
+    async def acquire(self, n: int = 1):
+        await self.request("acquire", n=n)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
@@ -0,0 +1,65 @@
+import asyncio
+import re
+from typing import Any, AsyncIterator
+
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+
+USER_GET = "https://oapi.dingtalk.com/topapi/v2/user/get"
+
+def parse_userids(userids: list[str] | str) -> list[str]:
+    """
+    Unique userids in first-seen order. A string is split on commas and
+    whitespace, so a column pasted from a CSV file works as is.
+    """
+    if isinstance(userids, str):
+        userids = re.split(r"[\s,]+", userids)
+    return list(dict.fromkeys(str(u).strip() for u in userids if u is not None and str(u).strip()))
+
+async def stream_user_details(contacts, userids: list[str] | str, language: str = "zh_CN",
+                              concurrency: int = 10) -> AsyncIterator[dict[str, Any]]:
+    """
+    Yield the details of `userids` as they become available.
+
+    Ids are deduplicated. Those the tenant's mirror can answer come first,
+    without calling Dingtalk; the rest are fetched with topapi/v2/user/get
+    by `concurrency` workers, whose calls still go through the tenant's rate
+    limiter, and yielded in completion order. Each entry is
+    `{"userid", "source", "detail"}`, where source is "mirror" or "api", or
+    `{"userid", "error"}` for an id that couldn't be fetched; a failure
+    doesn't stop the others.
+    """
+    pending = []
+    for userid in parse_userids(userids):
+        detail = None
+        if contacts.mirror is not None and use_mirror.get():
+            detail = contacts.mirror.answer(USER_GET, {"userid": userid, "language": language})
+        if detail is not None:
+            yield {"userid": userid, "source": "mirror", "detail": detail}
+        else:
+            pending.append(userid)
+    if not pending:
+        return
+
+    queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+    ids = iter(pending)
+
+    async def worker():
+        raw_results.set(True)
+        use_mirror.set(False)
+        result_transforms.set(())
+        for userid in ids:
+            try:
+                entry = {"userid": userid, "source": "api", "detail": await contacts.get_user_detail(userid, language)}
+            except Exception as e:
+                entry = {"userid": userid, "error": str(e)}
+            await queue.put(entry)
+
+    # Workers run in their own tasks, so the context variables they set
+    # don't leak to the caller.
+    workers = [asyncio.create_task(worker()) for _ in range(min(max(int(concurrency), 1), len(pending)))]
+    try:
+        for _ in pending:
+            yield await queue.get()
+    finally:
+        for task in workers:
+            task.cancel()
@@ -5,11 +5,13 @@ from mcp import stdio_server
 from mcp.server import Server as MCPServer
 import mcp.types as types
 
-from dingtalk.dingtalk_server import DingtalkServer
+from dingtalk.bulk import parse_userids, stream_user_details
+from dingtalk.dingtalk_server import DingtalkServer, progress
+from dingtalk.planner import DirectoryPlanner
 
 class DingtalkContactsServer(DingtalkServer):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
 
     async def create_role_group(self, name: str) -> str:
         """
@@ -1044,6 +1046,21 @@ class DingtalkContactsServer(DingtalkServer):
         return await self.post_old(url, json=data)
 
 
+    async def list_department_users(self, dept_id: int, fields: list = None, max_age: float = None,
+                                    max_concurrency: int = 10) -> str:
+        """
+        获取部门的全部用户，自动选择调用次数最少的接口组合.
+
+        args:
+            dept_id (int): 部门ID，根部门传1。
+            fields (list, optional): 需要的用户字段，默认返回全部字段。
+            max_age (float, optional): 可接受的数据时效（秒），默认为本地镜像的有效期，传0表示必须获取最新数据。
+            max_concurrency (int, optional): 需要查询用户详情时同时查询的用户数，默认为10。
+        """
+        return self.render(await DirectoryPlanner(self).run(
+            int(dept_id), fields, float(max_age) if max_age is not None else None, int(max_concurrency)))
+
+
     async def get_department_user_simple(self, dept_id: int, cursor: int, size: int, order_field: str = None, contain_access_limit: bool = None, language: str = None) -> str:
         """
         获取部门用户基础信息.
@@ -1220,6 +1237,32 @@ class DingtalkContactsServer(DingtalkServer):
         return await self.post_old(url, json=data)
 
 
+    async def get_user_details_bulk(self, userids: list, language: str = "zh_CN", max_concurrency: int = 10) -> str:
+        """
+        批量查询用户详情.
+
+        args:
+            userids (list): 用户的userId列表，也可以是以逗号或换行分隔的字符串，重复的userId只查询一次。
+            language (str): 通讯录语言，默认为 "zh_CN"。
+            max_concurrency (int, optional): 同时查询的用户数，默认为10。
+        """
+        order = {userid: i for i, userid in enumerate(parse_userids(userids))}
+        report = progress.get()
+        entries = []
+        async for entry in stream_user_details(self, userids, language, int(max_concurrency)):
+            entries.append(entry)
+            if report is not None:
+                await report(len(entries), len(order))
+        entries.sort(key=lambda e: order[e["userid"]])
+        return self.render({
+            "count": len(entries),
+            "from_mirror": sum(e.get("source") == "mirror" for e in entries),
+            "fetched": sum(e.get("source") == "api" for e in entries),
+            "failed": sum("error" in e for e in entries),
+            "list": entries,
+        })
+
+
     async def get_user_by_mobile(self, mobile: str) -> str:
         """
         根据手机号查询用户.
@@ -3349,6 +3392,33 @@ class DingtalkContactsServer(DingtalkServer):
                     "required": ["dept_id", "cursor", "size"],
                 },
             ),
+            types.Tool(
+                name="list_department_users",
+                description="获取部门的全部用户，自动选择调用次数最少的方式：在可接受的数据时效内直接读取本地组织架构镜像，只需 userid 和姓名时分页调用获取部门用户基础信息接口，否则分页调用获取部门用户详情接口，或在镜像已缓存大部分用户时获取部门用户userid列表后只查询未缓存用户的详情。结果中的 plan 包含选择的方式、预估和实际调用次数。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "部门ID，根部门传1。",
+                        },
+                        "fields": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "需要的用户字段，如 [\"userid\", \"name\"]，默认返回全部字段。需要 manager_userid、role_list、leader_in_dept 等只在用户详情中返回的字段时会查询用户详情。",
+                        },
+                        "max_age": {
+                            "type": "number",
+                            "description": "可接受的数据时效（秒），默认为本地镜像的有效期；传0表示必须从钉钉接口获取最新数据。",
+                        },
+                        "max_concurrency": {
+                            "type": "number",
+                            "description": "需要查询用户详情时同时查询的用户数，默认为10。",
+                        },
+                    },
+                    "required": ["dept_id"],
+                },
+            ),
             types.Tool(
                 name="get_userid_by_unionid",
                 description="根据unionid获取用户的userid。",
@@ -3583,6 +3653,31 @@ class DingtalkContactsServer(DingtalkServer):
             )
             ,
 
+            types.Tool(
+                name="get_user_details_bulk",
+                description="批量查询用户详情，用于处理获取部门用户userid列表等接口返回的大量userId。重复的userId只查询一次，本地组织架构镜像中已有的用户直接返回，其余用户并发查询（仍受调用频率限制）。单个用户查询失败不影响其他用户，失败的用户在结果中带有 error。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "userids": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "用户的userId列表，也可以是以逗号或换行分隔的字符串。",
+                        },
+                        "language": {
+                            "type": "string",
+                            "description": "通讯录语言。可选参数，默认值为zh_CN（中文）。支持的值：zh_CN（中文）、en_US（英文）。",
+                        },
+                        "max_concurrency": {
+                            "type": "number",
+                            "description": "同时查询的用户数，默认为10。",
+                        },
+                    },
+                    "required": ["userids"],
+                },
+            )
+            ,
+
             types.Tool(
                 name="get_user_by_mobile",
                 description="根据手机号查询用户，获取用户的userId。",
@@ -4458,6 +4553,8 @@ async def serve():
                         result = await dingtalk_server.get_department_user_id_list(**arguments)
                 case 'get_department_user_list':
                         result = await dingtalk_server.get_department_user_list(**arguments)
+                case 'list_department_users':
+                        result = await dingtalk_server.list_department_users(**arguments)
                 case 'get_department_user_simple':
                         result = await dingtalk_server.get_department_user_simple(**arguments)
                 case 'get_employee_count':
@@ -4518,6 +4615,8 @@ async def serve():
                         result = await dingtalk_server.get_user_contact_info(**arguments)
                 case 'get_user_detail':
                         result = await dingtalk_server.get_user_detail(**arguments)
+                case 'get_user_details_bulk':
+                        result = await dingtalk_server.get_user_details_bulk(**arguments)
                 case 'get_user_detail_old':
                         result = await dingtalk_server.get_user_detail_old(**arguments)
                 case 'get_user_id_by_unionid_old':
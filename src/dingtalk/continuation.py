@@ -0,0 +1,110 @@
+import json as JSON
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable
+
+import mcp.types as types
+
+from dingtalk.shaping import find_items
+
+def _dumps(data: Any) -> str:
+    return JSON.dumps(data, ensure_ascii=False, indent=4)
+
+def _with_continuation(data: Any, handle: str | None, remaining: int) -> Any:
+    if handle is None:
+        return data
+    continuation = {"handle": handle, "remaining": remaining}
+    if isinstance(data, dict):
+        return {**data, "continuation": continuation}
+    return {"list": data, "continuation": continuation}
+
+class ContinuationStore:
+    """
+    Server-side buffer for the unreturned part of large results.
+
+    When a result is longer than the caller's budget, only the items that fit
+    are returned along with a handle; the rest stays here and is handed out by
+    fetch_continuation without calling Dingtalk again. Entries expire after
+    `ttl` seconds and at most `max_entries` are kept.
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[list, Callable[[list], Any], float]] = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.entries and (len(self.entries) > self.max_entries or next(iter(self.entries.values()))[2] < now):
+            self.entries.popitem(last=False)
+
+    def split(self, items: list, rebuild: Callable[[list], Any], max_chars: int, handle: str | None = None) -> Any:
+        """
+        Return the longest prefix of `items` whose rebuilt result fits in
+        `max_chars`, at least one item, buffering the remainder.
+        """
+        budget = max_chars - 100
+        count, size = 0, 0
+        for item in items:
+            size += len(_dumps(item)) + 10
+            if count and size > budget:
+                break
+            count += 1
+        while count > 1 and len(_dumps(rebuild(items[:count]))) > budget:
+            count -= 1
+
+        rest = items[count:]
+        if not rest:
+            self.entries.pop(handle, None)
+            return rebuild(items)
+        handle = handle or uuid.uuid4().hex
+        self.entries[handle] = (rest, rebuild, time.monotonic() + self.ttl)
+        self.entries.move_to_end(handle)
+        self._evict()
+        return _with_continuation(rebuild(items[:count]), handle, len(rest))
+
+    def make_chunker(self, max_chars: int) -> Callable[[Any], Any]:
+        """Build a result transform truncating results longer than `max_chars` at item boundaries."""
+        def chunk(data: Any) -> Any:
+            items, rebuild = find_items(data)
+            if items is None or len(_dumps(data)) <= max_chars:
+                return data
+            return self.split(items, rebuild, max_chars)
+        return chunk
+
+    def fetch(self, handle: str, max_output_chars: int = 20000) -> str:
+        self._evict()
+        if handle not in self.entries:
+            raise ValueError(f"Unknown or expired continuation handle: {handle}")
+        items, rebuild, _ = self.entries[handle]
+        return _dumps(self.split(items, rebuild, int(max_output_chars), handle))
+
+    def list_tools(self) -> list[types.Tool]:
+        return [
+            types.Tool(
+                name="fetch_continuation",
+                description="获取因超出 max_output_chars 而被截断的结果的后续部分，无需再次调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "handle": {
+                            "type": "string",
+                            "description": "被截断结果中 continuation.handle 的值。",
+                        },
+                        "max_output_chars": {
+                            "type": "number",
+                            "description": "本次返回结果的最大字符数，默认为20000。",
+                        },
+                    },
+                    "required": ["handle"],
+                },
+            )
+        ]
+
+TOOL_ARGUMENTS = {
+    "max_output_chars": {
+        "type": "number",
+        "description": "结果的最大字符数。超出时在列表项边界截断，剩余部分可通过 fetch_continuation 工具和返回的 continuation.handle 获取。",
+    },
+}
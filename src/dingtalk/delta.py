@@ -0,0 +1,110 @@
+import json as JSON
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable
+
+# Tools that agents poll repeatedly; they advertise the `since` argument.
+POLLING_TOOLS = {
+    "get_message_send_progress",
+    "get_work_notification_send_result",
+    "query_robot_message_read_list",
+    "batch_query_group_members",
+    "query_group_message_read_status",
+    "batch_query_robot_message_read_status",
+}
+
+ID_KEYS = ("userid", "userId", "user_id", "unionId", "unionid", "dept_id", "deptId", "id")
+
+def _item_key(item: dict) -> Any:
+    for key in ID_KEYS:
+        if key in item:
+            return item[key]
+    return JSON.dumps(item, sort_keys=True, ensure_ascii=False)
+
+def _diff_list(old: list, new: list) -> dict[str, Any] | None:
+    if all(isinstance(i, dict) for i in old + new):
+        old_items = {_item_key(i): i for i in old}
+        new_items = {_item_key(i): i for i in new}
+        result = {
+            "added": [i for k, i in new_items.items() if k not in old_items],
+            "removed": [k for k in old_items if k not in new_items],
+            "changed": [i for k, i in new_items.items() if k in old_items and old_items[k] != i],
+        }
+    else:
+        old_keys = {JSON.dumps(i, sort_keys=True, ensure_ascii=False): i for i in old}
+        new_keys = {JSON.dumps(i, sort_keys=True, ensure_ascii=False): i for i in new}
+        result = {
+            "added": [i for k, i in new_keys.items() if k not in old_keys],
+            "removed": [i for k, i in old_keys.items() if k not in new_keys],
+        }
+    result = {k: v for k, v in result.items() if v}
+    return result or None
+
+def diff(old: Any, new: Any) -> Any:
+    """
+    Structural difference between two results, None when they are equal.
+
+    Dicts diff per key, lists report added/removed (and changed, for items
+    identified by an id field) items, other values report old and new.
+    """
+    if old == new:
+        return None
+    if isinstance(old, dict) and isinstance(new, dict):
+        result = {}
+        for key in [*old, *(k for k in new if k not in old)]:
+            if key not in new:
+                result[key] = {"old": old[key]}
+            elif key not in old:
+                result[key] = {"new": new[key]}
+            elif (d := diff(old[key], new[key])) is not None:
+                result[key] = d
+        return result
+    if isinstance(old, list) and isinstance(new, list):
+        return _diff_list(old, new)
+    return {"old": old, "new": new}
+
+class DeltaStore:
+    """
+    Last result seen per `since` handle, so repeated polls can return only
+    what changed.
+
+    Passing an empty `since` opens a handle and returns the full result
+    together with `delta_handle`. Later calls with that handle return
+    `{"delta_handle": ..., "changed": bool, "diff": ...}` computed against
+    the previous poll. Handles expire after `ttl` seconds without a poll.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self.entries and (len(self.entries) > self.max_entries or next(iter(self.entries.values()))[1] < now):
+            self.entries.popitem(last=False)
+
+    def make_differ(self, since: str) -> Callable[[Any], Any]:
+        self._evict()
+        if since and since not in self.entries:
+            raise ValueError(f"Unknown or expired since handle: {since}")
+
+        def differ(data: Any) -> Any:
+            handle = since or uuid.uuid4().hex
+            previous = self.entries.pop(handle, None)
+            self.entries[handle] = (data, time.monotonic() + self.ttl)
+            self._evict()
+            if previous is None:
+                return {"delta_handle": handle, "result": data}
+            changes = diff(previous[0], data)
+            return {"delta_handle": handle, "changed": changes is not None, "diff": changes}
+
+        return differ
+
+TOOL_ARGUMENTS = {
+    "since": {
+        "type": "string",
+        "description": "增量返回。首次传空字符串，返回完整结果和 delta_handle；之后传入 delta_handle，只返回相对上次结果新增、删除或变化的内容。",
+    },
+}
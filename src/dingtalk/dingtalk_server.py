@@ -1,13 +1,46 @@
+import asyncio
 import json as JSON
 import logging
 import os
 import time
+from contextvars import ContextVar
 from dotenv import load_dotenv
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Optional
 import aiohttp
 
+from dingtalk.broker import BrokerClient
+from dingtalk.pagination import PageCache
+from dingtalk.rate_limiter import RateLimiter, get_rate_limiter
+
+# Set by server-side callers (e.g. batch steps) that consume a tool's result
+# themselves: the request helpers then return the parsed data instead of
+# JSON text, so the result is serialized once by the caller.
+raw_results: ContextVar[bool] = ContextVar("raw_results", default=False)
+
+# Transforms applied to a tool's parsed result before it is serialized, such
+# as field projection requested by the caller.
+result_transforms: ContextVar[tuple] = ContextVar("result_transforms", default=())
+
+# Set by the MCP layer when the client asked for progress notifications;
+# long-running tools await it with the work done so far and the total.
+progress: ContextVar[Callable[[float, float | None], Awaitable[None]] | None] = ContextVar("progress", default=None)
+
+# Cleared by callers that must see live data, such as the mirror crawler
+# itself, so reads aren't answered from the local mirror.
+use_mirror: ContextVar[bool] = ContextVar("use_mirror", default=True)
+
+class DingtalkError(Exception):
+    """An error answer of the Dingtalk API, with its errcode for callers handling specific errors."""
+
+    def __init__(self, message: str, errcode: int | None = None, errmsg: str | None = None):
+        super().__init__(message)
+        self.errcode = errcode
+        self.errmsg = errmsg
+
 class DingtalkServer:
-    def __init__(self):
+    def __init__(self, tenant: str = "default", app_key: str | None = None, app_secret: str | None = None,
+                 qps: float | None = None, max_connections: int | None = None,
+                 rate_limiter: RateLimiter | None = None):
         logging.basicConfig(
             level=logging.INFO,
             format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -16,24 +49,41 @@ class DingtalkServer:
         self.logger = logging.getLogger(__name__)
 
         load_dotenv()
-        self.app_key = os.getenv("DD_APP_KEY")
-        self.app_secret = os.getenv("DD_APP_SECRET")
+        self.tenant = tenant
+        # Other tenants never fall back to the default app's credentials.
+        self.app_key = app_key or (os.getenv("DD_APP_KEY") if tenant == "default" else None)
+        self.app_secret = app_secret or (os.getenv("DD_APP_SECRET") if tenant == "default" else None)
+        self.qps = qps if qps is not None else float(os.getenv("DD_QPS", "20"))
+        self.max_connections = max_connections or int(os.getenv("DD_MAX_CONNECTIONS", "100"))
         self.access_token: Optional[str] = None
         self.token_expires = 0
         self.v2_access_token: Optional[str] = None
         self.v2_token_expires = 0
         self.session = None
+        self._token_lock = asyncio.Lock()
+        # In multi-worker mode the broker hands out both the token and the
+        # rate-limit permits, so all workers stay within one budget.
+        broker_path = os.getenv("DD_TOKEN_BROKER")
+        self.token_broker = BrokerClient(broker_path, tenant) if broker_path else None
+        self.rate_limiter = self.token_broker or rate_limiter or get_rate_limiter(self.app_key or "", self.qps)
+        # Local copy of the organization (dingtalk.mirror.store.MirrorStore)
+        # that answers directory reads while it is fresh.
+        self.mirror = None
+        # Small pages of offset-paged endpoints are cut from full-size ones.
+        self.pages = PageCache() if os.getenv("DD_PAGE_CACHE", "1") != "0" else None
         self.logger.info("DingtalkServer initialized.")
 
     async def ensure_session(self):
         if self.session is None:
             self.logger.info("Session created.")
-            self.session = aiohttp.ClientSession()
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
 
     async def cleanup(self):
         if self.session:
             await self.session.close()
             self.logger.info("Session closed.")
+        if self.token_broker:
+            await self.token_broker.close()
 
     async def get_access_token(self):
         self.logger.debug("Getting access token.")
@@ -41,8 +91,19 @@ class DingtalkServer:
         if self.access_token and time.time() < self.token_expires:
             self.logger.debug("Access token is still valid.")
             return self.access_token
-        
+
+        # Concurrent callers share a single refresh instead of each requesting a token.
+        async with self._token_lock:
+            if self.access_token and time.time() < self.token_expires:
+                return self.access_token
+            return await self._refresh_access_token()
+
+    async def _refresh_access_token(self):
         await self.ensure_session()
+        if self.token_broker:
+            self.access_token, self.token_expires = await self.token_broker.get_token()
+            return self.access_token
+
         app_key = self.app_key
         app_secret = self.app_secret
 
@@ -67,8 +128,16 @@ class DingtalkServer:
                 self.logger.error(f"Failed to get access token: {data}")
                 raise Exception("Failed to get access token")
 
+    def render(self, data: Any) -> Any:
+        for transform in result_transforms.get():
+            data = transform(data)
+        if raw_results.get():
+            return data
+        return JSON.dumps(data, ensure_ascii=False, indent=4)
+
     async def get_old(self, url:str, params:dict[str, Any] | None = None) -> str:
         access_token = await self.get_access_token()
+        await self.rate_limiter.acquire()
         p = {"access_token": access_token}
         if params is not None:
             p.update(params)
@@ -76,13 +145,19 @@ class DingtalkServer:
         async with self.session.get(url, params=p) as response:
             data = await response.json()
             if data.get("errcode") == 0:
-                return JSON.dumps(data.get("result"), ensure_ascii=False, indent=4)
+                return self.render(data.get("result"))
             else:
                 self.logger.error(f"GET request failed: {data}")
-                raise Exception("GET request failed")
+                raise DingtalkError("GET request failed", data.get("errcode"), data.get("errmsg"))
 
     async def get_new(self, url:str, params:dict[str, Any] | None = None) -> str:
+        if self.mirror is not None and use_mirror.get():
+            result = self.mirror.answer(url, params)
+            if result is not None:
+                return self.render(result)
+
         access_token = await self.get_access_token()
+        await self.rate_limiter.acquire()
         p = {"access_token": access_token}
         if params is not None:
             p.update(params)
@@ -93,13 +168,29 @@ class DingtalkServer:
                 raise Exception(f"GET request failed with status code: {response.status}")
 
             data = await response.json()
-            return JSON.dumps(data, ensure_ascii=False, indent=4)
+            if self.mirror is not None:
+                self.mirror.record(url, params, data)
+            return self.render(data)
 
 
     async def post_old(self, url:str, 
                    params:dict[str, Any] | None = None, 
                    json: Any | None = None) -> str:
+        if self.mirror is not None and use_mirror.get():
+            result = self.mirror.answer(url, json)
+            if result is not None:
+                return self.render(result)
+
+        # Callers that need live data bypass the page cache like the mirror.
+        if self.pages is not None and use_mirror.get() and self.pages.handles(url, json):
+            result = await self.pages.fetch(url, json, lambda payload: self._post_old(url, params, payload))
+        else:
+            result = await self._post_old(url, params, json)
+        return self.render(result)
+
+    async def _post_old(self, url: str, params: dict[str, Any] | None, json: Any | None) -> Any:
         access_token = await self.get_access_token()
+        await self.rate_limiter.acquire()
 
         p = {"access_token": access_token}
         if params is not None:
@@ -109,15 +200,27 @@ class DingtalkServer:
         async with self.session.post(url, params=p, json=json) as response:
             data = await response.json()
             if data.get("errcode") == 0:
-                return JSON.dumps(data.get("result"), ensure_ascii=False, indent=4)
+                # A few endpoints, such as extcontact/list, return "results"
+                result = data.get("result", data.get("results"))
+                if self.mirror is not None:
+                    self.mirror.record(url, json, result)
+                if self.pages is not None:
+                    self.pages.written(url)
+                return result
             else:
                 self.logger.error(f"POST request failed: {data}")
-                raise Exception(f"POST request failed: {str(data)}")
-            
+                raise DingtalkError(f"POST request failed: {str(data)}", data.get("errcode"), data.get("errmsg"))
+
     async def post_new(self, url:str,
                        params:dict[str, Any] | None = None,
                        json: Any | None = None) -> str: 
+        if self.mirror is not None and use_mirror.get():
+            result = self.mirror.answer(url, json)
+            if result is not None:
+                return self.render(result)
+
         access_token = await self.get_access_token()
+        await self.rate_limiter.acquire()
 
         self.session.headers["x-acs-dingtalk-access-token"] = access_token
         self.session.headers["Content-Type"] = "application/json"
@@ -129,4 +232,4 @@ class DingtalkServer:
                 raise Exception(f"POST request failed with status code: {response.status}, {response.text}")
 
             data = await response.json()
-            return JSON.dumps(data, ensure_ascii=False, indent=4)
\ No newline at end of file
+            return self.render(data)
\ No newline at end of file
@@ -7,8 +7,8 @@ import mcp.types as types
 from dingtalk.dingtalk_server import DingtalkServer
 
 class DingtalkIMServer(DingtalkServer):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
 
     async def add_group_members_old(self, open_conversation_id: str, user_ids: str) -> str:
         """
@@ -0,0 +1,170 @@
+import json as JSON
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterable
+
+# Sentinel for missing integers and missing strings.
+MISSING = -(2 ** 63)
+NONE = -1
+
+# Fields of topapi/v2/user/list records, by how they are stored. Mostly
+# distinct strings are packed into one buffer, strings shared by many users
+# are interned, flags take a byte.
+PACKED = ["userid", "unionid", "name", "mobile", "avatar", "job_number", "email", "org_email", "telephone",
+          "remark", "nickname"]
+INTERNED = ["title", "work_place", "state_code", "manager_userid"]
+FLAGS = ["active", "admin", "boss", "leader", "hide_mobile", "senior", "real_authed", "exclusive_account"]
+INTEGERS = ["hired_date"]
+KNOWN = set(PACKED + INTERNED + FLAGS + INTEGERS + ["dept_id_list"])
+
+class PackedStrings:
+    """Strings stored back to back as UTF-8 in one buffer, addressed by offset."""
+
+    def __init__(self):
+        self.data = bytearray()
+        # String i spans data[offsets[i]:offsets[i + 1]].
+        self.offsets = array("I", [0])
+        self.missing = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.missing)
+
+    def append(self, value: str | None):
+        if value is not None:
+            self.data += value.encode()
+        self.offsets.append(len(self.data))
+        self.missing.append(value is None)
+
+    def __getitem__(self, i: int) -> str | None:
+        if self.missing[i]:
+            return None
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode()
+
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets) + len(self.missing)
+
+class InternedStrings:
+    """Strings repeated across rows, stored once and referenced by code."""
+
+    def __init__(self):
+        self.values: list[str] = []
+        self.index: dict[str, int] = {}
+        self.codes = array("i")
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def code(self, value: str) -> int:
+        if value not in self.index:
+            self.index[value] = len(self.values)
+            self.values.append(value)
+        return self.index[value]
+
+    def append(self, value: str | None):
+        self.codes.append(NONE if value is None else self.code(value))
+
+    def __getitem__(self, i: int) -> str | None:
+        code = self.codes[i]
+        return None if code == NONE else self.values[code]
+
+    def nbytes(self) -> int:
+        return self.codes.itemsize * len(self.codes) + sum(len(v.encode()) for v in self.values)
+
+class UserColumns:
+    """
+    Compact column store for mirrored user records.
+
+    Each known field is a column (packed strings, interned strings, byte
+    flags or 64-bit integers), department memberships are a CSR pair of
+    integer arrays and any other fields are kept as compact JSON. Users
+    take about an eighth of the memory of the same records as dicts (see
+    benchmarks/user_memory.py); rows are rebuilt as dicts on access.
+    """
+
+    def __init__(self):
+        self.packed = {f: PackedStrings() for f in PACKED}
+        self.interned = {f: InternedStrings() for f in INTERNED}
+        # 0 false, 1 true, 2 missing
+        self.flags = {f: bytearray() for f in FLAGS}
+        self.integers = {f: array("q") for f in INTEGERS}
+        self.extra = PackedStrings()
+        self.dept_offsets = array("q", [0])
+        self.dept_ids = array("q")
+        self._sorted: array | None = None
+
+    def __len__(self) -> int:
+        return len(self.extra)
+
+    def append(self, record: dict[str, Any], dept_ids: Iterable[int] | None = None):
+        """Add a user; `dept_ids` defaults to the record's dept_id_list."""
+        for f, column in self.packed.items():
+            value = record.get(f)
+            column.append(None if value is None else str(value))
+        for f, column in self.interned.items():
+            value = record.get(f)
+            column.append(None if value is None else str(value))
+        for f, column in self.flags.items():
+            value = record.get(f)
+            column.append(2 if value is None else int(bool(value)))
+        for f, column in self.integers.items():
+            value = record.get(f)
+            column.append(int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else MISSING)
+        rest = {k: v for k, v in record.items() if k not in KNOWN}
+        self.extra.append(JSON.dumps(rest, ensure_ascii=False, separators=(",", ":")) if rest else None)
+        self.dept_ids.extend(record.get("dept_id_list") or [] if dept_ids is None else dept_ids)
+        self.dept_offsets.append(len(self.dept_ids))
+        self._sorted = None
+
+    def extend(self, rows: Iterable[tuple[dict[str, Any], Iterable[int] | None]]):
+        for record, dept_ids in rows:
+            self.append(record, dept_ids)
+
+    def departments(self, i: int) -> array:
+        return self.dept_ids[self.dept_offsets[i]:self.dept_offsets[i + 1]]
+
+    def value(self, field: str, i: int) -> Any:
+        if field in self.packed:
+            return self.packed[field][i]
+        if field in self.interned:
+            return self.interned[field][i]
+        if field in self.flags:
+            flag = self.flags[field][i]
+            return None if flag == 2 else bool(flag)
+        if field in self.integers:
+            value = self.integers[field][i]
+            return None if value == MISSING else value
+        return self.row(i).get(field)
+
+    def row(self, i: int) -> dict[str, Any]:
+        record = {}
+        for f in PACKED + INTERNED + FLAGS + INTEGERS:
+            value = self.value(f, i)
+            if value is not None:
+                record[f] = value
+        record["dept_id_list"] = list(self.departments(i))
+        extra = self.extra[i]
+        if extra is not None:
+            record.update(JSON.loads(extra))
+        return record
+
+    def find(self, userid: str) -> int | None:
+        """Row of `userid`, by binary search over rows sorted by userid."""
+        if self._sorted is None:
+            userids = self.packed["userid"]
+            self._sorted = array("l", sorted(range(len(self)), key=lambda i: userids[i] or ""))
+        userids = self.packed["userid"]
+        j = bisect_left(self._sorted, userid, key=lambda i: userids[i] or "")
+        if j < len(self._sorted) and userids[self._sorted[j]] == userid:
+            return self._sorted[j]
+        return None
+
+    def get(self, userid: str) -> dict[str, Any] | None:
+        i = self.find(userid)
+        return None if i is None else self.row(i)
+
+    def nbytes(self) -> int:
+        """Approximate size of the column data."""
+        return (sum(c.nbytes() for c in self.packed.values()) + sum(c.nbytes() for c in self.interned.values())
+                + sum(len(c) for c in self.flags.values())
+                + sum(c.itemsize * len(c) for c in self.integers.values()) + self.extra.nbytes()
+                + self.dept_offsets.itemsize * len(self.dept_offsets) + self.dept_ids.itemsize * len(self.dept_ids))
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from typing import Any
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+from dingtalk.mirror.store import OAPI, MirrorStore
+from dingtalk.pagination import max_page_size
+
+CHECKPOINT_KEY = "crawl_checkpoint"
+
+USER_PAGE = max_page_size(f"{OAPI}/topapi/v2/user/list")
+
+class Crawler:
+    """
+    Breadth-first copy of the organization under a department into a
+    MirrorStore.
+
+    Up to `concurrency` departments are crawled at once, each fetching its
+    sub-departments and then its member pages; API calls still go through
+    the tenant's rate limiter. Departments still to crawl are checkpointed
+    in the store every `checkpoint_interval` seconds and when the crawl
+    stops, so an interrupted crawl resumes where it left off.
+    """
+
+    def __init__(self, contacts: DingtalkContactsServer, store: MirrorStore, concurrency: int = 8,
+                 page_size: int = USER_PAGE, checkpoint_interval: float = 5):
+        self.logger = logging.getLogger(__name__)
+        self.contacts = contacts
+        self.store = store
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.checkpoint_interval = checkpoint_interval
+        self.root = 1
+        self.started = 0.0
+        self.resumed = False
+        # Departments queued or in flight, in discovery order.
+        self.pending: dict[int, None] = {}
+        self.departments = 0
+        self.memberships = 0
+        self.calls = 0
+        self.clock_started = 0.0
+        self.last_checkpoint = 0.0
+
+    def report(self) -> dict[str, Any]:
+        """Progress and throughput of the current or last run."""
+        elapsed = time.monotonic() - self.clock_started if self.clock_started else 0
+        return {
+            "root": self.root,
+            "resumed": self.resumed,
+            "departments": self.departments,
+            "memberships": self.memberships,
+            "calls": self.calls,
+            "pending": len(self.pending),
+            "seconds": round(elapsed, 3),
+            "departments_per_second": round(self.departments / elapsed, 1) if elapsed else 0,
+            "users_per_second": round(self.memberships / elapsed, 1) if elapsed else 0,
+            "calls_per_second": round(self.calls / elapsed, 1) if elapsed else 0,
+        }
+
+    def checkpoint(self):
+        self.store.set_meta(CHECKPOINT_KEY, {
+            "root": self.root,
+            "started": self.started,
+            "pending": list(self.pending),
+            "departments": self.departments,
+            "memberships": self.memberships,
+            "calls": self.calls,
+        })
+        self.last_checkpoint = time.monotonic()
+
+    async def run(self, root: int = 1, resume: bool = True) -> dict[str, Any]:
+        """
+        Crawl the organization under `root`, continuing an interrupted crawl
+        of the same root when `resume` is set.
+
+        Departments and users not seen during a full crawl from the root
+        department are dropped from the mirror afterwards.
+        """
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            return await self._run(root, resume)
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+
+    async def _run(self, root: int, resume: bool) -> dict[str, Any]:
+        self.root = root
+        self.clock_started = time.monotonic()
+        checkpoint = self.store.get_meta(CHECKPOINT_KEY)
+        self.resumed = bool(resume and checkpoint and checkpoint["root"] == root and checkpoint["pending"])
+        if self.resumed:
+            self.started = checkpoint["started"]
+            self.pending = dict.fromkeys(checkpoint["pending"])
+            self.departments = checkpoint["departments"]
+            self.memberships = checkpoint["memberships"]
+            self.calls = checkpoint["calls"]
+            self.logger.info(f"Resuming crawl of department {root}, {len(self.pending)} departments pending.")
+        else:
+            self.started = time.time()
+            self.pending = {root: None}
+            self.departments = self.memberships = 0
+            self.calls = 1
+            self.store.save_departments([await self.contacts.get_department_detail(root)])
+
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for dept_id in self.pending:
+            queue.put_nowait(dept_id)
+        self.checkpoint()
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        join = asyncio.create_task(queue.join())
+        try:
+            # A failing worker stops the crawl instead of leaving join() waiting.
+            done, _ = await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not join:
+                    task.result()
+        finally:
+            join.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(join, *workers, return_exceptions=True)
+            self.checkpoint()
+
+        self.store.set_meta(CHECKPOINT_KEY, None)
+        if root == 1:
+            self.store.prune(self.started)
+            self.store.set_meta("last_full_crawl", self.started)
+        report = self.report()
+        self.logger.info(f"Crawl of department {root} finished: {report}")
+        return report
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            dept_id = await queue.get()
+            await self._crawl_department(dept_id, queue)
+            queue.task_done()
+
+    async def _crawl_department(self, dept_id: int, queue: asyncio.Queue):
+        self.calls += 1
+        subs = await self.contacts.get_department_list_old(dept_id=dept_id) or []
+        self.store.save_sub_departments(dept_id, subs)
+        for d in subs:
+            if d["dept_id"] not in self.pending:
+                self.pending[d["dept_id"]] = None
+                queue.put_nowait(d["dept_id"])
+
+        members, cursor = [], 0
+        while True:
+            self.calls += 1
+            page = await self.contacts.get_department_user_details(dept_id, cursor, self.page_size)
+            members.extend(page.get("list", []))
+            if not page.get("has_more"):
+                break
+            cursor = page["next_cursor"]
+        self.store.save_department_users(dept_id, members)
+        self.store.mark_crawled(dept_id)
+
+        # Children are pending before their parent is done, so a checkpoint
+        # never loses a department.
+        del self.pending[dept_id]
+        self.departments += 1
+        self.memberships += len(members)
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+            self.logger.info(f"Crawl progress: {self.report()}")
+
+async def crawl(contacts: DingtalkContactsServer, store: MirrorStore, root: int = 1,
+                page_size: int = USER_PAGE, concurrency: int = 8) -> dict[str, Any]:
+    return await Crawler(contacts, store, concurrency, page_size).run(root)
@@ -0,0 +1,287 @@
+import csv
+import json as JSON
+import logging
+import os
+import time
+from typing import Any, AsyncIterator
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.store import OAPI, MirrorStore
+from dingtalk.pagination import max_page_size
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ["jsonl", "csv", "parquet"]
+ENTITIES = ["departments", "users", "roles", "role_members", "external_contacts"]
+MANIFEST = "manifest.json"
+
+# Rows read from the mirror, and external contacts requested, at a time.
+BATCH = 1000
+EXTCONTACT_PAGE = max_page_size(f"{OAPI}/topapi/extcontact/list")
+
+# Columns of the CSV and Parquet files and their types; JSONL files keep
+# the whole records. "json" columns hold lists and objects as JSON text.
+COLUMNS = {
+    "departments": {"dept_id": "int", "parent_id": "int", "name": "str", "order": "int",
+                    "create_dept_group": "bool", "auto_add_user": "bool", "ext": "str"},
+    "users": {"userid": "str", "unionid": "str", "name": "str", "mobile": "str", "job_number": "str",
+              "title": "str", "email": "str", "org_email": "str", "work_place": "str",
+              "manager_userid": "str", "hired_date": "int", "active": "bool", "admin": "bool",
+              "boss": "bool", "leader": "bool", "dept_id_list": "json"},
+    "roles": {"id": "int", "name": "str", "groupId": "int", "groupName": "str"},
+    "role_members": {"role_id": "int", "userid": "str", "name": "str", "manageScopes": "json"},
+    "external_contacts": {"userid": "str", "name": "str", "mobile": "str", "state_code": "str",
+                          "company_name": "str", "title": "str", "follower_user_id": "str",
+                          "label_ids": "json", "share_dept_ids": "json", "share_user_ids": "json",
+                          "address": "str", "remark": "str"},
+}
+
+def export_dir(store: MirrorStore, name: str) -> str:
+    """Directory of export `name`, next to the mirror's database."""
+    if store.path == ":memory:":
+        raise ValueError("Exports need a mirror stored on disk")
+    if not name or os.path.basename(name) != name or name in (".", ".."):
+        raise ValueError(f"Invalid export name: {name}")
+    return os.path.join(f"{store.path}.exports", name)
+
+def _cell(value: Any, kind: str) -> Any:
+    if value is None:
+        return None
+    if kind == "json":
+        return JSON.dumps(value, ensure_ascii=False)
+    if kind == "int":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    if kind == "bool":
+        return bool(value)
+    return value if isinstance(value, str) else JSON.dumps(value, ensure_ascii=False)
+
+class _JsonlPart:
+    def __init__(self, path: str, columns: dict[str, str]):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows: list[dict[str, Any]]):
+        self.file.writelines(JSON.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class _CsvPart:
+    def __init__(self, path: str, columns: dict[str, str]):
+        self.columns = columns
+        # utf-8-sig so that spreadsheet programs detect the encoding
+        self.file = open(path, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: list[dict[str, Any]]):
+        self.writer.writerows([_cell(row.get(c), kind) for c, kind in self.columns.items()] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class _ParquetPart:
+    TYPES = {"int": "int64", "bool": "bool_", "str": "string", "json": "string"}
+
+    def __init__(self, path: str, columns: dict[str, str]):
+        if pyarrow is None:
+            raise Exception("Parquet export requires pyarrow, install it with `uv pip install pyarrow`")
+        self.columns = columns
+        self.schema = pyarrow.schema([(c, getattr(pyarrow, self.TYPES[kind])()) for c, kind in columns.items()])
+        self.writer = parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows: list[dict[str, Any]]):
+        data = {c: [_cell(row.get(c), kind) for row in rows] for c, kind in self.columns.items()}
+        self.writer.write_table(pyarrow.Table.from_pydict(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+PARTS = {"jsonl": _JsonlPart, "csv": _CsvPart, "parquet": _ParquetPart}
+
+class Exporter:
+    """
+    Streams mirrored departments, users and roles, and external contacts
+    from the live API, to files in a directory.
+
+    Rows are read in batches, by key from the mirror and by page from the
+    API, and written straight out, so memory stays bounded whatever the
+    organization's size. Each entity is split into files of at most
+    `rows_per_file` rows, written under a temporary name and renamed once
+    complete. The manifest in the directory records the finished files and
+    the key of the last row in them; a run over the same directory resumes
+    after that row, rewriting only the file that was being written.
+    """
+
+    def __init__(self, contacts: DingtalkContactsServer, store: MirrorStore, roles: RoleIndex, directory: str,
+                 format: str = "jsonl", rows_per_file: int = 100000):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown export format {format}, expected one of {', '.join(FORMATS)}")
+        if format == "parquet" and pyarrow is None:
+            raise Exception("Parquet export requires pyarrow, install it with `uv pip install pyarrow`")
+        self.logger = logging.getLogger(__name__)
+        self.contacts = contacts
+        self.store = store
+        self.roles = roles
+        self.directory = directory
+        self.format = format
+        self.rows_per_file = max(int(rows_per_file), 1)
+        self.manifest: dict[str, Any] = {}
+        self.entity: str | None = None
+        self.rows = 0
+        self.resumed = False
+        self.totals: dict[str, int] = {}
+        self.clock_started = 0.0
+
+    def report(self) -> dict[str, Any]:
+        """Progress of the current or last run."""
+        elapsed = time.monotonic() - self.clock_started if self.clock_started else 0
+        return {
+            "directory": self.directory,
+            "format": self.format,
+            "resumed": self.resumed,
+            "current": self.entity,
+            "entities": {e: {**{k: v for k, v in state.items() if k != "after"}, "total": self.totals.get(e)}
+                         for e, state in self.manifest.get("entities", {}).items()},
+            "rows": self.rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed else 0,
+        }
+
+    def _save_manifest(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            JSON.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    def _load_manifest(self, entities: list[str], resume: bool):
+        path = os.path.join(self.directory, MANIFEST)
+        manifest = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                manifest = JSON.load(f)
+            if not resume:
+                # Starting over: drop the files of the previous export.
+                for state in manifest["entities"].values():
+                    for name in state["files"]:
+                        if os.path.exists(os.path.join(self.directory, name)):
+                            os.remove(os.path.join(self.directory, name))
+                manifest = None
+            elif manifest["format"] != self.format:
+                raise ValueError(f"{self.directory} holds a {manifest['format']} export, not {self.format}")
+        self.resumed = manifest is not None
+        self.manifest = manifest or {"format": self.format, "started": time.time(), "finished": None, "entities": {}}
+        self.manifest["rows_per_file"] = self.rows_per_file
+        for entity in entities:
+            self.manifest["entities"].setdefault(entity, {"done": False, "rows": 0, "files": [], "after": None})
+
+    async def run(self, entities: list[str] | None = None, resume: bool = True) -> dict[str, Any]:
+        """Export `entities` (default all), continuing an interrupted export into the same directory."""
+        entities = entities or ENTITIES
+        unknown = [e for e in entities if e not in ENTITIES]
+        if unknown:
+            raise ValueError(f"Unknown export entities: {', '.join(unknown)}")
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_manifest(entities, resume)
+        self.totals = {
+            "departments": self.store.department_version()[0],
+            "users": self.store.member_count(),
+            "roles": len(self.roles.roles),
+            "role_members": sum(len(m) for m in self.roles.members.values()),
+        }
+        self.clock_started = time.monotonic()
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            for entity in entities:
+                if not self.manifest["entities"][entity]["done"]:
+                    self.entity = entity
+                    await self._export(entity)
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+        self.entity = None
+        self.manifest["finished"] = time.time()
+        self._save_manifest()
+        report = self.report()
+        self.logger.info(f"Export finished: {report}")
+        return report
+
+    async def _export(self, entity: str):
+        state = self.manifest["entities"][entity]
+        columns = COLUMNS[entity]
+        part, path, count, batch, last = None, "", 0, [], state["after"]
+
+        def finish_file():
+            part.close()
+            os.replace(f"{path}.partial", path)
+            state["files"].append(os.path.basename(path))
+            state["rows"] += count
+            state["after"] = last
+            self._save_manifest()
+
+        try:
+            async for key, row in self._rows(entity, state["after"]):
+                if part is None:
+                    path = os.path.join(self.directory, f"{entity}-{len(state['files']) + 1:05d}.{self.format}")
+                    part, count = PARTS[self.format](f"{path}.partial", columns), 0
+                batch.append(row)
+                count, last = count + 1, key
+                self.rows += 1
+                if len(batch) >= BATCH or count >= self.rows_per_file:
+                    part.write(batch)
+                    batch = []
+                if count >= self.rows_per_file:
+                    finish_file()
+                    part = None
+        except BaseException:
+            # The unfinished file is left as .partial and rewritten on resume.
+            if part is not None:
+                part.close()
+            raise
+        if part is not None:
+            if batch:
+                part.write(batch)
+            finish_file()
+        state["done"] = True
+        self._save_manifest()
+
+    async def _rows(self, entity: str, after: Any) -> AsyncIterator[tuple[Any, dict[str, Any]]]:
+        """(key, row) of `entity` in key order, those after `after` only."""
+        if entity == "departments":
+            while page := self.store.department_records(after, BATCH):
+                for dept_id, record in page:
+                    yield dept_id, record
+                after = page[-1][0]
+        elif entity == "users":
+            while page := list(self.store.memberships(after, BATCH)):
+                for record, dept_ids in page:
+                    yield record["userid"], {**record, "dept_id_list": dept_ids}
+                after = page[-1][0]["userid"]
+        elif entity == "roles":
+            for role_id in sorted(self.roles.roles):
+                if after is None or role_id > after:
+                    yield role_id, self.roles.roles[role_id]
+        elif entity == "role_members":
+            for role_id in sorted(self.roles.members):
+                for userid in sorted(self.roles.members[role_id]):
+                    if after is None or [role_id, userid] > after:
+                        yield [role_id, userid], {"role_id": role_id, **self.roles.members[role_id][userid]}
+        else:
+            # extcontact/list is paged by offset, so the key is the position.
+            offset = after + 1 if after is not None else 0
+            while True:
+                page = await self.contacts.get_external_contact_list(EXTCONTACT_PAGE, offset) or []
+                for i, contact in enumerate(page):
+                    yield offset + i, contact
+                if len(page) < EXTCONTACT_PAGE:
+                    break
+                offset += len(page)
@@ -0,0 +1,268 @@
+import json as JSON
+import logging
+import re
+import time
+from typing import Any
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+from dingtalk.mirror.store import OAPI, MirrorStore
+from dingtalk.pagination import max_page_size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS external_contacts (
+    userid TEXT PRIMARY KEY,
+    name TEXT,
+    name_key TEXT,
+    mobile_key TEXT,
+    company_name TEXT,
+    follower_user_id TEXT,
+    data TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS external_contacts_name ON external_contacts(name_key);
+CREATE INDEX IF NOT EXISTS external_contacts_mobile ON external_contacts(mobile_key);
+CREATE INDEX IF NOT EXISTS external_contacts_company ON external_contacts(company_name);
+CREATE INDEX IF NOT EXISTS external_contacts_follower ON external_contacts(follower_user_id);
+CREATE INDEX IF NOT EXISTS external_contacts_seq ON external_contacts(seq);
+CREATE TABLE IF NOT EXISTS external_contact_labels (
+    label_id INTEGER NOT NULL,
+    userid TEXT NOT NULL,
+    PRIMARY KEY (label_id, userid)
+);
+CREATE INDEX IF NOT EXISTS external_contact_labels_user ON external_contact_labels(userid);
+CREATE TABLE IF NOT EXISTS external_label_groups (
+    seq INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+SYNC_KEY = "external_contacts_synced"
+
+CONTACT_PAGE = max_page_size(f"{OAPI}/topapi/extcontact/list")
+LABEL_PAGE = max_page_size(f"{OAPI}/topapi/extcontact/listlabelgroups")
+
+# Fields contacts can be deduplicated on.
+DUPLICATE_KEYS = ["mobile", "name"]
+
+def mobile_key(contact: dict[str, Any]) -> str | None:
+    """The contact's mobile number as digits, with the country code unless it is 86."""
+    digits = re.sub(r"\D", "", str(contact.get("mobile") or ""))
+    if not digits:
+        return None
+    state_code = re.sub(r"\D", "", str(contact.get("state_code") or "")) or "86"
+    return digits if state_code == "86" else f"{state_code}-{digits}"
+
+def name_key(contact: dict[str, Any]) -> str | None:
+    """The contact's name without whitespace, case folded."""
+    return re.sub(r"\s+", "", str(contact.get("name") or "")).casefold() or None
+
+class ExternalContactIndex:
+    """
+    Mirrored external contacts and label groups, indexed by label, follower,
+    company name, mobile number and name in the mirror's database.
+
+    extcontact/list returns whole contact records, so a refresh pages it
+    once; only contacts that were added, changed or removed since the last
+    refresh are written, and contacts that only moved in the listing get
+    their new position. Contacts created, updated, deleted or read through
+    the tools are recorded as the calls are made. While the last refresh is
+    younger than the store's `max_age`, extcontact/list, listlabelgroups and
+    get are answered from the index.
+    """
+
+    def __init__(self, store: MirrorStore):
+        self.logger = logging.getLogger(__name__)
+        self.store = store
+        store.db.executescript(SCHEMA)
+        store.readers.update({
+            f"{OAPI}/topapi/extcontact/list": self._answer_list,
+            f"{OAPI}/topapi/extcontact/listlabelgroups": self._answer_label_groups,
+            f"{OAPI}/topapi/extcontact/get": self._answer_get,
+        })
+        store.recorders.update({
+            f"{OAPI}/topapi/extcontact/get": self._record_get,
+            f"{OAPI}/topapi/extcontact/create": self._record_create,
+            f"{OAPI}/topapi/extcontact/update": self._record_update,
+            f"{OAPI}/topapi/extcontact/delete": self._record_delete,
+        })
+
+    def synced_at(self) -> float | None:
+        return self.store.get_meta(SYNC_KEY)
+
+    def count(self) -> int:
+        return self.store.db.execute("SELECT COUNT(*) FROM external_contacts").fetchone()[0]
+
+    def _upsert(self, contacts: list[dict[str, Any]], seqs: list[int], synced_at: float):
+        db = self.store.db
+        db.executemany(
+            "INSERT OR REPLACE INTO external_contacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(c["userid"], c.get("name"), name_key(c), mobile_key(c), c.get("company_name"),
+              c.get("follower_user_id"), JSON.dumps(c, ensure_ascii=False), seq, synced_at)
+             for c, seq in zip(contacts, seqs)],
+        )
+        db.executemany("DELETE FROM external_contact_labels WHERE userid = ?", [(c["userid"],) for c in contacts])
+        db.executemany(
+            "INSERT OR IGNORE INTO external_contact_labels VALUES (?, ?)",
+            [(int(label_id), c["userid"]) for c in contacts for label_id in c.get("label_ids") or []],
+        )
+
+    def _remove(self, userids: list[str]):
+        self.store.db.executemany("DELETE FROM external_contacts WHERE userid = ?", [(u,) for u in userids])
+        self.store.db.executemany("DELETE FROM external_contact_labels WHERE userid = ?", [(u,) for u in userids])
+
+    def save(self, contacts: list[dict[str, Any]], label_groups: list[dict[str, Any]]) -> dict[str, int]:
+        """Bring the mirrored contacts and label groups in line with a full listing. Returns the changes."""
+        now = time.time()
+        stored = {r[0]: (r[1], r[2]) for r in self.store.db.execute("SELECT userid, data, seq FROM external_contacts")}
+        changed, seqs, moved, seen = [], [], [], set()
+        for seq, contact in enumerate(contacts):
+            userid = contact["userid"]
+            seen.add(userid)
+            old = stored.get(userid)
+            if old is None or JSON.loads(old[0]) != contact:
+                changed.append(contact)
+                seqs.append(seq)
+            elif old[1] != seq:
+                moved.append((seq, userid))
+        removed = [u for u in stored if u not in seen]
+        with self.store.db:
+            self._upsert(changed, seqs, now)
+            self.store.db.executemany("UPDATE external_contacts SET seq = ? WHERE userid = ?", moved)
+            self._remove(removed)
+            self.store.db.execute("DELETE FROM external_label_groups")
+            self.store.db.executemany("INSERT INTO external_label_groups VALUES (?, ?)",
+                                      [(i, JSON.dumps(g, ensure_ascii=False)) for i, g in enumerate(label_groups)])
+        self.store.set_meta(SYNC_KEY, now)
+        added = sum(1 for c in changed if c["userid"] not in stored)
+        return {"added": added, "changed": len(changed) - added, "removed": len(removed)}
+
+    async def refresh(self, contacts: DingtalkContactsServer) -> dict[str, Any]:
+        """Mirror every external contact and label group from the live API."""
+        started = time.monotonic()
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            listed, offset = [], 0
+            while True:
+                page = await contacts.get_external_contact_list(CONTACT_PAGE, offset) or []
+                listed.extend(page)
+                if len(page) < CONTACT_PAGE:
+                    break
+                offset += len(page)
+            label_groups, offset = [], 0
+            while True:
+                page = await contacts.get_external_contact_label_list(LABEL_PAGE, offset) or []
+                label_groups.extend(page)
+                if len(page) < LABEL_PAGE:
+                    break
+                offset += len(page)
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+        # A contact listed twice while the list shifted under the paging is kept once.
+        unique = list({c["userid"]: c for c in listed if c.get("userid")}.values())
+        report = {
+            "contacts": len(unique),
+            "label_groups": len(label_groups),
+            **self.save(unique, label_groups),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        self.logger.info(f"External contact refresh finished: {report}")
+        return report
+
+    def get(self, userid: str) -> dict[str, Any] | None:
+        row = self.store.db.execute("SELECT data FROM external_contacts WHERE userid = ?", (userid,)).fetchone()
+        return JSON.loads(row[0]) if row else None
+
+    def find(self, label_ids: list[int] | None = None, follower_user_id: str | None = None,
+             company_name: str | None = None, mobile: str | None = None, state_code: str = "86",
+             name: str | None = None, offset: int = 0, size: int = 100) -> dict[str, Any]:
+        """Contacts matching every given filter, in listing order; contacts must carry all `label_ids`."""
+        where, params = [], []
+        for label_id in label_ids or []:
+            where.append("userid IN (SELECT userid FROM external_contact_labels WHERE label_id = ?)")
+            params.append(int(label_id))
+        if follower_user_id is not None:
+            where.append("follower_user_id = ?")
+            params.append(follower_user_id)
+        if company_name is not None:
+            where.append("company_name = ?")
+            params.append(company_name)
+        if mobile is not None:
+            where.append("mobile_key = ?")
+            params.append(mobile_key({"mobile": mobile, "state_code": state_code}))
+        if name is not None:
+            where.append("name_key = ?")
+            params.append(name_key({"name": name}))
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        total = self.store.db.execute(f"SELECT COUNT(*) FROM external_contacts {clause}", params).fetchone()[0]
+        rows = self.store.db.execute(f"SELECT data FROM external_contacts {clause} ORDER BY seq, userid "
+                                     "LIMIT ? OFFSET ?", [*params, size, offset])
+        return {"count": total, "hasMore": offset + size < total, "list": [JSON.loads(r[0]) for r in rows]}
+
+    def duplicates(self, by: str = "mobile") -> list[dict[str, Any]]:
+        """Groups of contacts sharing a normalized mobile number or name, largest first."""
+        if by not in DUPLICATE_KEYS:
+            raise ValueError(f"Unknown duplicate key {by}, expected one of {', '.join(DUPLICATE_KEYS)}")
+        column = f"{by}_key"
+        rows = self.store.db.execute(
+            f"SELECT {column}, data FROM external_contacts WHERE {column} IN "
+            f"(SELECT {column} FROM external_contacts WHERE {column} IS NOT NULL "
+            f"GROUP BY {column} HAVING COUNT(*) > 1) "
+            f"ORDER BY {column}, seq"
+        )
+        groups: dict[str, list[dict[str, Any]]] = {}
+        for key, data in rows:
+            groups.setdefault(key, []).append(JSON.loads(data))
+        return sorted(({by: key, "count": len(g), "list": g} for key, g in groups.items()), key=lambda g: -g["count"])
+
+    def _next_seq(self) -> int:
+        return (self.store.db.execute("SELECT MAX(seq) FROM external_contacts").fetchone()[0] or 0) + 1
+
+    def _record_get(self, payload: dict[str, Any], result: Any):
+        if isinstance(result, dict) and payload.get("user_id"):
+            row = self.store.db.execute("SELECT seq FROM external_contacts WHERE userid = ?",
+                                        (payload["user_id"],)).fetchone()
+            with self.store.db:
+                self._upsert([{**result, "userid": payload["user_id"]}], [row[0] if row else self._next_seq()],
+                             time.time())
+
+    def _record_create(self, payload: dict[str, Any], result: Any):
+        contact = payload.get("contact")
+        if isinstance(result, str) and isinstance(contact, dict):
+            with self.store.db:
+                self._upsert([{**contact, "userid": result}], [self._next_seq()], time.time())
+
+    def _record_update(self, payload: dict[str, Any], result: Any):
+        contact = dict(payload.get("contact") or {})
+        userid = contact.pop("user_id", None)
+        row = self.store.db.execute("SELECT data, seq FROM external_contacts WHERE userid = ?", (userid,)).fetchone()
+        if row is not None:
+            with self.store.db:
+                self._upsert([{**JSON.loads(row[0]), **contact}], [row[1]], time.time())
+
+    def _record_delete(self, payload: dict[str, Any], result: Any):
+        if payload.get("user_id"):
+            with self.store.db:
+                self._remove([payload["user_id"]])
+
+    def _answer_list(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.synced_at()):
+            return None
+        offset, size = int(payload.get("offset") or 0), int(payload.get("size") or 20)
+        return self.find(offset=offset, size=size)["list"]
+
+    def _answer_label_groups(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.synced_at()):
+            return None
+        offset, size = int(payload.get("offset") or 0), int(payload.get("size") or 20)
+        rows = self.store.db.execute("SELECT data FROM external_label_groups ORDER BY seq LIMIT ? OFFSET ?",
+                                     (size, offset))
+        return [JSON.loads(r[0]) for r in rows]
+
+    def _answer_get(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.synced_at()):
+            return None
+        return self.get(payload["user_id"])
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results, result_transforms
+from dingtalk.mirror.store import OAPI, MirrorStore
+
+API = "https://api.dingtalk.com/v1.0/contact/orgAccount"
+
+# unionid and dingid are the ids of the current (enterprise) account; the
+# original_ kinds are those of the account it was migrated from.
+KINDS = ["userid", "mobile", "unionid", "original_unionid", "dingid", "original_dingid"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identity_links (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    other_kind TEXT NOT NULL,
+    other_value TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (kind, value, other_kind)
+);
+"""
+
+# SQLite limits the number of bound parameters per statement.
+CHUNK = 500
+
+class IdentityIndex:
+    """
+    Persistent links between the identifiers of a person: userid, mobile,
+    unionid and the union/ding ids before and after an enterprise account
+    migration.
+
+    Links are stored in both directions in the mirror's database and
+    resolved transitively, so a mobile also resolves to the unionid of the
+    user it belongs to. They are filled in bulk from mirrored users and
+    lazily from live API results; API reads are answered from links younger
+    than the store's `max_age`.
+
+    `mapped`, when given, returns the mirror's mapped snapshot while it holds
+    the store's current users; lookups of a userid by mobile or unionid are
+    answered from its sorted sections first, so a fresh process answers
+    them before any links are loaded.
+    """
+
+    def __init__(self, store: MirrorStore, mapped: Callable[[], Any] | None = None):
+        self.store = store
+        self.mapped = mapped
+        store.db.executescript(SCHEMA)
+        store.readers.update({
+            f"{OAPI}/topapi/v2/user/getbymobile": self._answer_by_mobile,
+            f"{OAPI}/topapi/user/getbyunionid": self._answer_by_unionid,
+            f"{API}/getMigrationUnionIdByUnionIds": self._reader("unionId", "original_unionid", "unionid"),
+            f"{API}/getUnionIdByMigrationUnionIds": self._reader("migrationUnionId", "unionid", "original_unionid"),
+            f"{API}/getMigrationDingIdByDingIds": self._reader("dingId", "original_dingid", "dingid"),
+            f"{API}/getDingIdByMigrationDingIds": self._reader("migrationDingId", "dingid", "original_dingid"),
+        })
+        self.record_user_get = store.recorders.get(f"{OAPI}/topapi/v2/user/get")
+        store.recorders.update({
+            f"{OAPI}/topapi/v2/user/get": self._record_user_get,
+            f"{OAPI}/topapi/v2/user/getbymobile": self._recorder("mobile", "mobile", "userid", "userid"),
+            f"{OAPI}/topapi/user/getbyunionid": self._recorder("unionid", "unionid", "userid", "userid"),
+            f"{API}/getMigrationUnionIdByUnionIds": self._recorder("unionId", "original_unionid", "result", "unionid"),
+            f"{API}/getUnionIdByMigrationUnionIds": self._recorder("migrationUnionId", "unionid", "result", "original_unionid"),
+            f"{API}/getMigrationDingIdByDingIds": self._recorder("dingId", "original_dingid", "result", "dingid"),
+            f"{API}/getDingIdByMigrationDingIds": self._recorder("migrationDingId", "dingid", "result", "original_dingid"),
+        })
+
+    def link(self, links: list[tuple[str, str, str, str]], synced_at: float | None = None):
+        """Store (kind, value, other_kind, other_value) links, both ways."""
+        synced_at = synced_at or time.time()
+        rows = [(k, str(v), ok, str(ov), synced_at) for k, v, ok, ov in links if v and ov]
+        rows += [(ok, ov, k, v, t) for k, v, ok, ov, t in rows]
+        with self.store.db:
+            self.store.db.executemany("INSERT OR REPLACE INTO identity_links VALUES (?, ?, ?, ?, ?)", rows)
+
+    def load_records(self, records: list[dict[str, Any]], synced_at: float | None = None):
+        """Link the userid of user records to their mobile and unionid."""
+        self.link([
+            (kind, r["userid"], other, r[other])
+            for r in records if isinstance(r, dict) and r.get("userid")
+            for kind, other in (("userid", "mobile"), ("userid", "unionid")) if r.get(other)
+        ], synced_at)
+
+    def load_users(self) -> int:
+        """Bulk load the users mirrored since the last load, returns how many."""
+        since = self.store.get_meta("identity_users_synced", 0)
+        last_synced = self.store.user_version()[1]
+        if last_synced <= since:
+            return 0
+        users = self.store.users_since(since)
+        self.load_records([u for _, u in users])
+        self.store.set_meta("identity_users_synced", last_synced)
+        return len(users)
+
+    def lookup(self, kind: str, value: str, other_kind: str, fresh: bool = False) -> str | None:
+        row = self.store.db.execute(
+            "SELECT other_value, synced_at FROM identity_links WHERE kind = ? AND value = ? AND other_kind = ?",
+            (kind, str(value), other_kind),
+        ).fetchone()
+        if row is None or (fresh and not self.store.is_fresh(row[1])):
+            return None
+        return row[0]
+
+    def resolve_many(self, kind: str, values: list[str]) -> dict[str, dict[str, str]]:
+        """Every identifier reachable from each of `values`, by kind."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown identity kind: {kind}")
+        values = [str(v) for v in values]
+        found = {v: {kind: v} for v in values}
+        frontier: dict[tuple[str, str], set[str]] = {(kind, v): {v} for v in values}
+        seen: dict[tuple[str, str], set[str]] = {node: set(origins) for node, origins in frontier.items()}
+        while frontier:
+            by_kind: dict[str, list[str]] = defaultdict(list)
+            for k, v in frontier:
+                by_kind[k].append(v)
+            next_frontier: dict[tuple[str, str], set[str]] = defaultdict(set)
+            for k, vals in by_kind.items():
+                for i in range(0, len(vals), CHUNK):
+                    chunk = vals[i:i + CHUNK]
+                    rows = self.store.db.execute(
+                        f"SELECT value, other_kind, other_value FROM identity_links "
+                        f"WHERE kind = ? AND value IN ({','.join('?' * len(chunk))})",
+                        [k, *chunk],
+                    )
+                    for value, other_kind, other_value in rows:
+                        node = (other_kind, other_value)
+                        for origin in frontier[(k, value)]:
+                            found[origin].setdefault(other_kind, other_value)
+                            if origin not in seen.setdefault(node, set()):
+                                seen[node].add(origin)
+                                next_frontier[node].add(origin)
+            frontier = next_frontier
+        return found
+
+    def _mapped_userid(self, kind: str, value: str) -> str | None:
+        snapshot = self.mapped() if self.mapped is not None else None
+        user = snapshot.user_by(kind, str(value)) if snapshot is not None else None
+        return user["userid"] if user else None
+
+    def _answer_by_mobile(self, payload: dict[str, Any]) -> Any:
+        if payload.get("support_exclusive_account_search"):
+            return None
+        userid = self._mapped_userid("mobile", payload["mobile"]) \
+            or self.lookup("mobile", payload["mobile"], "userid", fresh=True)
+        return {"userid": userid} if userid else None
+
+    def _answer_by_unionid(self, payload: dict[str, Any]) -> Any:
+        userid = self._mapped_userid("unionid", payload["unionid"]) \
+            or self.lookup("unionid", payload["unionid"], "userid", fresh=True)
+        return {"contact_type": 0, "userid": userid} if userid else None
+
+    def _reader(self, param: str, kind: str, other_kind: str):
+        def answer(payload: dict[str, Any]) -> Any:
+            value = self.lookup(kind, payload[param], other_kind, fresh=True)
+            return {"result": value} if value else None
+        return answer
+
+    def _record_user_get(self, payload: dict[str, Any], result: Any):
+        if self.record_user_get:
+            self.record_user_get(payload, result)
+        self.load_records([result])
+
+    def _recorder(self, param: str, kind: str, key: str, other_kind: str):
+        def record(payload: dict[str, Any], result: Any):
+            if isinstance(result, dict) and result.get(key) and payload.get(param):
+                self.link([(kind, payload[param], other_kind, result[key])])
+        return record
+
+    # Live lookups filling in missing links, by (kind, wanted kind).
+    FETCHERS = {
+        ("mobile", "userid"): "get_user_by_mobile",
+        ("unionid", "userid"): "get_user_id_by_unionid_old",
+        ("original_unionid", "unionid"): "get_migration_union_id_by_union_id",
+        ("unionid", "original_unionid"): "get_union_id_by_migration_union_id",
+        ("original_dingid", "dingid"): "get_migration_ding_id_by_ding_id",
+        ("dingid", "original_dingid"): "get_original_ding_id_by_migration_ding_id",
+        ("userid", "mobile"): "get_user_detail",
+        ("userid", "unionid"): "get_user_detail",
+    }
+
+    async def fetch_missing(self, contacts: DingtalkContactsServer, kind: str, values: list[str],
+                            targets: list[str], max_concurrency: int = 10) -> dict[str, str]:
+        """
+        Look up `values` lacking a `targets` identifier through the live API,
+        which links the results. Returns the errors by value.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        errors: dict[str, str] = {}
+
+        async def fetch(value: str, method: str):
+            async with semaphore:
+                try:
+                    await getattr(contacts, method)(value)
+                except Exception as e:
+                    errors[value] = str(e)
+
+        tokens = raw_results.set(True), result_transforms.set(())
+        try:
+            calls = {(v, self.FETCHERS[(kind, t)]) for v in values for t in targets if (kind, t) in self.FETCHERS}
+            await asyncio.gather(*(fetch(v, m) for v, m in calls))
+        finally:
+            raw_results.reset(tokens[0])
+            result_transforms.reset(tokens[1])
+        return errors
@@ -0,0 +1,191 @@
+import statistics
+from array import array
+from collections import Counter
+from typing import Any, Iterable
+
+from dingtalk.mirror.store import MirrorStore
+
+# Span of control buckets, by number of direct reports.
+SPAN_BUCKETS = [(1, "1"), (3, "2-3"), (7, "4-7"), (15, "8-15"), (float("inf"), "16+")]
+
+class ManagerGraph:
+    """
+    Reporting lines from the `manager_userid` of mirrored users.
+
+    Users are numbered by userid, managers missing from the mirror included.
+    Like DepartmentTree the graph is held as flat arrays: `manager` holds
+    each user's manager (-1 for none), `order` lists users in pre-order of
+    the reporting forest, so everyone reporting to a user, directly or not,
+    is the slice `order[start[i] + 1:start[i] + size[i]]`, and `depth` is
+    the length of each user's management chain. Reporting cycles are
+    detected while building and cut at their first user, whose manager is
+    kept aside in `cut`.
+
+    Only user details (and list records carrying the field) say who the
+    manager is; users without one are counted as `unknown`. The graph is
+    rebuilt when users or details change and cached otherwise.
+    """
+
+    def __init__(self, store: MirrorStore):
+        self.store = store
+        self.version: tuple | None = None
+        self.userids: list[str] = []
+        self.index: dict[str, int] = {}
+        self.manager = array("l")
+        self.known = bytearray()
+        self.child_offsets = array("l", [0])
+        self.child_index = array("l")
+        self.order = array("l")
+        self.start = array("l")
+        self.size = array("l")
+        self.depth = array("l")
+        # position cut to break a cycle -> the manager it had
+        self.cut: dict[int, int] = {}
+        self.cycles: list[list[str]] = []
+
+    def __contains__(self, userid: str) -> bool:
+        return userid in self.index
+
+    def refresh(self) -> bool:
+        """Rebuild the graph if mirrored users changed since. Returns whether it did."""
+        version = (self.store.user_version(), self.store.detail_version())
+        if version == self.version:
+            return False
+        self.load(self.store.user_managers())
+        self.version = version
+        return True
+
+    def load(self, users: Iterable[tuple[str, str | None, bool]]):
+        """Build the graph from (userid, manager_userid, whether the manager is known)."""
+        users = list(users)
+        self.userids = sorted({u for u, _, _ in users} | {m for _, m, _ in users if m})
+        self.index = {u: i for i, u in enumerate(self.userids)}
+        n = len(self.userids)
+        self.manager = array("l", [-1] * n)
+        self.known = bytearray(n)
+        for userid, manager, known in users:
+            i = self.index[userid]
+            self.known[i] = known
+            if manager and manager != userid:
+                self.manager[i] = self.index[manager]
+        self._cut_cycles()
+
+        counts = array("l", [0] * (n + 1))
+        for m in self.manager:
+            if m >= 0:
+                counts[m + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        self.child_offsets = counts
+        self.child_index = array("l", [0] * counts[n])
+        fill = array("l", counts[:n])
+        for i, m in enumerate(self.manager):
+            if m >= 0:
+                self.child_index[fill[m]] = i
+                fill[m] += 1
+
+        self.order = array("l")
+        self.start = array("l", [0] * n)
+        self.size = array("l", [1] * n)
+        self.depth = array("l", [0] * n)
+        for root in (i for i in range(n) if self.manager[i] < 0):
+            stack = [root]
+            while stack:
+                i = stack.pop()
+                if i < 0:
+                    i = ~i
+                    self.size[i] = len(self.order) - self.start[i]
+                    continue
+                self.start[i] = len(self.order)
+                self.order.append(i)
+                if self.manager[i] >= 0:
+                    self.depth[i] = self.depth[self.manager[i]] + 1
+                stack.append(~i)
+                stack.extend(reversed(self.child_index[self.child_offsets[i]:self.child_offsets[i + 1]]))
+
+    def _cut_cycles(self):
+        """Find the cycles of manager links and cut each at its first user."""
+        self.cut, self.cycles = {}, []
+        state = bytearray(len(self.manager))  # 0 unvisited, 1 on the current path, 2 done
+        for i in range(len(self.manager)):
+            path, j = [], i
+            while j >= 0 and state[j] == 0:
+                state[j] = 1
+                path.append(j)
+                j = self.manager[j]
+            if j >= 0 and state[j] == 1:
+                cycle = path[path.index(j):]
+                first = min(cycle)
+                self.cut[first] = self.manager[first]
+                self.manager[first] = -1
+                self.cycles.append([self.userids[c] for c in cycle[cycle.index(first):] + cycle[:cycle.index(first)]])
+            for p in path:
+                state[p] = 2
+
+    def _position(self, userid: str) -> int:
+        if userid not in self.index:
+            raise ValueError(f"User {userid} is not in the mirror")
+        return self.index[userid]
+
+    def chain(self, userid: str) -> dict[str, Any]:
+        """The user's managers from the nearest up, and whether the chain is complete."""
+        i = self._position(userid)
+        chain, j = [], self.manager[i]
+        while j >= 0:
+            chain.append(self.userids[j])
+            j = self.manager[j]
+        top = self.index[chain[-1]] if chain else i
+        return {
+            "chain": chain,
+            "depth": self.depth[i],
+            # the top of the chain has no manager because of a cycle, or isn't known to have none
+            "in_cycle": top in self.cut,
+            "complete": bool(self.known[top]) and top not in self.cut,
+        }
+
+    def direct_reports(self, userid: str) -> list[str]:
+        i = self._position(userid)
+        return [self.userids[c] for c in self.child_index[self.child_offsets[i]:self.child_offsets[i + 1]]]
+
+    def reports(self, userid: str, max_depth: int | None = None) -> list[tuple[str, int]]:
+        """Everyone reporting to the user, directly or not, with their level below the user, in pre-order."""
+        i = self._position(userid)
+        base = self.depth[i]
+        below = self.order[self.start[i] + 1:self.start[i] + self.size[i]]
+        return [(self.userids[j], self.depth[j] - base) for j in below
+                if max_depth is None or self.depth[j] - base <= max_depth]
+
+    def span(self, userid: str | None = None, top: int = 10) -> dict[str, Any]:
+        """Span of control statistics over the user's organization, or over everyone."""
+        if userid is None:
+            users = range(len(self.userids))
+            result: dict[str, Any] = {
+                "users": len(self.userids),
+                "unknown_manager": sum(1 for k in self.known if not k),
+                "top_level": sum(1 for i in users if self.manager[i] < 0 and self.known[i] and i not in self.cut),
+                "cycles": self.cycles,
+            }
+            base = 0
+        else:
+            i = self._position(userid)
+            users = self.order[self.start[i]:self.start[i] + self.size[i]]
+            result = {"userid": userid, "direct_reports": self._direct_count(i), "total_reports": self.size[i] - 1}
+            base = self.depth[i]
+
+        spans = [(s, i) for i in users if (s := self._direct_count(i))]
+        counts = sorted(s for s, _ in spans)
+        buckets = Counter(next(label for limit, label in SPAN_BUCKETS if s <= limit) for s in counts)
+        result.update({
+            "managers": len(spans),
+            "levels": max((self.depth[i] - base for i in users), default=0) + 1,
+            "mean_span": round(statistics.fmean(counts), 2) if counts else 0,
+            "median_span": statistics.median(counts) if counts else 0,
+            "max_span": counts[-1] if counts else 0,
+            "span_distribution": {label: buckets[label] for _, label in SPAN_BUCKETS if buckets[label]},
+            "widest": [{"userid": self.userids[i], "direct_reports": s, "total_reports": self.size[i] - 1}
+                       for s, i in sorted(spans, key=lambda item: (-item[0], item[1]))[:top]],
+        })
+        return result
+
+    def _direct_count(self, i: int) -> int:
+        return self.child_offsets[i + 1] - self.child_offsets[i]
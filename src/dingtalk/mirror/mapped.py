@@ -0,0 +1,281 @@
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from typing import Any
+
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+MAGIC = b"DDORGSNP"
+VERSION = 1
+
+# magic, format version, section count, written at, department count and
+# last synced_at, user count and last synced_at
+HEADER = struct.Struct("<8sIIdqdqd")
+# name, offset, length in bytes
+SECTION = struct.Struct("<8sQQ")
+
+# Section names and their array typecodes. Departments are numbered by
+# their index in the sorted `dept_ids`, users by their index in `user_ids`
+# (sorted string ids); strings are indexes into the string table.
+SECTIONS = {
+    "str_data": "B",   # UTF-8 strings back to back
+    "str_offs": "I",   # string i spans str_data[str_offs[i]:str_offs[i + 1]]
+    "dept_ids": "q",
+    "d_parent": "i",   # parent department, -1 for roots
+    "d_name": "i",
+    "d_depth": "i",
+    "d_choff": "i",    # children of department i: d_child[d_choff[i]:d_choff[i + 1]]
+    "d_child": "i",
+    "d_order": "i",    # pre-order; the subtree of i is d_order[d_start[i]:d_start[i] + d_size[i]]
+    "d_start": "i",
+    "d_size": "i",
+    "user_ids": "i",   # string of user i
+    "u_name": "i",
+    "u_doff": "i",     # departments of user i: u_dept[u_doff[i]:u_doff[i + 1]]
+    "u_dept": "i",
+    "mob_keys": "i",   # mobiles, sorted, and the user each belongs to
+    "mob_user": "i",
+    "uni_keys": "i",   # unionids, sorted, and the user each belongs to
+    "uni_user": "i",
+}
+
+def snapshot_path(store: MirrorStore) -> str | None:
+    """Where the mapped snapshot of `store` lives, None for in-memory stores."""
+    return None if store.path == ":memory:" else f"{store.path}.snap"
+
+class _Strings:
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("I", [0])
+        self.index: dict[str, int] = {}
+
+    def add(self, value: str | None) -> int:
+        if value is None:
+            return -1
+        if value not in self.index:
+            self.index[value] = len(self.offsets) - 1
+            self.data += value.encode()
+            self.offsets.append(len(self.data))
+        return self.index[value]
+
+def write_snapshot(store: MirrorStore, path: str) -> dict[str, Any]:
+    """
+    Write the departments, memberships and user identifiers of `store` to
+    `path`, replacing it atomically so processes mapping the old file keep
+    reading it.
+    """
+    tree = DepartmentTree()
+    tree.refresh(store)
+    strings = _Strings()
+    names = array("i", (strings.add((store.get_department(d) or {}).get("name")) for d in tree.ids))
+
+    user_ids, user_names = array("i"), array("i")
+    dept_offsets, depts = array("i", [0]), array("i")
+    mobiles, unionids = [], []
+    # memberships() yields users sorted by userid, by UTF-8 bytes, which is
+    # the code point order Python compares strings in.
+    for record, dept_ids in store.memberships():
+        user = len(user_ids)
+        user_ids.append(strings.add(record["userid"]))
+        user_names.append(strings.add(record.get("name")))
+        depts.extend(sorted(tree.positions[d] for d in dept_ids if d in tree.positions))
+        dept_offsets.append(len(depts))
+        if record.get("mobile"):
+            mobiles.append((record["mobile"], user))
+        if record.get("unionid"):
+            unionids.append((record["unionid"], user))
+    mobiles.sort()
+    unionids.sort()
+    # Strings are added before the string table is packed below.
+    mobile_keys = array("i", (strings.add(m) for m, _ in mobiles))
+    unionid_keys = array("i", (strings.add(u) for u, _ in unionids))
+
+    sections = {
+        "str_data": array("B", strings.data),
+        "str_offs": strings.offsets,
+        "dept_ids": tree.ids,
+        "d_parent": array("i", tree.parent),
+        "d_name": names,
+        "d_depth": array("i", tree.depth),
+        "d_choff": array("i", tree.child_offsets),
+        "d_child": array("i", tree.child_index),
+        "d_order": array("i", tree.order),
+        "d_start": array("i", tree.start),
+        "d_size": array("i", tree.size),
+        "user_ids": user_ids,
+        "u_name": user_names,
+        "u_doff": dept_offsets,
+        "u_dept": depts,
+        "mob_keys": mobile_keys,
+        "mob_user": array("i", (u for _, u in mobiles)),
+        "uni_keys": unionid_keys,
+        "uni_user": array("i", (u for _, u in unionids)),
+    }
+
+    dept_version, user_version = tree.version or (0, 0.0), store.user_version()
+    offset = HEADER.size + SECTION.size * len(sections)
+    table, blobs = [], []
+    for name, data in sections.items():
+        offset += -offset % 8
+        blob = data.tobytes()
+        table.append(SECTION.pack(name.encode(), offset, len(blob)))
+        blobs.append((offset, blob))
+        offset += len(blob)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections), time.time(), dept_version[0], dept_version[1],
+                            user_version[0], user_version[1]))
+        f.write(b"".join(table))
+        for start, blob in blobs:
+            f.write(b"\0" * (start - f.tell()))
+            f.write(blob)
+    os.replace(tmp, path)
+    return {"path": path, "bytes": offset, "departments": len(tree), "users": len(user_ids)}
+
+class MappedSnapshot:
+    """
+    Read-only view of a snapshot file written by `write_snapshot`.
+
+    The file is memory-mapped and its sections are used in place as typed
+    memoryviews, so opening it costs a few milliseconds whatever the size of
+    the organization, and processes mapping the same file share its pages.
+    Answers the same department queries as DepartmentTree, plus lookups of
+    users by userid, mobile and unionid.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views: list[memoryview] = []
+        try:
+            magic, version, count, self.written_at, dept_count, dept_synced, user_count, user_synced = \
+                HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} organization snapshot")
+            raw = memoryview(self.map)
+            self.views.append(raw)
+            for i in range(count):
+                name, offset, length = SECTION.unpack_from(self.map, HEADER.size + i * SECTION.size)
+                name = name.rstrip(b"\0").decode()
+                view = raw[offset:offset + length].cast(SECTIONS[name])
+                self.views.append(view)
+                setattr(self, name, view)
+        except Exception:
+            self.close()
+            raise
+        # (department count, last synced_at) of the store when written, as
+        # DepartmentTree.version
+        self.version = (dept_count, dept_synced)
+        self.user_version = (user_count, user_synced)
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.map.close()
+
+    def string(self, i: int) -> str | None:
+        if i < 0:
+            return None
+        return bytes(self.str_data[self.str_offs[i]:self.str_offs[i + 1]]).decode()
+
+    # Departments, as DepartmentTree
+
+    def __len__(self) -> int:
+        return len(self.dept_ids)
+
+    def __contains__(self, dept_id: int) -> bool:
+        i = bisect_left(self.dept_ids, dept_id)
+        return i < len(self.dept_ids) and self.dept_ids[i] == dept_id
+
+    def _position(self, dept_id: int) -> int:
+        i = bisect_left(self.dept_ids, dept_id)
+        if i == len(self.dept_ids) or self.dept_ids[i] != dept_id:
+            raise ValueError(f"Department {dept_id} is not in the mirror")
+        return i
+
+    def name(self, dept_id: int) -> str | None:
+        return self.string(self.d_name[self._position(dept_id)])
+
+    def parent_id(self, dept_id: int) -> int | None:
+        p = self.d_parent[self._position(dept_id)]
+        return self.dept_ids[p] if p >= 0 else None
+
+    def children(self, dept_id: int) -> list[int]:
+        p = self._position(dept_id)
+        return [self.dept_ids[c] for c in self.d_child[self.d_choff[p]:self.d_choff[p + 1]]]
+
+    def depth_of(self, dept_id: int) -> int:
+        return self.d_depth[self._position(dept_id)]
+
+    def ancestors(self, dept_id: int) -> list[int]:
+        """The department followed by its parents up to the root."""
+        p = self._position(dept_id)
+        chain = []
+        while p >= 0 and len(chain) <= len(self.dept_ids):
+            chain.append(self.dept_ids[p])
+            p = self.d_parent[p]
+        return chain
+
+    def subtree(self, dept_id: int, max_depth: int | None = None) -> list[int]:
+        """The department and all departments below it, in pre-order."""
+        p = self._position(dept_id)
+        positions = self.d_order[self.d_start[p]:self.d_start[p] + self.d_size[p]]
+        if max_depth is not None:
+            limit = self.d_depth[p] + max_depth
+            return [self.dept_ids[q] for q in positions if self.d_depth[q] <= limit]
+        return [self.dept_ids[q] for q in positions]
+
+    def is_descendant(self, dept_id: int, ancestor_id: int) -> bool:
+        """Whether `dept_id` is `ancestor_id` or below it."""
+        p, a = self._position(dept_id), self._position(ancestor_id)
+        return self.d_start[a] <= self.d_start[p] < self.d_start[a] + self.d_size[a]
+
+    def lowest_common_ancestor(self, dept_ids: list[int]) -> int | None:
+        """The deepest department containing all of `dept_ids`, None if they are in different trees."""
+        if not dept_ids:
+            raise ValueError("At least one department is required")
+        a = self._position(dept_ids[0])
+        for dept_id in dept_ids[1:]:
+            b = self._position(dept_id)
+            while self.d_depth[a] > self.d_depth[b]:
+                a = self.d_parent[a]
+            while self.d_depth[b] > self.d_depth[a]:
+                b = self.d_parent[b]
+            while a != b:
+                a, b = self.d_parent[a], self.d_parent[b]
+            if a < 0:
+                return None
+        return self.dept_ids[a]
+
+    # Users
+
+    def _search(self, keys: memoryview, value: str) -> int | None:
+        i = bisect_left(range(len(keys)), value, key=lambda j: self.string(keys[j]))
+        return i if i < len(keys) and self.string(keys[i]) == value else None
+
+    def find_user(self, userid: str) -> int | None:
+        return self._search(self.user_ids, userid)
+
+    def user(self, i: int) -> dict[str, Any]:
+        return {
+            "userid": self.string(self.user_ids[i]),
+            "name": self.string(self.u_name[i]),
+            "dept_id_list": [self.dept_ids[d] for d in self.u_dept[self.u_doff[i]:self.u_doff[i + 1]]],
+        }
+
+    def user_by(self, kind: str, value: str) -> dict[str, Any] | None:
+        """The user with userid, mobile or unionid `value`."""
+        if kind == "userid":
+            i = self.find_user(value)
+        else:
+            keys, users = {"mobile": (self.mob_keys, self.mob_user), "unionid": (self.uni_keys, self.uni_user)}[kind]
+            j = self._search(keys, value)
+            i = users[j] if j is not None else None
+        return self.user(i) if i is not None else None
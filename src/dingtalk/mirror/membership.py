@@ -0,0 +1,267 @@
+import re
+from typing import Any, Iterable, Iterator
+
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+# Bits per bitset chunk. Larger chunks make operations on big sets faster
+# and sparse sets larger (see benchmarks/member_sets.py).
+CHUNK_BITS = 12
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# Operand kinds of set expressions.
+OPERANDS = ["dept", "direct", "role", "group"]
+
+class Bitset:
+    """
+    A set of user indexes as a compressed bitset: the index space is cut
+    into chunks of 2 ** CHUNK_BITS indexes and only chunks holding members
+    are kept, each as an int whose bits are the members. As users are
+    numbered in department pre-order, a department's members fall into a
+    few chunks; set operations only touch the chunks of their operands.
+    """
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks: dict[int, int] | None = None):
+        # chunk number -> bits, never 0
+        self.chunks = chunks if chunks is not None else {}
+
+    @classmethod
+    def of(cls, indexes: Iterable[int]) -> "Bitset":
+        chunks: dict[int, int] = {}
+        for i in indexes:
+            chunks[i >> CHUNK_BITS] = chunks.get(i >> CHUNK_BITS, 0) | 1 << (i & CHUNK_MASK)
+        return cls(chunks)
+
+    @classmethod
+    def span(cls, start: int, stop: int) -> "Bitset":
+        """Every index from `start` up to, but not including, `stop`."""
+        chunks = {}
+        for c in range(start >> CHUNK_BITS, ((stop - 1) >> CHUNK_BITS) + 1 if stop > start else 0):
+            lo = max(start - (c << CHUNK_BITS), 0)
+            hi = min(stop - (c << CHUNK_BITS), 1 << CHUNK_BITS)
+            chunks[c] = (1 << hi) - (1 << lo)
+        return cls(chunks)
+
+    def __or__(self, other: "Bitset") -> "Bitset":
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = dict(large)
+        for c, bits in small.items():
+            chunks[c] = chunks.get(c, 0) | bits
+        return Bitset(chunks)
+
+    def __and__(self, other: "Bitset") -> "Bitset":
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = {}
+        for c, bits in small.items():
+            if bits := bits & large.get(c, 0):
+                chunks[c] = bits
+        return Bitset(chunks)
+
+    def __sub__(self, other: "Bitset") -> "Bitset":
+        chunks = {}
+        for c, bits in self.chunks.items():
+            if bits := bits & ~other.chunks.get(c, 0):
+                chunks[c] = bits
+        return Bitset(chunks)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Bitset) and self.chunks == other.chunks
+
+    def __len__(self) -> int:
+        return sum(bits.bit_count() for bits in self.chunks.values())
+
+    def __contains__(self, i: int) -> bool:
+        return bool(self.chunks.get(i >> CHUNK_BITS, 0) >> (i & CHUNK_MASK) & 1)
+
+    def __iter__(self) -> Iterator[int]:
+        """Members in ascending order."""
+        for c in sorted(self.chunks):
+            bits, base = self.chunks[c], c << CHUNK_BITS
+            while bits:
+                low = bits & -bits
+                yield base + low.bit_length() - 1
+                bits ^= low
+
+    def nbytes(self) -> int:
+        """Approximate size of the chunk data."""
+        return sum(8 + (bits.bit_length() + 7) // 8 for bits in self.chunks.values())
+
+TOKEN = re.compile(r"\s*(?:(?P<op>[()|&-])|(?P<kind>[a-z]+):(?P<id>\d+)|(?P<all>all)\b)")
+
+def parse_expression(expression: str) -> Any:
+    """
+    Parse a set expression into nested tuples: (op, left, right) for the
+    operators and (kind, id) or ("all",) for operands.
+
+    Operands are `dept:<id>` (the department and its sub-departments),
+    `direct:<id>` (the department's own members), `role:<id>`,
+    `group:<id>` (every role of a role group) and `all` (every user in a
+    mirrored department). Operators follow
+    Python's set precedence: `-` (difference) binds tighter than `&`
+    (intersection), which binds tighter than `|` (union); parentheses
+    group.
+    """
+    tokens, pos = [], 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = TOKEN.match(expression, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Invalid set expression at {pos}: {expression[pos:pos + 20]!r}")
+        if match["kind"] is not None and match["kind"] not in OPERANDS:
+            raise ValueError(f"Unknown operand {match['kind']}, expected one of {', '.join(OPERANDS)} or all")
+        if match["op"] is not None:
+            tokens.append(match["op"])
+        elif match["all"] is not None:
+            tokens.append(("all",))
+        else:
+            tokens.append((match["kind"], int(match["id"])))
+        pos = match.end()
+    if not tokens:
+        raise ValueError("The set expression is empty")
+
+    def binary(level: int, i: int) -> tuple[Any, int]:
+        if level == 3:
+            return operand(i)
+        node, i = binary(level + 1, i)
+        while i < len(tokens) and tokens[i] == "|&-"[level]:
+            right, i = binary(level + 1, i + 1)
+            node = ("|&-"[level], node, right)
+        return node, i
+
+    def operand(i: int) -> tuple[Any, int]:
+        if i >= len(tokens):
+            raise ValueError("The set expression ends early")
+        if tokens[i] == "(":
+            node, i = binary(0, i + 1)
+            if i >= len(tokens) or tokens[i] != ")":
+                raise ValueError("Unbalanced parentheses in the set expression")
+            return node, i + 1
+        if isinstance(tokens[i], tuple):
+            return tokens[i], i + 1
+        raise ValueError(f"Unexpected {tokens[i]!r} in the set expression")
+
+    node, i = binary(0, 0)
+    if i != len(tokens):
+        raise ValueError(f"Unexpected {tokens[i]!r} in the set expression")
+    return node
+
+def operand_kinds(node: Any) -> set[str]:
+    """Kinds of the operands in a parsed expression."""
+    if node[0] in "|&-":
+        return operand_kinds(node[1]) | operand_kinds(node[2])
+    return {node[0]}
+
+class MembershipSets:
+    """
+    Department, role and role group memberships as bitsets over dense user
+    indexes, for set algebra without API calls or list scans.
+
+    Users are numbered in the pre-order of the first department they are
+    found in, then role members outside mirrored departments. Each
+    department has a bitset of its own members and one of its whole
+    subtree, built bottom-up from its children's. The sets are rebuilt when
+    the mirror or the role index changes and cached otherwise.
+    """
+
+    def __init__(self, store: MirrorStore, tree: DepartmentTree, roles: RoleIndex):
+        self.store = store
+        self.tree = tree
+        self.roles = roles
+        self.version: tuple | None = None
+        self.userids: list[str] = []
+        self.index: dict[str, int] = {}
+        self.direct: list[Bitset] = []
+        self.subtree: list[Bitset] = []
+        self.role_sets: dict[int, Bitset] = {}
+        self.group_sets: dict[int, Bitset] = {}
+        self.everyone = Bitset()
+
+    def refresh(self) -> bool:
+        """Rebuild the bitsets if the mirror or roles changed since. Returns whether it did."""
+        self.tree.refresh(self.store)
+        version = (self.store.department_version(), self.store.user_version(), self.store.membership_count(),
+                   self.roles.synced_at())
+        if version == self.version:
+            return False
+        self.build(self.store.department_members())
+        self.version = version
+        return True
+
+    def _number(self, userid: str) -> int:
+        i = self.index.get(userid)
+        if i is None:
+            i = self.index[userid] = len(self.userids)
+            self.userids.append(userid)
+        return i
+
+    def build(self, members: dict[int, list[str]]):
+        """Number the users and build every set from department members and role members."""
+        tree = self.tree
+        self.userids, self.index = [], {}
+        self.direct = [Bitset() for _ in range(len(tree))]
+        for p in tree.order:
+            self.direct[p] = Bitset.of(self._number(u) for u in members.get(tree.ids[p], []))
+        self.everyone = Bitset.span(0, len(self.userids))
+
+        self.subtree = list(self.direct)
+        for p in reversed(tree.order):
+            for c in tree.child_index[tree.child_offsets[p]:tree.child_offsets[p + 1]]:
+                self.subtree[p] = self.subtree[p] | self.subtree[c]
+
+        self.role_sets, self.group_sets = {}, {}
+        for role_id, role in self.roles.roles.items():
+            self.role_sets[role_id] = Bitset.of(self._number(u) for u in self.roles.members.get(role_id, {}))
+            group = self.group_sets.get(role["groupId"], Bitset())
+            self.group_sets[role["groupId"]] = group | self.role_sets[role_id]
+
+    def department(self, dept_id: int, include_sub_departments: bool = True) -> Bitset:
+        p = self.tree._position(dept_id)
+        return self.subtree[p] if include_sub_departments else self.direct[p]
+
+    def role(self, role_id: int) -> Bitset:
+        if role_id not in self.role_sets:
+            raise ValueError(f"Role {role_id} is not in the mirror")
+        return self.role_sets[role_id]
+
+    def group(self, group_id: int) -> Bitset:
+        if group_id not in self.group_sets:
+            raise ValueError(f"Role group {group_id} is not in the mirror")
+        return self.group_sets[group_id]
+
+    def evaluate(self, node: Any) -> Bitset:
+        """The users of a parsed set expression."""
+        kind = node[0]
+        if kind == "|":
+            return self.evaluate(node[1]) | self.evaluate(node[2])
+        if kind == "&":
+            return self.evaluate(node[1]) & self.evaluate(node[2])
+        if kind == "-":
+            return self.evaluate(node[1]) - self.evaluate(node[2])
+        if kind == "all":
+            return self.everyone
+        if kind in ("dept", "direct"):
+            return self.department(node[1], kind == "dept")
+        return self.role(node[1]) if kind == "role" else self.group(node[1])
+
+    def contains(self, users: Bitset, userid: str) -> bool:
+        i = self.index.get(userid)
+        return i is not None and i in users
+
+    def members(self, users: Bitset, offset: int = 0, size: int | None = None) -> list[str]:
+        """Userids in `users`, in user index order."""
+        result = []
+        for n, i in enumerate(users):
+            if n < offset:
+                continue
+            if size is not None and len(result) >= size:
+                break
+            result.append(self.userids[i])
+        return result
+
+    def nbytes(self) -> int:
+        """Approximate size of all bitsets."""
+        return sum(s.nbytes() for sets in (self.direct, self.subtree, self.role_sets.values(),
+                                            self.group_sets.values()) for s in sets)
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json as JSON
+import logging
+import time
+from typing import Any
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+from dingtalk.mirror.crawler import USER_PAGE
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at REAL NOT NULL,
+    root_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS snapshot_departments (
+    snapshot INTEGER NOT NULL,
+    dept_id INTEGER NOT NULL,
+    parent_id INTEGER,
+    meta_hash TEXT NOT NULL,
+    members TEXT NOT NULL,
+    subtree_hash TEXT NOT NULL,
+    PRIMARY KEY (snapshot, dept_id)
+);
+"""
+
+# Snapshots kept in the store.
+KEEP = 5
+
+def digest(*parts: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+class Snapshots:
+    """
+    Merkle hashes of the mirrored department tree, kept as snapshots.
+
+    A department's content hash covers its record and its member ids; its
+    subtree hash covers its content hash and the subtree hashes of its
+    children, so two snapshots with the same subtree hash for a department
+    agree on everything below it and a diff skips the whole subtree.
+    """
+
+    def __init__(self, store: MirrorStore, tree: DepartmentTree):
+        self.store = store
+        self.tree = tree
+        store.db.executescript(SCHEMA)
+
+    def hashes(self) -> dict[int, tuple[int | None, str, list[str], str]]:
+        """(parent_id, meta hash, member ids, subtree hash) of every mirrored department."""
+        tree = self.tree
+        tree.refresh(self.store)
+        records = dict(self.store.departments_since())
+        members = self.store.department_members()
+        subtree = [""] * len(tree)
+        result = {}
+        # Reversed pre-order visits children before their parent.
+        for p in reversed(tree.order):
+            dept_id = tree.ids[p]
+            meta = digest(JSON.dumps(records.get(dept_id), sort_keys=True, ensure_ascii=False))
+            dept_members = members.get(dept_id, [])
+            children = tree.child_index[tree.child_offsets[p]:tree.child_offsets[p + 1]]
+            subtree[p] = digest(digest(meta, *dept_members), *(f"{tree.ids[c]}:{subtree[c]}" for c in children))
+            result[dept_id] = (tree.parent_id(dept_id), meta, dept_members, subtree[p])
+        return result
+
+    def take(self) -> dict[str, Any]:
+        """Snapshot the mirror's hashes, returns the snapshot id and root hash."""
+        hashes = self.hashes()
+        root = hashes.get(1)
+        with self.store.db:
+            snapshot = self.store.db.execute(
+                "INSERT INTO snapshots (taken_at, root_hash) VALUES (?, ?)",
+                (time.time(), root[3] if root else None),
+            ).lastrowid
+            self.store.db.executemany(
+                "INSERT INTO snapshot_departments VALUES (?, ?, ?, ?, ?, ?)",
+                [(snapshot, d, parent, meta, JSON.dumps(members), sub)
+                 for d, (parent, meta, members, sub) in hashes.items()],
+            )
+            self.store.db.execute(
+                "DELETE FROM snapshot_departments WHERE snapshot <= ?", (snapshot - KEEP,))
+            self.store.db.execute("DELETE FROM snapshots WHERE snapshot <= ?", (snapshot - KEEP,))
+        return {"snapshot": snapshot, "root_hash": root[3] if root else None, "departments": len(hashes)}
+
+    def history(self) -> list[dict[str, Any]]:
+        rows = self.store.db.execute("SELECT snapshot, taken_at, root_hash FROM snapshots ORDER BY snapshot")
+        return [dict(r) for r in rows]
+
+    def _load(self, snapshot: int) -> dict[int, tuple]:
+        rows = self.store.db.execute(
+            "SELECT dept_id, parent_id, meta_hash, members, subtree_hash FROM snapshot_departments WHERE snapshot = ?",
+            (snapshot,),
+        )
+        departments = {r[0]: tuple(r)[1:] for r in rows}
+        if not departments:
+            raise ValueError(f"Snapshot {snapshot} does not exist")
+        return departments
+
+    def diff(self, old_snapshot: int, new_snapshot: int) -> dict[str, Any]:
+        """
+        What changed between two snapshots: departments added, removed,
+        moved or with a changed record, and members added to or removed from
+        each department. Unchanged subtrees are skipped without reading them.
+        """
+        old, new = self._load(old_snapshot), self._load(new_snapshot)
+        children: dict[int, list[int]] = {}
+        for snapshot in (old, new):
+            for d, row in snapshot.items():
+                children.setdefault(row[0], []).append(d)
+        result = {
+            "from": old_snapshot, "to": new_snapshot,
+            "added": [], "removed": [], "moved": [], "changed": [], "members": [],
+            "unchanged_subtrees": 0,
+        }
+        stack = sorted({d for s in (old, new) for d, row in s.items() if row[0] not in s}, reverse=True)
+        visited = set()
+        while stack:
+            d = stack.pop()
+            if d in visited:
+                continue
+            visited.add(d)
+            o, n = old.get(d), new.get(d)
+            if o and n and o[0] == n[0] and o[3] == n[3]:
+                result["unchanged_subtrees"] += 1
+                continue
+            if o is None:
+                result["added"].append(d)
+            elif n is None:
+                result["removed"].append(d)
+            else:
+                if o[0] != n[0]:
+                    result["moved"].append({"dept_id": d, "from": o[0], "to": n[0]})
+                if o[1] != n[1]:
+                    result["changed"].append(d)
+            before = set(JSON.loads(o[2])) if o else set()
+            after = set(JSON.loads(n[2])) if n else set()
+            if before != after:
+                result["members"].append({"dept_id": d, "added": sorted(after - before),
+                                          "removed": sorted(before - after)})
+            stack.extend(sorted(children.get(d, []), reverse=True))
+        return result
+
+class Verifier:
+    """
+    Checks the mirror against the live organization with cheap probes.
+
+    Every department under the root is probed for its member and
+    sub-department ids (one `listid` and one `listsubid` call); only where
+    those differ from the mirror are the member pages or sub-departments
+    fetched again. Dingtalk has no probe covering a whole subtree, so each
+    department is still probed; the Merkle snapshot taken afterwards is
+    what lets the resulting diff skip unchanged subtrees.
+    """
+
+    def __init__(self, contacts: DingtalkContactsServer, store: MirrorStore, snapshots: Snapshots,
+                 concurrency: int = 8, page_size: int = USER_PAGE):
+        self.logger = logging.getLogger(__name__)
+        self.contacts = contacts
+        self.store = store
+        self.snapshots = snapshots
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.root = 1
+        self.probed: list[int] = []
+        self.refetched_members: list[int] = []
+        self.refetched_departments: list[int] = []
+        self.removed_departments: list[int] = []
+        self.calls = 0
+        self.clock_started = 0.0
+
+    def report(self) -> dict[str, Any]:
+        elapsed = time.monotonic() - self.clock_started if self.clock_started else 0
+        return {
+            "root": self.root,
+            "probed": len(self.probed),
+            "refetched_members": self.refetched_members,
+            "refetched_departments": self.refetched_departments,
+            "removed_departments": self.removed_departments,
+            "calls": self.calls,
+            "seconds": round(elapsed, 3),
+        }
+
+    async def run(self, root: int = 1) -> dict[str, Any]:
+        """Verify the mirror under `root`, then snapshot it and diff against the previous snapshot."""
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            self.root = root
+            self.clock_started = time.monotonic()
+            started = time.time()
+            previous = self.snapshots.history()
+            await self._visit(root, asyncio.Semaphore(self.concurrency))
+            self.store.mark_crawled(self.probed, started)
+            snapshot = self.snapshots.take()
+            report = {**self.report(), **snapshot}
+            if previous:
+                report["diff"] = self.snapshots.diff(previous[-1]["snapshot"], snapshot["snapshot"])
+            self.logger.info(f"Verification of department {root} finished: {self.report()}")
+            return report
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+
+    async def _call(self, call):
+        self.calls += 1
+        return await call
+
+    async def _visit(self, dept_id: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            members = await self._call(self.contacts.get_department_user_id_list(dept_id))
+            sub_ids = (await self._call(self.contacts.get_sub_department_ids(dept_id)) or {}).get("dept_id_list") or []
+            self.probed.append(dept_id)
+
+            if set(members.get("userid_list") or []) != set(self.store.department_user_ids(dept_id)):
+                users, cursor = [], 0
+                while True:
+                    page = await self._call(self.contacts.get_department_user_details(dept_id, cursor, self.page_size))
+                    users.extend(page.get("list") or [])
+                    if not page.get("has_more"):
+                        break
+                    cursor = page["next_cursor"]
+                self.store.save_department_users(dept_id, users)
+                self.refetched_members.append(dept_id)
+
+            mirrored = set(self.store.sub_department_ids(dept_id))
+            if set(sub_ids) != mirrored:
+                subs = await self._call(self.contacts.get_department_list_old(dept_id=dept_id)) or []
+                self.store.save_sub_departments(dept_id, subs)
+                gone = sorted(mirrored - {d["dept_id"] for d in subs})
+                self.store.remove_departments(gone)
+                self.removed_departments.extend(gone)
+                self.refetched_departments.append(dept_id)
+
+        # New sub-departments have no mirrored members or children, so their
+        # probes differ and they are fetched like any changed department.
+        await asyncio.gather(*(self._visit(d, semaphore) for d in sub_ids))
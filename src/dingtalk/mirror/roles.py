@@ -0,0 +1,179 @@
+import asyncio
+import json as JSON
+import logging
+import time
+from collections import defaultdict
+from typing import Any
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+from dingtalk.mirror.store import OAPI, MirrorStore
+from dingtalk.pagination import max_page_size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roles (
+    role_id INTEGER PRIMARY KEY,
+    name TEXT,
+    group_id INTEGER,
+    group_name TEXT,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS role_members (
+    role_id INTEGER NOT NULL,
+    userid TEXT NOT NULL,
+    name TEXT,
+    scopes TEXT,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (role_id, userid)
+);
+CREATE INDEX IF NOT EXISTS role_members_user ON role_members(userid);
+"""
+
+SYNC_KEY = "roles_synced"
+
+ROLE_PAGE = max_page_size(f"{OAPI}/topapi/role/list")
+MEMBER_PAGE = max_page_size(f"{OAPI}/topapi/role/simplelist")
+
+class RoleIndex:
+    """
+    Mirrored role groups, roles and role members, with forward (role ->
+    members) and reverse (user -> roles) indexes held in memory and
+    persisted in the mirror's database.
+
+    A refresh pages role/list once and role/simplelist per role; while the
+    last refresh is younger than the store's `max_age`, those endpoints are
+    answered from the index.
+    """
+
+    def __init__(self, store: MirrorStore):
+        self.logger = logging.getLogger(__name__)
+        self.store = store
+        store.db.executescript(SCHEMA)
+        self.roles: dict[int, dict[str, Any]] = {}
+        # role_id -> userid -> {"userid", "name", "manageScopes"}, in API order
+        self.members: dict[int, dict[str, dict[str, Any]]] = {}
+        self.user_roles: dict[str, list[int]] = {}
+        self._load()
+        store.readers.update({
+            f"{OAPI}/topapi/role/list": self._answer_role_list,
+            f"{OAPI}/topapi/role/simplelist": self._answer_simplelist,
+        })
+
+    def _load(self):
+        rows = self.store.db.execute("SELECT role_id, name, group_id, group_name FROM roles ORDER BY seq")
+        roles = {r[0]: {"id": r[0], "name": r[1], "groupId": r[2], "groupName": r[3]} for r in rows}
+        members: dict[int, dict[str, dict[str, Any]]] = {role_id: {} for role_id in roles}
+        for role_id, userid, name, scopes in self.store.db.execute(
+                "SELECT role_id, userid, name, scopes FROM role_members ORDER BY role_id, seq"):
+            member = {"userid": userid, "name": name}
+            if scopes is not None:
+                member["manageScopes"] = JSON.loads(scopes)
+            members.setdefault(role_id, {})[userid] = member
+        self._index(roles, members)
+
+    def _index(self, roles: dict[int, dict[str, Any]], members: dict[int, dict[str, dict[str, Any]]]):
+        user_roles: dict[str, list[int]] = defaultdict(list)
+        for role_id, role_members in members.items():
+            for userid in role_members:
+                user_roles[userid].append(role_id)
+        self.roles, self.members, self.user_roles = roles, members, dict(user_roles)
+
+    def synced_at(self) -> float | None:
+        return self.store.get_meta(SYNC_KEY)
+
+    def save(self, roles: list[dict[str, Any]], members: dict[int, list[dict[str, Any]]]):
+        """Replace the mirrored roles and members."""
+        with self.store.db:
+            self.store.db.execute("DELETE FROM roles")
+            self.store.db.execute("DELETE FROM role_members")
+            self.store.db.executemany(
+                "INSERT INTO roles VALUES (?, ?, ?, ?, ?)",
+                [(r["id"], r.get("name"), r.get("groupId"), r.get("groupName"), i) for i, r in enumerate(roles)],
+            )
+            self.store.db.executemany(
+                "INSERT OR REPLACE INTO role_members VALUES (?, ?, ?, ?, ?)",
+                [(role_id, m["userid"], m.get("name"),
+                  JSON.dumps(m["manageScopes"], ensure_ascii=False) if "manageScopes" in m else None, i)
+                 for role_id, role_members in members.items() for i, m in enumerate(role_members)],
+            )
+        self.store.set_meta(SYNC_KEY, time.time())
+        self._index({r["id"]: r for r in roles},
+                    {role_id: {m["userid"]: m for m in role_members} for role_id, role_members in members.items()})
+
+    async def refresh(self, contacts: DingtalkContactsServer, concurrency: int = 8) -> dict[str, Any]:
+        """Mirror every role group, role and role member from the live API."""
+        started = time.monotonic()
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            roles, offset = [], 0
+            while True:
+                page = await contacts.get_role_list(ROLE_PAGE, offset)
+                for group in page.get("list") or []:
+                    roles.extend({**role, "groupId": group.get("groupId"), "groupName": group.get("name")}
+                                 for role in group.get("roles") or [])
+                if not page.get("hasMore"):
+                    break
+                offset += ROLE_PAGE
+
+            semaphore = asyncio.Semaphore(concurrency)
+            members: dict[int, list[dict[str, Any]]] = {}
+
+            async def fetch(role_id: int):
+                async with semaphore:
+                    role_members, offset = [], 0
+                    while True:
+                        page = await contacts.get_employee_list_by_role(role_id, MEMBER_PAGE, offset)
+                        role_members.extend(page.get("list") or [])
+                        if not page.get("hasMore"):
+                            break
+                        offset = page.get("nextCursor") or offset + MEMBER_PAGE
+                    members[role_id] = role_members
+
+            await asyncio.gather(*(fetch(r["id"]) for r in roles))
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+        self.save(roles, {r["id"]: members[r["id"]] for r in roles})
+        report = {
+            "roles": len(roles),
+            "assignments": sum(len(m) for m in members.values()),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        self.logger.info(f"Role refresh finished: {report}")
+        return report
+
+    def roles_of(self, userid: str) -> list[dict[str, Any]]:
+        """The roles `userid` holds, with the departments each is scoped to."""
+        return [
+            {**self.roles[role_id], **({"manageScopes": m["manageScopes"]} if "manageScopes" in m else {})}
+            for role_id in self.user_roles.get(userid, [])
+            for m in (self.members[role_id][userid],)
+        ]
+
+    def members_of(self, role_id: int) -> list[dict[str, Any]]:
+        if role_id not in self.roles:
+            raise ValueError(f"Role {role_id} is not in the mirror")
+        return list(self.members.get(role_id, {}).values())
+
+    def _answer_role_list(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.synced_at()):
+            return None
+        groups: dict[Any, dict[str, Any]] = {}
+        for role in self.roles.values():
+            group = groups.setdefault(role["groupId"], {"groupId": role["groupId"], "name": role["groupName"], "roles": []})
+            group["roles"].append({"id": role["id"], "name": role["name"]})
+        offset, size = int(payload.get("offset") or 0), int(payload.get("size") or 20)
+        groups = list(groups.values())
+        return {"hasMore": offset + size < len(groups), "list": groups[offset:offset + size]}
+
+    def _answer_simplelist(self, payload: dict[str, Any]) -> Any:
+        role_id = int(payload["role_id"])
+        if not self.store.is_fresh(self.synced_at()) or role_id not in self.roles:
+            return None
+        offset, size = int(payload.get("offset") or 0), int(payload.get("size") or 20)
+        members = self.members_of(role_id)
+        page = {"hasMore": offset + size < len(members), "list": members[offset:offset + size]}
+        if page["hasMore"]:
+            page["nextCursor"] = offset + size
+        return page
@@ -0,0 +1,137 @@
+import time
+from array import array
+from collections import Counter
+from itertools import accumulate
+from typing import Any
+
+from dingtalk.mirror.columns import NONE, UserColumns
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+# Hire date buckets, by years since hiring.
+HIRE_BUCKETS = [(1, "<1y"), (3, "1-3y"), (5, "3-5y"), (10, "5-10y"), (float("inf"), "10y+")]
+HIRE_UNKNOWN = "unknown"
+
+# Titles outside the most common ones are counted together.
+TITLE_LIMIT = 50
+OTHER_TITLES = "其他"
+NO_TITLE = "未设置"
+
+YEAR = 365.25 * 24 * 3600
+
+def hire_bucket(hired_date: Any, now: float) -> str:
+    """The bucket of a `hired_date` in milliseconds, as in user records."""
+    if not isinstance(hired_date, (int, float)) or hired_date <= 0:
+        return HIRE_UNKNOWN
+    years = (now - hired_date / 1000) / YEAR
+    return next(label for limit, label in HIRE_BUCKETS if years < limit)
+
+class Rollups:
+    """
+    Headcount and attribute counts for every department's subtree.
+
+    Each counted attribute value is a column holding, per department in the
+    tree's pre-order, the department's own members with that value. As every
+    subtree is a contiguous pre-order range, one prefix sum over a column
+    gives all subtree totals of that value at once, with two lookups per
+    department. Users in several departments of a subtree count once: their
+    extra memberships are cancelled by corrections on the departments where
+    their ancestor chains meet.
+
+    Columns are rebuilt when the mirror changes and cached per mirror
+    version otherwise.
+    """
+
+    def __init__(self, store: MirrorStore, tree: DepartmentTree):
+        self.store = store
+        self.tree = tree
+        self.version: tuple | None = None
+        self.computed_at = 0.0
+        self.columns: list[str] = []
+        # column -> prefix sums over pre-order, len(tree) + 1 entries
+        self.totals: dict[str, array] = {}
+        self.direct = array("q")
+
+    def refresh(self) -> bool:
+        """Recompute the rollups if the mirror changed since. Returns whether it did."""
+        self.tree.refresh(self.store)
+        version = (self.store.department_version(), self.store.user_version(), self.store.membership_count())
+        if version == self.version:
+            return False
+        users = UserColumns()
+        users.extend(self.store.memberships())
+        self.compute(users)
+        self.version = version
+        return True
+
+    def compute(self, users: UserColumns):
+        """Build the columns from mirrored users and their departments."""
+        tree, now = self.tree, time.time()
+        n = len(tree)
+        title_column = users.interned["title"]
+        titles: Counter[str] = Counter()
+        for code, count in Counter(title_column.codes).items():
+            titles[(title_column.values[code] if code != NONE else None) or NO_TITLE] += count
+        common = {t for t, _ in titles.most_common(TITLE_LIMIT)}
+        self.columns = ["headcount", "active", "inactive",
+                        *(f"hired:{label}" for _, label in HIRE_BUCKETS), f"hired:{HIRE_UNKNOWN}",
+                        *(f"title:{t}" for t in sorted(common)), f"title:{OTHER_TITLES}"]
+        direct = {c: array("q", bytes(8 * n)) for c in self.columns}
+        self.direct = array("q", bytes(8 * n))
+
+        active, hired = users.flags["active"], users.integers["hired_date"]
+        for i in range(len(users)):
+            positions = [tree.positions[d] for d in users.departments(i) if d in tree.positions]
+            if not positions:
+                continue
+            title = title_column[i] or NO_TITLE
+            columns = [direct["headcount"],
+                       direct["inactive" if active[i] == 0 else "active"],
+                       direct[f"hired:{hire_bucket(hired[i], now)}"],
+                       direct[f"title:{title if title in common else OTHER_TITLES}"]]
+            for p in positions:
+                self.direct[p] += 1
+                for column in columns:
+                    column[tree.start[p]] += 1
+            if len(positions) > 1:
+                for p, delta in self._corrections(positions).items():
+                    for column in columns:
+                        column[tree.start[p]] += delta
+
+        self.totals = {c: array("q", accumulate(column, initial=0)) for c, column in direct.items()}
+        self.computed_at = now
+
+    def _corrections(self, positions: list[int]) -> dict[int, int]:
+        """
+        Adjustments making a user in departments `positions` count once in
+        every subtree containing any of them: a subtree holding c of them
+        gets 1 - c in total, spread so that it telescopes up the tree.
+        """
+        count: Counter[int] = Counter()
+        for p in positions:
+            while p >= 0:
+                count[p] += 1
+                p = self.tree.parent[p]
+        corrections = {p: 1 - c for p, c in count.items()}
+        for p, c in count.items():
+            parent = self.tree.parent[p]
+            if parent >= 0:
+                corrections[parent] -= 1 - c
+        return {p: d for p, d in corrections.items() if d}
+
+    def rollup(self, dept_id: int) -> dict[str, Any]:
+        """Counts over the subtree of `dept_id`."""
+        p = self.tree._position(dept_id)
+        lo, hi = self.tree.start[p], self.tree.start[p] + self.tree.size[p]
+        counts = {c: self.totals[c][hi] - self.totals[c][lo] for c in self.columns}
+        return {
+            "dept_id": dept_id,
+            "headcount": counts["headcount"],
+            "direct_headcount": self.direct[p],
+            "sub_departments": self.tree.size[p] - 1,
+            "active": counts["active"],
+            "inactive": counts["inactive"],
+            "hired": {c.split(":", 1)[1]: v for c, v in counts.items() if c.startswith("hired:") and v},
+            "titles": dict(sorted(((c.split(":", 1)[1], v) for c, v in counts.items() if c.startswith("title:") and v),
+                                  key=lambda item: -item[1])),
+        }
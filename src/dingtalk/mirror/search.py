@@ -0,0 +1,257 @@
+import math
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Hashable, Iterable
+
+from dingtalk.mirror.store import MirrorStore
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+MODES = ["fuzzy", "prefix", "exact"]
+
+# Field kinds: names are matched exactly, by prefix and fuzzily and also
+# get pinyin keys; codes (job numbers) and text (titles) are matched exactly
+# and by prefix.
+NAME, CODE, TEXT = "name", "code", "text"
+
+# Scores per match kind; the field weight is added on top.
+EXACT_SCORE, PREFIX_SCORE, FUZZY_SCORE = 3.0, 2.0, 1.0
+
+# Keys scanned for prefix matches per requested result, so one-letter
+# queries stay fast; among very many prefix matches, ranking is approximate.
+PREFIX_SCAN_PER_RESULT = 10
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold().strip()
+
+def _has_cjk(text: str) -> bool:
+    return any("一" <= c <= "鿿" for c in text)
+
+def pinyin_keys(text: str) -> list[str]:
+    """Full pinyin and initials of `text`, e.g. 张三 -> zhangsan, zs; empty without pypinyin."""
+    if lazy_pinyin is None or not _has_cjk(text):
+        return []
+    full = "".join(lazy_pinyin(text))
+    initials = "".join(lazy_pinyin(text, style=Style.FIRST_LETTER))
+    return [normalize(full), normalize(initials)]
+
+def grams(key: str) -> set[str]:
+    """Character bigrams of `key` with boundary markers."""
+    padded = f"^{key}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+class SearchIndex:
+    """
+    Offline search over mirrored records.
+
+    Every record contributes normalized keys per field: the value itself,
+    its words and, for name fields, its pinyin. Keys are held in one sorted
+    list, so exact and prefix lookups are binary searches; name keys are
+    also indexed by character bigram for fuzzy matching, ranked by the Dice
+    overlap of their bigrams with the query's.
+
+    `fields` maps record fields to (kind, weight), e.g.
+    `{"name": (NAME, 0.5), "job_number": (CODE, 0.3), "title": (TEXT, 0)}`.
+    """
+
+    def __init__(self, fields: dict[str, tuple[str, float]]):
+        self.fields = fields
+        self.doc_keys: dict[Hashable, list[tuple[str, str]]] = {}
+        self.dirty = True
+        self.keys: list[str] = []
+        self.postings: list[list[tuple[Hashable, str]]] = []
+        self.gram_postings: dict[str, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_keys)
+
+    def set(self, doc: Hashable, record: dict[str, Any]):
+        keys = []
+        for field, (kind, _) in self.fields.items():
+            value = record.get(field)
+            if not isinstance(value, str) or not value.strip():
+                continue
+            key = normalize(value)
+            keys.append((key, field))
+            if " " in key:
+                keys.extend((word, field) for word in key.split())
+                keys.append((key.replace(" ", ""), field))
+            if kind == NAME:
+                keys.extend((k, field) for k in pinyin_keys(value))
+        self.doc_keys[doc] = list(dict.fromkeys(keys))
+        self.dirty = True
+
+    def remove(self, doc: Hashable):
+        if self.doc_keys.pop(doc, None) is not None:
+            self.dirty = True
+
+    def retain(self, docs: Iterable[Hashable]):
+        """Drop every record not in `docs`."""
+        keep = set(docs)
+        for doc in [d for d in self.doc_keys if d not in keep]:
+            self.remove(doc)
+
+    def build(self):
+        if not self.dirty:
+            return
+        by_key: dict[str, list[tuple[Hashable, str]]] = defaultdict(list)
+        for doc, keys in self.doc_keys.items():
+            for key, field in keys:
+                by_key[key].append((doc, field))
+        self.keys = sorted(by_key)
+        # Heavier fields first, so truncated postings keep the best matches.
+        self.postings = [sorted(by_key[k], key=lambda p: -self.fields[p[1]][1]) for k in self.keys]
+        gram_postings: dict[str, list[int]] = defaultdict(list)
+        for i, (key, posting) in enumerate(zip(self.keys, self.postings)):
+            if any(self.fields[field][0] == NAME for _, field in posting):
+                for gram in grams(key):
+                    gram_postings[gram].append(i)
+        self.gram_postings = dict(gram_postings)
+        self.dirty = False
+
+    def _add(self, scores: dict, i: int, score: float, limit: int, name_only: bool = False) -> tuple[int, bool]:
+        """
+        Score the records of key `i`, at most `limit` of them. Returns how
+        many were scored and whether some were left out.
+        """
+        added = 0
+        for doc, field in self.postings[i]:
+            kind, weight = self.fields[field]
+            if name_only and kind != NAME:
+                continue
+            if added == limit:
+                return added, True
+            added += 1
+            total = score + weight
+            if total > scores.get(doc, (0, None))[0]:
+                scores[doc] = (total, field)
+        return added, False
+
+    def search(self, query: str, mode: str = "fuzzy", name_only: bool = False, limit: int = 20,
+               threshold: float = 0.5) -> tuple[list[tuple[Hashable, float, str]], bool]:
+        """
+        The best `limit` records matching `query` as (doc, score, field),
+        together with whether there may be more.
+
+        "exact" matches whole keys only, "prefix" also keys starting with the
+        query, "fuzzy" also name keys sharing at least `threshold` of their
+        bigrams (Dice coefficient) with the query. `name_only` restricts
+        matches to name fields.
+
+        Exact matches outrank prefix matches, which outrank fuzzy ones, so
+        once `limit` records are found the weaker kinds aren't searched.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        self.build()
+        q = normalize(query)
+        if not q:
+            return [], False
+        scores: dict[Hashable, tuple[float, str]] = {}
+        more = False
+
+        i = bisect_left(self.keys, q)
+        if i < len(self.keys) and self.keys[i] == q:
+            more = self._add(scores, i, EXACT_SCORE, limit, name_only)[1]
+            i += 1
+
+        if mode != "exact" and len(scores) >= limit:
+            more = True
+        elif mode != "exact":
+            scan = max(limit * PREFIX_SCAN_PER_RESULT, 100)
+            closest = 0
+            for j in range(i, min(i + scan, len(self.keys))):
+                key = self.keys[j]
+                if not key.startswith(q):
+                    break
+                # Among prefix matches, keys closer in length to the query rank
+                # higher; once `limit` records match with a single extra
+                # character, longer keys can't make the cut.
+                added, truncated = self._add(scores, j, PREFIX_SCORE + len(q) / len(key) * 0.5, limit, name_only)
+                more |= truncated
+                if len(key) == len(q) + 1:
+                    closest += added
+                    if closest >= limit:
+                        more = True
+                        break
+            else:
+                more |= i + scan < len(self.keys) and self.keys[i + scan].startswith(q)
+
+        if mode == "fuzzy" and len(scores) >= limit:
+            more = True
+        elif mode == "fuzzy":
+            query_grams = grams(q)
+            # A key reaching the threshold shares at least `common` of the
+            # query's bigrams, so it shares one of any len - common + 1 of
+            # them: collecting candidates from the rarest ones is enough.
+            common = math.ceil(threshold * len(query_grams) / 2)
+            rarest = sorted(query_grams, key=lambda g: len(self.gram_postings.get(g, ())))
+            candidates = set()
+            for gram in rarest[:len(query_grams) - common + 1]:
+                candidates.update(self.gram_postings.get(gram, ()))
+            for j in candidates:
+                key = self.keys[j]
+                if key.startswith(q):
+                    continue
+                key_grams = grams(key)
+                dice = 2 * len(query_grams & key_grams) / (len(query_grams) + len(key_grams))
+                if dice >= threshold:
+                    more |= self._add(scores, j, FUZZY_SCORE + dice * 0.9, limit, True)[1]
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1][0], str(item[0])))
+        return [(doc, round(score, 3), field) for doc, (score, field) in ranked[:limit]], more or len(ranked) > limit
+
+USER_FIELDS = {
+    "name": (NAME, 0.5),
+    "nickname": (NAME, 0.4),
+    "job_number": (CODE, 0.3),
+    "title": (TEXT, 0.0),
+}
+
+DEPARTMENT_FIELDS = {
+    "name": (NAME, 0.5),
+}
+
+class MirrorSearch:
+    """
+    Search indexes over the users and departments of a MirrorStore,
+    refreshed with the records synced since the last refresh.
+    """
+
+    def __init__(self, store: MirrorStore):
+        self.store = store
+        self.users = SearchIndex(USER_FIELDS)
+        self.departments = SearchIndex(DEPARTMENT_FIELDS)
+        self.user_version: tuple[int, float] | None = None
+        self.department_version: tuple[int, float] | None = None
+
+    def refresh(self):
+        version = self.store.user_version()
+        if version != self.user_version:
+            for userid, record in self.store.users_since(self.user_version and self.user_version[1]):
+                self.users.set(userid, record)
+            if len(self.users) != version[0]:
+                self.users.retain(self.store.user_ids())
+            self.user_version = version
+        version = self.store.department_version()
+        if version != self.department_version:
+            for dept_id, record in self.store.departments_since(self.department_version and self.department_version[1]):
+                self.departments.set(dept_id, record)
+            if len(self.departments) != version[0]:
+                self.departments.retain(self.store.department_ids())
+            self.department_version = version
+
+    def search_users(self, query: str, mode: str = "fuzzy", offset: int = 0, size: int = 20,
+                     name_only: bool = False) -> dict[str, Any]:
+        self.refresh()
+        hits, more = self.users.search(query, mode, name_only, offset + size)
+        return {"hasMore": more, "list": hits[offset:offset + size]}
+
+    def search_departments(self, query: str, mode: str = "fuzzy", offset: int = 0, size: int = 20) -> dict[str, Any]:
+        self.refresh()
+        hits, more = self.departments.search(query, mode, False, offset + size)
+        return {"hasMore": more, "list": hits[offset:offset + size]}
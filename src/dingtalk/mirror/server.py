@@ -0,0 +1,1196 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+
+import mcp.types as types
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.mirror.crawler import Crawler
+from dingtalk.mirror.export import ENTITIES, FORMATS, Exporter, export_dir
+from dingtalk.mirror.external import DUPLICATE_KEYS, ExternalContactIndex
+from dingtalk.mirror.identity import KINDS, IdentityIndex
+from dingtalk.mirror.managers import ManagerGraph
+from dingtalk.mirror.mapped import MappedSnapshot, snapshot_path, write_snapshot
+from dingtalk.mirror.membership import MembershipSets, operand_kinds, parse_expression
+from dingtalk.mirror.merkle import Snapshots, Verifier
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.rollups import Rollups
+from dingtalk.mirror.search import MODES, MirrorSearch, SearchIndex
+from dingtalk.mirror.store import OAPI, MirrorStore
+from dingtalk.mirror.sync import IncrementalSync
+from dingtalk.mirror.tree import DepartmentTree
+
+# Seconds between role refreshes after a failure.
+ROLE_RETRY = 60
+
+class DingtalkMirrorServer:
+    """
+    Tools managing a tenant's local organization mirror.
+
+    The mirror is attached to the tenant's contacts server, which answers
+    department and user reads from it while it is fresh. The department
+    hierarchy is also kept in memory as a DepartmentTree, refreshed from the
+    store before each query, for ancestor and subtree lookups. After each
+    crawl the hierarchy is also written to a memory-mapped snapshot next to
+    the database, which a restarted server answers from until the tree is
+    loaded. Users and departments are indexed for offline search. An
+    IdentityIndex links the identifiers of each user, reading the snapshot
+    first for userids by mobile or unionid, and MembershipSets
+    answers set expressions over departments and roles. A ManagerGraph
+    holds the reporting lines. External contacts are mirrored on first use
+    and refreshed once stale.
+    """
+
+    def __init__(self, contacts: DingtalkContactsServer, store: MirrorStore):
+        self.logger = logging.getLogger(__name__)
+        self.contacts = contacts
+        self.store = store
+        self.crawler: Crawler | IncrementalSync | Verifier | None = None
+        self.crawl_task: asyncio.Task | None = None
+        self.last_crawl: dict[str, Any] | None = None
+        self.department_tree = DepartmentTree()
+        store.readers[f"{OAPI}/topapi/v2/department/listparentbydept"] = self._answer_parents_by_dept
+        store.readers[f"{OAPI}/topapi/v2/department/listparentbyuser"] = self._answer_parents_by_user
+        self.search = MirrorSearch(store)
+        store.readers["https://api.dingtalk.com/v1.0/contact/users/search"] = self._answer_search_users
+        store.readers["https://api.dingtalk.com/v1.0/contact/departments/search"] = self._answer_search_departments
+        self.identities = IdentityIndex(store, self._mapped_users)
+        self.snapshots = Snapshots(store, DepartmentTree())
+        self.rollups = Rollups(store, DepartmentTree())
+        self.roles = RoleIndex(store)
+        self.role_task: asyncio.Task | None = None
+        self.role_lock = asyncio.Lock()
+        self.last_role_refresh: dict[str, Any] | None = None
+        self.memberships = MembershipSets(store, DepartmentTree(), self.roles)
+        self.managers = ManagerGraph(store)
+        self.external = ExternalContactIndex(store)
+        self.external_lock = asyncio.Lock()
+        self.last_external_refresh: dict[str, Any] | None = None
+        self.mapped = self._open_mapped()
+        self.exporter: Exporter | None = None
+        self.export_task: asyncio.Task | None = None
+        self.last_export: dict[str, Any] | None = None
+        contacts.mirror = store
+
+    def tree(self) -> DepartmentTree | MappedSnapshot:
+        """
+        The department hierarchy: the mapped snapshot while it matches the
+        store, so a fresh process answers without loading the tree.
+        """
+        if self.mapped is not None and self.department_tree.version is None \
+                and self.mapped.version == self.store.department_version():
+            return self.mapped
+        self.department_tree.refresh(self.store)
+        return self.department_tree
+
+    def _mapped_users(self) -> MappedSnapshot | None:
+        """The mapped snapshot while it holds the store's current and fresh users."""
+        if self.mapped is not None and self.mapped.user_version == self.store.user_version() \
+                and self.store.is_fresh(self.mapped.user_version[1]):
+            return self.mapped
+        return None
+
+    def _open_mapped(self) -> MappedSnapshot | None:
+        path = snapshot_path(self.store)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            return MappedSnapshot(path)
+        except Exception as e:
+            self.logger.warning(f"Ignoring organization snapshot {path}: {e}")
+            return None
+
+    def _write_mapped(self):
+        """Rewrite the mapped snapshot after the mirror was updated."""
+        path = snapshot_path(self.store)
+        if path is None:
+            return
+        try:
+            self.last_crawl["mapped_snapshot"] = write_snapshot(self.store, path)
+        except Exception as e:
+            self.logger.error(f"Writing organization snapshot {path} failed: {e}")
+            return
+        if self.mapped is not None:
+            self.mapped.close()
+        self.mapped = self._open_mapped()
+
+    def _answer_parents_by_dept(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.store.last_synced()) or payload["dept_id"] not in self.tree():
+            return None
+        return {"parent_id_list": self.tree().ancestors(payload["dept_id"])}
+
+    def _answer_parents_by_user(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.store.last_synced()):
+            return None
+        dept_ids = self.store.user_department_ids(payload["userid"])
+        if not dept_ids:
+            return None
+        return {"parent_list": [{"parent_dept_id_list": self.tree().ancestors(d)} for d in dept_ids]}
+
+    async def _crawl(self, dept_id: int, resume: bool) -> dict[str, Any]:
+        try:
+            self.last_crawl = await self.crawler.run(dept_id, resume)
+            self._write_mapped()
+        except Exception as e:
+            self.logger.error(f"Mirror crawl of department {dept_id} failed: {e}")
+            self.last_crawl = {**self.crawler.report(), "error": str(e)}
+        return self.last_crawl
+
+    async def _sync(self, *args) -> dict[str, Any]:
+        try:
+            self.last_crawl = await self.crawler.run(*args)
+            self._write_mapped()
+        except Exception as e:
+            self.logger.error(f"Mirror {type(self.crawler).__name__} run failed: {e}")
+            self.last_crawl = {**self.crawler.report(), "error": str(e)}
+        return self.last_crawl
+
+    async def _refresh_roles(self, force: bool = False) -> dict[str, Any] | None:
+        async with self.role_lock:
+            synced_at = self.roles.synced_at()
+            if not force and synced_at is not None and time.time() - synced_at < self.store.max_age / 2:
+                return None
+            try:
+                self.last_role_refresh = await self.roles.refresh(self.contacts)
+            except Exception as e:
+                self.logger.error(f"Role refresh failed: {e}")
+                self.last_role_refresh = {"error": str(e)}
+            return self.last_role_refresh
+
+    async def _refresh_roles_periodically(self):
+        # Roles are refreshed at half the mirror's max age, so reads keep
+        # being answered from the index.
+        while True:
+            await self._refresh_roles()
+            synced_at = self.roles.synced_at() or 0
+            await asyncio.sleep(max(synced_at + self.store.max_age / 2 - time.time(), ROLE_RETRY))
+
+    def _start_role_refresh(self):
+        if self.role_task is None or self.role_task.done():
+            self.role_task = asyncio.create_task(self._refresh_roles_periodically())
+
+    async def _role_index(self) -> RoleIndex:
+        """The role index, refreshed in the background from the first use on."""
+        self._start_role_refresh()
+        if self.roles.synced_at() is None:
+            await self._refresh_roles()
+            if self.roles.synced_at() is None:
+                raise Exception(f"Role refresh failed: {self.last_role_refresh['error']}")
+        return self.roles
+
+    async def _refresh_external(self, force: bool = False) -> dict[str, Any] | None:
+        async with self.external_lock:
+            if not force and self.store.is_fresh(self.external.synced_at()):
+                return None
+            try:
+                self.last_external_refresh = await self.external.refresh(self.contacts)
+            except Exception as e:
+                self.logger.error(f"External contact refresh failed: {e}")
+                self.last_external_refresh = {"error": str(e)}
+            return self.last_external_refresh
+
+    async def _external_index(self) -> ExternalContactIndex:
+        """The external contact index, refreshed first if it is older than the mirror's max age."""
+        await self._refresh_external()
+        if self.external.synced_at() is None:
+            raise Exception(f"External contact refresh failed: {self.last_external_refresh['error']}")
+        return self.external
+
+    def _answer_search_users(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.store.last_synced()):
+            return None
+        self.search.refresh()
+        exact = payload.get("fullMatchField") == 1
+        offset, size = int(payload.get("offset") or 0), int(payload.get("size") or 10)
+        return self._search_page(self.search.users, payload["queryWord"], "exact" if exact else "fuzzy", exact,
+                                 offset, size)
+
+    def _answer_search_departments(self, payload: dict[str, Any]) -> Any:
+        if not self.store.is_fresh(self.store.last_synced()):
+            return None
+        self.search.refresh()
+        offset, size = int(payload.get("offset") or 0), int(payload.get("size") or 10)
+        return self._search_page(self.search.departments, payload["queryWord"], "fuzzy", False, offset, size)
+
+    @staticmethod
+    def _search_page(index: SearchIndex, query: str, mode: str, name_only: bool, offset: int, size: int) -> Any:
+        """A search API page; totalCount counts every match, which takes a full search past the first page."""
+        hits, more = index.search(query, mode, name_only, offset + size)
+        total = len(index.search(query, mode, name_only, max(len(index), 1))[0]) if more else len(hits)
+        return {"hasMore": total > offset + size, "totalCount": total, "list": [doc for doc, _, _ in hits[offset:]]}
+
+    async def mirror_crawl(self, dept_id: int = 1, wait: bool = False, resume: bool = True,
+                           concurrency: int = 8) -> str:
+        """
+        同步组织架构到本地镜像.
+
+        args:
+            dept_id (int, optional): 从该部门开始同步，默认为根部门1，此时会删除镜像中已不存在的部门和用户。
+            wait (bool, optional): 是否等待同步完成后返回统计信息，默认为False，即在后台同步。
+            resume (bool, optional): 是否从上次中断的位置继续同步，默认为True。
+            concurrency (int, optional): 同时同步的部门数，默认为8。
+        """
+        if self.crawl_task is not None and not self.crawl_task.done():
+            raise Exception("A mirror crawl is already running")
+        self.crawler = Crawler(self.contacts, self.store, int(concurrency))
+        self.crawl_task = asyncio.create_task(self._crawl(int(dept_id), resume))
+        if wait:
+            return self.contacts.render(await self.crawl_task)
+        return self.contacts.render({"status": "started", "dept_id": int(dept_id)})
+
+    async def mirror_sync(self, wait: bool = False, concurrency: int = 8) -> str:
+        """
+        增量同步本地组织架构镜像.
+
+        args:
+            wait (bool, optional): 是否等待同步完成后返回统计信息，默认为False，即在后台同步。
+            concurrency (int, optional): 同时检查的部门数，默认为8。
+        """
+        if self.crawl_task is not None and not self.crawl_task.done():
+            raise Exception("A mirror crawl is already running")
+        self.crawler = IncrementalSync(self.contacts, self.store, int(concurrency))
+        self.crawl_task = asyncio.create_task(self._sync())
+        if wait:
+            return self.contacts.render(await self.crawl_task)
+        return self.contacts.render({"status": "started"})
+
+    async def mirror_verify(self, dept_id: int = 1, wait: bool = False, concurrency: int = 8) -> str:
+        """
+        校验本地组织架构镜像并生成快照.
+
+        args:
+            dept_id (int, optional): 校验该部门及其下级部门，默认为根部门1。
+            wait (bool, optional): 是否等待校验完成后返回统计信息和变化，默认为False，即在后台校验。
+            concurrency (int, optional): 同时校验的部门数，默认为8。
+        """
+        if self.crawl_task is not None and not self.crawl_task.done():
+            raise Exception("A mirror crawl is already running")
+        self.crawler = Verifier(self.contacts, self.store, self.snapshots, int(concurrency))
+        self.crawl_task = asyncio.create_task(self._sync(int(dept_id)))
+        if wait:
+            return self.contacts.render(await self.crawl_task)
+        return self.contacts.render({"status": "started", "dept_id": int(dept_id)})
+
+    async def mirror_snapshot(self) -> str:
+        """
+        为本地组织架构镜像生成快照.
+        """
+        return self.contacts.render({**self.snapshots.take(), "snapshots": self.snapshots.history()})
+
+    async def mirror_diff(self, from_snapshot: int = None, to_snapshot: int = None) -> str:
+        """
+        比较本地组织架构镜像的两个快照.
+
+        args:
+            from_snapshot (int, optional): 较早的快照ID，默认为倒数第二个快照。
+            to_snapshot (int, optional): 较晚的快照ID，默认为最新的快照。
+        """
+        history = [s["snapshot"] for s in self.snapshots.history()]
+        if from_snapshot is None and len(history) < 2:
+            raise ValueError("At least two mirror snapshots are needed for a diff")
+        return self.contacts.render(self.snapshots.diff(
+            int(from_snapshot) if from_snapshot is not None else history[-2],
+            int(to_snapshot) if to_snapshot is not None else history[-1],
+        ))
+
+    async def mirror_status(self) -> str:
+        """
+        查询本地组织架构镜像的状态.
+        """
+        return self.contacts.render({
+            **self.store.status(),
+            "crawling": self.crawl_task is not None and not self.crawl_task.done(),
+            "progress": self.crawler.report() if self.crawler else None,
+            "last_crawl": self.last_crawl,
+            "mapped_snapshot": {
+                "path": self.mapped.path,
+                "written_at": self.mapped.written_at,
+                "in_use": self.tree() is self.mapped,
+            } if self.mapped else None,
+            "roles_synced": self.roles.synced_at(),
+            "last_role_refresh": self.last_role_refresh,
+            "external_contacts": self.external.count(),
+            "external_contacts_synced": self.external.synced_at(),
+            "last_external_refresh": self.last_external_refresh,
+            "exporting": self.export_task is not None and not self.export_task.done(),
+            "export": self.exporter.report() if self.exporter else None,
+            "last_export": self.last_export,
+        })
+
+    async def mirror_department_ancestors(self, dept_id: int) -> str:
+        """
+        从本地镜像查询部门的层级信息.
+
+        args:
+            dept_id (int): 部门ID。
+        """
+        tree, dept_id = self.tree(), int(dept_id)
+        return self.contacts.render({
+            "dept_id": dept_id,
+            "parent_id": tree.parent_id(dept_id),
+            "depth": tree.depth_of(dept_id),
+            "parent_id_list": tree.ancestors(dept_id),
+            "sub_dept_id_list": tree.children(dept_id),
+        })
+
+    async def mirror_department_subtree(self, dept_id: int, max_depth: int = None) -> str:
+        """
+        从本地镜像查询部门及其所有下级部门的ID.
+
+        args:
+            dept_id (int): 部门ID。
+            max_depth (int, optional): 最多向下的层数，默认不限制。
+        """
+        dept_ids = self.tree().subtree(int(dept_id), int(max_depth) if max_depth is not None else None)
+        return self.contacts.render({"dept_id": int(dept_id), "count": len(dept_ids), "dept_id_list": dept_ids})
+
+    async def mirror_is_sub_department(self, dept_id: int, ancestor_id: int) -> str:
+        """
+        从本地镜像判断部门是否属于另一个部门（包括该部门本身）.
+
+        args:
+            dept_id (int): 要判断的部门ID。
+            ancestor_id (int): 上级部门ID。
+        """
+        tree = self.tree()
+        return self.contacts.render({
+            "result": tree.is_descendant(int(dept_id), int(ancestor_id)),
+            "depth": tree.depth_of(int(dept_id)),
+            "ancestor_depth": tree.depth_of(int(ancestor_id)),
+        })
+
+    async def mirror_common_ancestor(self, dept_ids: list) -> str:
+        """
+        从本地镜像查询多个部门最近的共同上级部门.
+
+        args:
+            dept_ids (list): 部门ID列表。
+        """
+        tree = self.tree()
+        dept_id = tree.lowest_common_ancestor([int(d) for d in dept_ids])
+        return self.contacts.render({
+            "dept_id": dept_id,
+            "parent_id_list": tree.ancestors(dept_id) if dept_id is not None else [],
+        })
+
+    async def mirror_user_departments(self, userid: str) -> str:
+        """
+        从本地镜像查询用户所在的部门及其所有上级部门.
+
+        args:
+            userid (str): 用户的userid。
+        """
+        tree = self.tree()
+        return self.contacts.render({
+            "userid": userid,
+            "parent_list": [
+                {"dept_id": d, "parent_dept_id_list": tree.ancestors(d)}
+                for d in self.store.user_department_ids(userid) if d in tree
+            ],
+        })
+
+    def _search_result(self, result: dict[str, Any], load) -> dict[str, Any]:
+        return {
+            "hasMore": result["hasMore"],
+            "list": [{**load(doc), "score": score, "matched_field": field} for doc, score, field in result["list"]],
+        }
+
+    async def mirror_search_users(self, queryWord: str, mode: str = "fuzzy", offset: int = 0, size: int = 20) -> str:
+        """
+        从本地镜像搜索用户.
+
+        args:
+            queryWord (str): 用户名称、拼音（需安装 pypinyin）、英文名、工号或职位。
+            mode (str, optional): 匹配方式，fuzzy（默认，包括精确、前缀和模糊匹配）、prefix 或 exact。
+            offset (int, optional): 跳过的结果数，默认为0。
+            size (int, optional): 返回的结果数，默认为20。
+        """
+        result = self.search.search_users(queryWord, mode, int(offset), int(size))
+        return self.contacts.render(self._search_result(result, self._user_summary))
+
+    async def mirror_search_departments(self, queryWord: str, mode: str = "fuzzy", offset: int = 0, size: int = 20) -> str:
+        """
+        从本地镜像搜索部门.
+
+        args:
+            queryWord (str): 部门名称或拼音（需安装 pypinyin）。
+            mode (str, optional): 匹配方式，fuzzy（默认，包括精确、前缀和模糊匹配）、prefix 或 exact。
+            offset (int, optional): 跳过的结果数，默认为0。
+            size (int, optional): 返回的结果数，默认为20。
+        """
+        result = self.search.search_departments(queryWord, mode, int(offset), int(size))
+        return self.contacts.render(self._search_result(result, self._department_summary))
+
+    async def mirror_resolve_identities(self, kind: str, values: list, targets: list = None,
+                                        fetch_missing: bool = False, max_concurrency: int = 10) -> str:
+        """
+        批量查询用户的各类标识.
+
+        args:
+            kind (str): 输入标识的类型，可选值：userid, mobile, unionid, original_unionid（迁移前的unionId）, dingid, original_dingid（迁移前的dingId）。
+            values (list): 标识列表，一次可传入数千个。
+            targets (list, optional): 需要的标识类型，默认为全部类型。
+            fetch_missing (bool, optional): 是否对本地没有的标识调用钉钉接口查询并记录，默认为False。
+            max_concurrency (int, optional): 调用钉钉接口的最大并发数，默认为10。
+        """
+        targets = [t for t in (targets or KINDS) if t != kind]
+        self.identities.load_users()
+        found = self.identities.resolve_many(kind, values)
+        errors: dict[str, str] = {}
+        fetched = 0
+        if fetch_missing:
+            missing = [v for v, ids in found.items() if any(t not in ids for t in targets)]
+            errors = await self.identities.fetch_missing(self.contacts, kind, missing, targets, int(max_concurrency))
+            fetched = len(missing)
+            found.update(self.identities.resolve_many(kind, missing))
+        items = []
+        for value, ids in found.items():
+            item = {"value": value, **{t: ids[t] for t in targets if t in ids}}
+            if missing := [t for t in targets if t not in ids]:
+                item["missing"] = missing
+            if value in errors:
+                item["error"] = errors[value]
+            items.append(item)
+        return self.contacts.render({
+            "resolved": sum(1 for i in items if "missing" not in i),
+            "fetched": fetched,
+            "list": items,
+        })
+
+    async def mirror_rollup(self, dept_id: int = 1, by_children: bool = False) -> str:
+        """
+        从本地镜像统计部门（含所有下级部门）的人数和人员构成.
+
+        args:
+            dept_id (int, optional): 部门ID，默认为根部门1。
+            by_children (bool, optional): 是否同时返回每个直属下级部门的统计，默认为False。
+        """
+        self.rollups.refresh()
+        result = self.rollups.rollup(int(dept_id))
+        if by_children:
+            result["children"] = sorted((self.rollups.rollup(d) for d in self.rollups.tree.children(int(dept_id))),
+                                        key=lambda r: -r["headcount"])
+        return self.contacts.render({**result, "computed_at": self.rollups.computed_at})
+
+    async def mirror_refresh_roles(self, wait: bool = True) -> str:
+        """
+        同步角色及角色成员到本地镜像.
+
+        args:
+            wait (bool, optional): 是否等待同步完成后返回统计信息，默认为True。
+        """
+        self._start_role_refresh()
+        task = asyncio.create_task(self._refresh_roles(force=True))
+        if wait:
+            return self.contacts.render(await task)
+        return self.contacts.render({"status": "started"})
+
+    async def mirror_user_roles(self, userid: str) -> str:
+        """
+        从本地镜像查询用户拥有的角色.
+
+        args:
+            userid (str): 用户的userid。
+        """
+        roles = await self._role_index()
+        return self.contacts.render({"userid": userid, "synced_at": roles.synced_at(), "roles": roles.roles_of(userid)})
+
+    async def mirror_role_members(self, role_id: int, dept_id: int = None, include_sub_departments: bool = True) -> str:
+        """
+        从本地镜像查询角色的成员.
+
+        args:
+            role_id (int): 角色ID。
+            dept_id (int, optional): 只返回属于该部门的成员，默认返回全部成员。
+            include_sub_departments (bool, optional): 指定部门时是否包括其下级部门的成员，默认为True。
+        """
+        roles = await self._role_index()
+        members = roles.members_of(int(role_id))
+        if dept_id is not None:
+            self.memberships.refresh()
+            in_dept = self.memberships.department(int(dept_id), include_sub_departments)
+            members = [m for m in members if self.memberships.contains(in_dept, m["userid"])]
+        return self.contacts.render({
+            **roles.roles[int(role_id)],
+            "synced_at": roles.synced_at(),
+            "count": len(members),
+            "list": members,
+        })
+
+    async def mirror_member_sets(self, expression: str, offset: int = 0, size: int = 100) -> str:
+        """
+        从本地镜像按集合运算查询部门、角色和角色组的成员.
+
+        args:
+            expression (str): 集合表达式，如 `dept:1 - role:123`、`(group:5 | role:7) & dept:2`。运算对象：dept:<部门ID>（含下级部门）、direct:<部门ID>（不含下级部门）、role:<角色ID>、group:<角色组ID>、all（镜像中的全部用户）；运算符：| 并集、& 交集、- 差集，- 优先于 &，& 优先于 |，可用括号。
+            offset (int, optional): 跳过的用户数，默认为0。
+            size (int, optional): 返回的用户数，默认为100，为0时只返回人数。
+        """
+        node = parse_expression(expression)
+        if operand_kinds(node) & {"role", "group"}:
+            await self._role_index()
+        self.memberships.refresh()
+        started = time.perf_counter()
+        users = self.memberships.evaluate(node)
+        count = len(users)
+        elapsed = time.perf_counter() - started
+        offset, size = int(offset), int(size)
+        return self.contacts.render({
+            "expression": expression,
+            "count": count,
+            "elapsed_us": round(elapsed * 1e6, 1),
+            "hasMore": offset + size < count,
+            "list": [self._user_summary(u) for u in self.memberships.members(users, offset, size)],
+        })
+
+    async def mirror_management_chain(self, userid: str) -> str:
+        """
+        从本地镜像查询用户的汇报链.
+
+        args:
+            userid (str): 用户的userid。
+        """
+        self.managers.refresh()
+        chain = self.managers.chain(userid)
+        return self.contacts.render({
+            "userid": userid,
+            **chain,
+            "chain": [self._user_summary(u) for u in chain["chain"]],
+        })
+
+    async def mirror_reports(self, userid: str, max_depth: int = None, offset: int = 0, size: int = 100) -> str:
+        """
+        从本地镜像查询直接和间接向用户汇报的所有人.
+
+        args:
+            userid (str): 主管的userid。
+            max_depth (int, optional): 最多向下的汇报层数，1为只返回直接下属，默认不限制。
+            offset (int, optional): 跳过的人数，默认为0。
+            size (int, optional): 返回的人数，默认为100。
+        """
+        self.managers.refresh()
+        reports = self.managers.reports(userid, int(max_depth) if max_depth is not None else None)
+        offset, size = int(offset), int(size)
+        return self.contacts.render({
+            "userid": userid,
+            "direct_reports": len(self.managers.direct_reports(userid)),
+            "count": len(reports),
+            "hasMore": offset + size < len(reports),
+            "list": [{**self._user_summary(u), "level": level} for u, level in reports[offset:offset + size]],
+        })
+
+    async def mirror_span_stats(self, userid: str = None, top: int = 10) -> str:
+        """
+        从本地镜像统计管理幅度.
+
+        args:
+            userid (str, optional): 只统计该主管及其所有下属，默认统计全部用户。
+            top (int, optional): 返回直接下属最多的主管数，默认为10。
+        """
+        self.managers.refresh()
+        return self.contacts.render(self.managers.span(userid, int(top)))
+
+    async def mirror_refresh_external_contacts(self) -> str:
+        """
+        同步外部联系人及标签到本地镜像.
+        """
+        return self.contacts.render(await self._refresh_external(force=True))
+
+    async def mirror_external_contacts(self, label_ids: list = None, follower_user_id: str = None,
+                                       company_name: str = None, mobile: str = None, state_code: str = "86",
+                                       name: str = None, offset: int = 0, size: int = 100) -> str:
+        """
+        从本地镜像查询外部联系人.
+
+        args:
+            label_ids (list, optional): 标签ID列表，只返回带有全部这些标签的联系人。
+            follower_user_id (str, optional): 负责人的userId。
+            company_name (str, optional): 企业名称。
+            mobile (str, optional): 手机号。
+            state_code (str, optional): 手机号国家码，默认为86。
+            name (str, optional): 姓名，忽略空格和大小写。
+            offset (int, optional): 跳过的联系人数，默认为0。
+            size (int, optional): 返回的联系人数，默认为100。
+        """
+        external = await self._external_index()
+        result = external.find(label_ids, follower_user_id, company_name, mobile, state_code, name,
+                               int(offset), int(size))
+        return self.contacts.render({**result, "synced_at": external.synced_at()})
+
+    async def mirror_external_contact_duplicates(self, by: str = "mobile") -> str:
+        """
+        从本地镜像查找重复的外部联系人.
+
+        args:
+            by (str, optional): 判断重复的字段，mobile（默认，手机号相同）或 name（姓名相同，忽略空格和大小写）。
+        """
+        external = await self._external_index()
+        groups = external.duplicates(by)
+        return self.contacts.render({"by": by, "groups": len(groups), "list": groups,
+                                     "synced_at": external.synced_at()})
+
+    async def _export(self, entities: list[str], resume: bool) -> dict[str, Any]:
+        try:
+            self.last_export = await self.exporter.run(entities, resume)
+        except Exception as e:
+            self.logger.error(f"Export to {self.exporter.directory} failed: {e}")
+            self.last_export = {**self.exporter.report(), "error": str(e)}
+        return self.last_export
+
+    async def mirror_export(self, name: str, entities: list = None, format: str = "jsonl",
+                            rows_per_file: int = 100000, resume: bool = True, wait: bool = False) -> str:
+        """
+        导出组织架构到文件.
+
+        args:
+            name (str): 导出名称，文件写入镜像数据库旁的 `<镜像>.db.exports/<name>` 目录。
+            entities (list, optional): 导出的内容，可选 departments、users、roles、role_members、external_contacts，默认全部导出。
+            format (str, optional): 文件格式，可选 jsonl、csv、parquet（需要安装 pyarrow），默认为 jsonl。
+            rows_per_file (int, optional): 每个文件的最大行数，超出后写入下一个文件，默认为100000。
+            resume (bool, optional): 是否在同名导出中断的位置继续导出，默认为True；为False时删除同名导出的文件后重新导出。
+            wait (bool, optional): 是否等待导出完成后返回统计信息，默认为False，即在后台导出。
+        """
+        if self.export_task is not None and not self.export_task.done():
+            raise Exception("An export is already running")
+        entities = list(entities or ENTITIES)
+        if {"departments", "users"} & set(entities) and self.store.last_synced() is None:
+            raise Exception("The mirror has not been synced yet, run mirror_crawl first")
+        if {"roles", "role_members"} & set(entities):
+            await self._role_index()
+        self.exporter = Exporter(self.contacts, self.store, self.roles, export_dir(self.store, name), format,
+                                 int(rows_per_file))
+        self.export_task = asyncio.create_task(self._export(entities, resume))
+        if wait:
+            return self.contacts.render(await self.export_task)
+        return self.contacts.render({"status": "started", "directory": self.exporter.directory})
+
+    def _user_summary(self, userid: str) -> dict[str, Any]:
+        user = self.store.get_user(userid) or {"userid": userid}
+        return {k: user[k] for k in ("userid", "name", "nickname", "job_number", "title", "dept_id_list") if k in user}
+
+    def _department_summary(self, dept_id: int) -> dict[str, Any]:
+        dept = self.store.get_department(dept_id) or {}
+        return {k: dept[k] for k in ("dept_id", "name", "parent_id") if k in dept}
+
+    async def cleanup(self):
+        for task in (self.crawl_task, self.role_task, self.export_task):
+            if task is not None:
+                task.cancel()
+        if self.mapped is not None:
+            self.mapped.close()
+        self.store.close()
+
+    @staticmethod
+    def list_tools() -> list[types.Tool]:
+        return [
+            types.Tool(
+                name="mirror_crawl",
+                description="同步组织架构（部门、用户及部门成员）到本地镜像。镜像在有效期内时，获取子部门、部门用户和用户详情的工具直接从镜像返回结果。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "从该部门开始同步，默认为根部门1，此时会删除镜像中已不存在的部门和用户。",
+                        },
+                        "wait": {
+                            "type": "boolean",
+                            "description": "是否等待同步完成后返回统计信息，默认为false，即在后台同步。",
+                        },
+                        "resume": {
+                            "type": "boolean",
+                            "description": "是否从上次中断的位置继续同步，默认为true。",
+                        },
+                        "concurrency": {
+                            "type": "number",
+                            "description": "同时同步的部门数，默认为8，接口调用仍受限流控制。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_sync",
+                description="增量同步本地组织架构镜像：按修改时间倒序检查各部门成员直到与镜像一致，删除离职员工，并重新检查成员有变动的部门的下级部门，调用次数远少于全量同步。需要先完成一次全量同步，部门改名等仅结构变化由下次全量同步更新。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "wait": {
+                            "type": "boolean",
+                            "description": "是否等待同步完成后返回统计信息，默认为false，即在后台同步。",
+                        },
+                        "concurrency": {
+                            "type": "number",
+                            "description": "同时检查的部门数，默认为8，接口调用仍受限流控制。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_verify",
+                description="校验本地组织架构镜像：逐个部门获取成员ID列表和下级部门ID列表，只对与镜像不一致的部门重新获取成员或下级部门，完成后生成快照并返回与上一个快照相比的变化（新增、删除、移动的部门及成员变动）。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "校验该部门及其下级部门，默认为根部门1。",
+                        },
+                        "wait": {
+                            "type": "boolean",
+                            "description": "是否等待校验完成后返回统计信息和变化，默认为false，即在后台校验。",
+                        },
+                        "concurrency": {
+                            "type": "number",
+                            "description": "同时校验的部门数，默认为8，接口调用仍受限流控制。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_snapshot",
+                description="为本地组织架构镜像生成快照，快照记录每个部门的成员和逐级汇总的子树哈希，用于比较两个时间点之间的变化。最多保留最近5个快照。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {},
+                },
+            ),
+            types.Tool(
+                name="mirror_diff",
+                description="比较本地组织架构镜像的两个快照，返回新增、删除、移动、信息变更的部门以及各部门增减的成员，子树哈希相同的部分直接跳过。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "from_snapshot": {
+                            "type": "number",
+                            "description": "较早的快照ID，默认为倒数第二个快照。",
+                        },
+                        "to_snapshot": {
+                            "type": "number",
+                            "description": "较晚的快照ID，默认为最新的快照。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_rollup",
+                description="从本地组织架构镜像统计部门及其所有下级部门的人数（同一人在多个部门只计一次）、直属人数、激活与未激活人数、入职年限分布和职位分布，可同时返回每个直属下级部门的统计（如各一级部门人数），无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "部门ID，默认为根部门1。",
+                        },
+                        "by_children": {
+                            "type": "boolean",
+                            "description": "是否同时返回每个直属下级部门的统计，按人数从多到少排列，默认为false。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_refresh_roles",
+                description="同步角色组、角色及角色成员（含管理范围）到本地镜像。首次使用角色查询工具后会按镜像有效期的一半在后台定期同步；有效期内获取角色列表和角色成员列表的工具也直接从镜像返回结果。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "wait": {
+                            "type": "boolean",
+                            "description": "是否等待同步完成后返回统计信息，默认为true。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_user_roles",
+                description="从本地镜像查询用户拥有的所有角色及所属角色组和管理范围，无需分页调用角色成员接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "userid": {
+                            "type": "string",
+                            "description": "用户的userid。",
+                        },
+                    },
+                    "required": ["userid"],
+                },
+            ),
+            types.Tool(
+                name="mirror_role_members",
+                description="从本地镜像查询角色的全部成员及管理范围，可只返回属于指定部门（及其下级部门）的成员。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "role_id": {
+                            "type": "number",
+                            "description": "角色ID。",
+                        },
+                        "dept_id": {
+                            "type": "number",
+                            "description": "只返回属于该部门的成员，默认返回全部成员。",
+                        },
+                        "include_sub_departments": {
+                            "type": "boolean",
+                            "description": "指定部门时是否包括其下级部门的成员，默认为true。",
+                        },
+                    },
+                    "required": ["role_id"],
+                },
+            ),
+            types.Tool(
+                name="mirror_member_sets",
+                description="从本地镜像对部门、角色和角色组的成员做并集、交集和差集运算，如“在部门A但没有角色B的用户”“同时属于角色组X和部门Y的用户”，无需调用钉钉接口或逐个比对成员列表。成员以压缩位图保存，10万用户的组织中一次运算在微秒级完成。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "expression": {
+                            "type": "string",
+                            "description": "集合表达式，如 `dept:1 - role:123`、`(group:5 | role:7) & dept:2`。运算对象：dept:<部门ID>（含下级部门）、direct:<部门ID>（不含下级部门）、role:<角色ID>、group:<角色组ID>、all（镜像中的全部用户）；运算符：| 并集、& 交集、- 差集，- 优先于 &，& 优先于 |，可用括号。",
+                        },
+                        "offset": {
+                            "type": "number",
+                            "description": "跳过的用户数，默认为0。",
+                        },
+                        "size": {
+                            "type": "number",
+                            "description": "返回的用户数，默认为100，为0时只返回人数。",
+                        },
+                    },
+                    "required": ["expression"],
+                },
+            ),
+            types.Tool(
+                name="mirror_management_chain",
+                description="从本地镜像查询用户的汇报链（直属主管、主管的主管……直到最高层），无需逐级调用查询用户详情的接口。主管信息来自已缓存到镜像的用户详情，`complete` 为 false 表示链顶的用户详情尚未缓存，`in_cycle` 为 true 表示汇报关系存在循环。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "userid": {
+                            "type": "string",
+                            "description": "用户的userid。",
+                        },
+                    },
+                    "required": ["userid"],
+                },
+            ),
+            types.Tool(
+                name="mirror_reports",
+                description="从本地镜像查询直接和间接向某个主管汇报的所有人，`level` 为相对该主管的层级（1为直接下属）。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "userid": {
+                            "type": "string",
+                            "description": "主管的userid。",
+                        },
+                        "max_depth": {
+                            "type": "number",
+                            "description": "最多向下的汇报层数，1为只返回直接下属，默认不限制。",
+                        },
+                        "offset": {
+                            "type": "number",
+                            "description": "跳过的人数，默认为0。",
+                        },
+                        "size": {
+                            "type": "number",
+                            "description": "返回的人数，默认为100。",
+                        },
+                    },
+                    "required": ["userid"],
+                },
+            ),
+            types.Tool(
+                name="mirror_span_stats",
+                description="从本地镜像统计管理幅度：主管人数、汇报层级数、直接下属人数的平均值、中位数、最大值和分布，以及直接下属最多的主管。不指定主管时统计全部用户，并返回主管信息未知的人数和汇报关系中的循环。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "userid": {
+                            "type": "string",
+                            "description": "只统计该主管及其所有下属，默认统计全部用户。",
+                        },
+                        "top": {
+                            "type": "number",
+                            "description": "返回直接下属最多的主管数，默认为10。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_refresh_external_contacts",
+                description="同步全部外部联系人及标签组到本地镜像，只写入新增、变化和删除的联系人，并返回各自的数量。查询外部联系人的镜像工具在首次使用或超过镜像有效期时会自动同步；有效期内获取外部联系人列表、标签列表和详情的工具也直接从镜像返回结果。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {},
+                },
+            ),
+            types.Tool(
+                name="mirror_external_contacts",
+                description="从本地镜像按标签、负责人、企业名称、手机号或姓名查询外部联系人，条件需全部满足，返回完整的联系人信息，无需分页获取列表后再逐个查询详情。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "label_ids": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "description": "标签ID列表，只返回带有全部这些标签的联系人。",
+                        },
+                        "follower_user_id": {
+                            "type": "string",
+                            "description": "负责人的userId。",
+                        },
+                        "company_name": {
+                            "type": "string",
+                            "description": "企业名称。",
+                        },
+                        "mobile": {
+                            "type": "string",
+                            "description": "手机号。",
+                        },
+                        "state_code": {
+                            "type": "string",
+                            "description": "手机号国家码，默认为86。",
+                        },
+                        "name": {
+                            "type": "string",
+                            "description": "姓名，忽略空格和大小写。",
+                        },
+                        "offset": {
+                            "type": "number",
+                            "description": "跳过的联系人数，默认为0。",
+                        },
+                        "size": {
+                            "type": "number",
+                            "description": "返回的联系人数，默认为100。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_external_contact_duplicates",
+                description="从本地镜像查找手机号或姓名相同的外部联系人，按重复数量从多到少返回每组联系人。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "by": {
+                            "type": "string",
+                            "enum": DUPLICATE_KEYS,
+                            "description": "判断重复的字段，mobile（默认，手机号相同，忽略空格和符号）或 name（姓名相同，忽略空格和大小写）。",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="mirror_export",
+                description="将组织架构（部门、用户及所在部门、角色、角色成员）从本地镜像、外部联系人从钉钉接口流式导出为 JSONL、CSV 或 Parquet 文件，内存占用与组织规模无关。每个文件达到指定行数后写入下一个文件；导出进度可通过 mirror_status 查询，中断后再次调用可从中断处继续。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "name": {
+                            "type": "string",
+                            "description": "导出名称，文件写入镜像数据库旁的 `<镜像>.db.exports/<name>` 目录，目录中的 manifest.json 记录已完成的文件。",
+                        },
+                        "entities": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": ENTITIES},
+                            "description": "导出的内容，默认全部导出。",
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": FORMATS,
+                            "description": "文件格式，默认为jsonl。CSV 和 Parquet 文件只包含常用字段，parquet 需要安装 pyarrow。",
+                        },
+                        "rows_per_file": {
+                            "type": "number",
+                            "description": "每个文件的最大行数，默认为100000。",
+                        },
+                        "resume": {
+                            "type": "boolean",
+                            "description": "是否在同名导出中断的位置继续导出，默认为true；为false时删除同名导出的文件后重新导出。",
+                        },
+                        "wait": {
+                            "type": "boolean",
+                            "description": "是否等待导出完成后返回统计信息，默认为false，即在后台导出。",
+                        },
+                    },
+                    "required": ["name"],
+                },
+            ),
+            types.Tool(
+                name="mirror_status",
+                description="查询本地组织架构镜像的状态，包括部门数、用户数、上次同步时间、有效期以及正在进行的同步的进度和速度。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {},
+                },
+            ),
+            types.Tool(
+                name="mirror_department_ancestors",
+                description="从本地组织架构镜像查询部门的上级部门链（从该部门到根部门）、层级深度和直属下级部门，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "部门ID。",
+                        },
+                    },
+                    "required": ["dept_id"],
+                },
+            ),
+            types.Tool(
+                name="mirror_department_subtree",
+                description="从本地组织架构镜像查询部门及其所有下级部门的ID，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "部门ID，根部门传1。",
+                        },
+                        "max_depth": {
+                            "type": "number",
+                            "description": "最多向下的层数，1表示只返回直属下级部门，默认不限制。",
+                        },
+                    },
+                    "required": ["dept_id"],
+                },
+            ),
+            types.Tool(
+                name="mirror_is_sub_department",
+                description="从本地组织架构镜像判断一个部门是否是另一个部门或其下级部门，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_id": {
+                            "type": "number",
+                            "description": "要判断的部门ID。",
+                        },
+                        "ancestor_id": {
+                            "type": "number",
+                            "description": "上级部门ID。",
+                        },
+                    },
+                    "required": ["dept_id", "ancestor_id"],
+                },
+            ),
+            types.Tool(
+                name="mirror_common_ancestor",
+                description="从本地组织架构镜像查询多个部门最近的共同上级部门，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "dept_ids": {
+                            "type": "array",
+                            "items": {"type": "number"},
+                            "description": "部门ID列表。",
+                        },
+                    },
+                    "required": ["dept_ids"],
+                },
+            ),
+            types.Tool(
+                name="mirror_user_departments",
+                description="从本地组织架构镜像查询用户所在的部门及每个部门的上级部门链，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "userid": {
+                            "type": "string",
+                            "description": "用户的userid。",
+                        },
+                    },
+                    "required": ["userid"],
+                },
+            ),
+            types.Tool(
+                name="mirror_search_users",
+                description="从本地组织架构镜像搜索用户，支持姓名、姓名拼音及首字母（需安装可选依赖 pypinyin）、英文名、工号和职位，按匹配程度排序，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "queryWord": {
+                            "type": "string",
+                            "description": "搜索关键词。",
+                        },
+                        "mode": {
+                            "type": "string",
+                            "enum": MODES,
+                            "description": "匹配方式：fuzzy（默认，依次包括精确、前缀和模糊匹配）、prefix（精确和前缀匹配）或 exact（精确匹配）。",
+                        },
+                        "offset": {
+                            "type": "number",
+                            "description": "跳过的结果数，默认为0。",
+                        },
+                        "size": {
+                            "type": "number",
+                            "description": "返回的结果数，默认为20。",
+                        },
+                    },
+                    "required": ["queryWord"],
+                },
+            ),
+            types.Tool(
+                name="mirror_search_departments",
+                description="从本地组织架构镜像搜索部门，支持部门名称、拼音及首字母（需安装可选依赖 pypinyin），按匹配程度排序，无需调用钉钉接口。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "queryWord": {
+                            "type": "string",
+                            "description": "搜索关键词。",
+                        },
+                        "mode": {
+                            "type": "string",
+                            "enum": MODES,
+                            "description": "匹配方式：fuzzy（默认，依次包括精确、前缀和模糊匹配）、prefix（精确和前缀匹配）或 exact（精确匹配）。",
+                        },
+                        "offset": {
+                            "type": "number",
+                            "description": "跳过的结果数，默认为0。",
+                        },
+                        "size": {
+                            "type": "number",
+                            "description": "返回的结果数，默认为20。",
+                        },
+                    },
+                    "required": ["queryWord"],
+                },
+            ),
+            types.Tool(
+                name="mirror_resolve_identities",
+                description="批量查询用户的各类标识（userid、手机号、unionid、dingId，以及企业账号迁移前的 original_unionid 和 original_dingid）之间的对应关系。"
+                            "优先使用本地记录（来自组织架构镜像和之前的接口调用结果），可选地对本地没有的标识调用钉钉接口查询。",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "kind": {
+                            "type": "string",
+                            "enum": KINDS,
+                            "description": "输入标识的类型。",
+                        },
+                        "values": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "标识列表，一次可传入数千个。",
+                        },
+                        "targets": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": KINDS},
+                            "description": "需要的标识类型，默认为全部类型。",
+                        },
+                        "fetch_missing": {
+                            "type": "boolean",
+                            "description": "是否对本地没有的标识调用钉钉接口查询并记录，默认为false。",
+                        },
+                        "max_concurrency": {
+                            "type": "number",
+                            "description": "调用钉钉接口的最大并发数，默认为10。",
+                        },
+                    },
+                    "required": ["kind", "values"],
+                },
+            ),
+        ]
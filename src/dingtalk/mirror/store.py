@@ -0,0 +1,397 @@
+import json as JSON
+import sqlite3
+import time
+from typing import Any, Callable, Iterator
+from urllib.parse import parse_qsl
+
+OAPI = "https://oapi.dingtalk.com"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS departments (
+    dept_id INTEGER PRIMARY KEY,
+    parent_id INTEGER,
+    name TEXT,
+    data TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    crawled_at REAL
+);
+CREATE INDEX IF NOT EXISTS departments_parent ON departments(parent_id);
+
+CREATE TABLE IF NOT EXISTS users (
+    userid TEXT PRIMARY KEY,
+    unionid TEXT,
+    name TEXT,
+    mobile TEXT,
+    data TEXT NOT NULL,
+    detail TEXT,
+    synced_at REAL NOT NULL,
+    detail_synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS users_unionid ON users(unionid);
+CREATE INDEX IF NOT EXISTS users_mobile ON users(mobile);
+
+CREATE TABLE IF NOT EXISTS dept_users (
+    dept_id INTEGER NOT NULL,
+    userid TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (dept_id, userid)
+);
+CREATE INDEX IF NOT EXISTS dept_users_user ON dept_users(userid);
+CREATE INDEX IF NOT EXISTS dept_users_seq ON dept_users(dept_id, seq);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class MirrorStore:
+    """
+    Local SQLite copy of a tenant's organization: departments, users and
+    department membership, as returned by the Dingtalk API.
+
+    Departments record when their sub-departments and members were last
+    crawled (`crawled_at`); reads are only answered from the mirror while
+    that is younger than `max_age` seconds, otherwise the caller goes to the
+    live API.
+    """
+
+    def __init__(self, path: str, max_age: float = 3600):
+        self.path = path
+        self.max_age = max_age
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        # Endpoints the mirror can answer, keyed by URL.
+        self.readers: dict[str, Callable[[dict[str, Any]], Any]] = {
+            f"{OAPI}/topapi/v2/department/listsub": self._answer_listsub,
+            f"{OAPI}/topapi/v2/department/listsubid": self._answer_listsubid,
+            f"{OAPI}/topapi/v2/user/list": self._answer_user_list,
+            f"{OAPI}/topapi/v2/user/get": self._answer_user_get,
+        }
+        # Live results worth keeping, keyed by URL.
+        self.recorders: dict[str, Callable[[dict[str, Any], Any], None]] = {
+            f"{OAPI}/topapi/v2/user/get": self._record_user_get,
+        }
+
+    def close(self):
+        self.db.close()
+
+    def is_fresh(self, synced_at: float | None) -> bool:
+        return synced_at is not None and time.time() - synced_at < self.max_age
+
+    # Writes
+
+    def save_departments(self, depts: list[dict[str, Any]], synced_at: float | None = None):
+        synced_at = synced_at or time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO departments (dept_id, parent_id, name, data, synced_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(dept_id) DO UPDATE SET parent_id=excluded.parent_id, name=excluded.name, "
+                "data=excluded.data, synced_at=excluded.synced_at",
+                [(d["dept_id"], d.get("parent_id"), d.get("name"), JSON.dumps(d, ensure_ascii=False), synced_at)
+                 for d in depts],
+            )
+
+    def save_sub_departments(self, parent_id: int, depts: list[dict[str, Any]], synced_at: float | None = None):
+        """Replace the children of `parent_id` with `depts`."""
+        self.save_departments(depts, synced_at)
+        with self.db:
+            self.db.execute(
+                f"DELETE FROM departments WHERE parent_id = ? AND dept_id NOT IN ({','.join('?' * len(depts))})",
+                [parent_id, *(d["dept_id"] for d in depts)],
+            )
+
+    def save_users(self, users: list[dict[str, Any]], synced_at: float | None = None):
+        synced_at = synced_at or time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO users (userid, unionid, name, mobile, data, synced_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(userid) DO UPDATE SET unionid=excluded.unionid, name=excluded.name, "
+                "mobile=excluded.mobile, data=excluded.data, synced_at=excluded.synced_at",
+                [(u["userid"], u.get("unionid"), u.get("name"), u.get("mobile"),
+                  JSON.dumps(u, ensure_ascii=False), synced_at) for u in users],
+            )
+
+    def save_department_users(self, dept_id: int, users: list[dict[str, Any]], synced_at: float | None = None):
+        """Replace the members of `dept_id` with `users`, in API order."""
+        self.save_users(users, synced_at)
+        with self.db:
+            self.db.execute("DELETE FROM dept_users WHERE dept_id = ?", (dept_id,))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO dept_users (dept_id, userid, seq) VALUES (?, ?, ?)",
+                [(dept_id, u["userid"], i) for i, u in enumerate(users)],
+            )
+
+    def save_user_detail(self, detail: dict[str, Any], synced_at: float | None = None):
+        synced_at = synced_at or time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT INTO users (userid, unionid, name, mobile, data, detail, synced_at, detail_synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(userid) DO UPDATE SET detail=excluded.detail, detail_synced_at=excluded.detail_synced_at",
+                (detail["userid"], detail.get("unionid"), detail.get("name"), detail.get("mobile"),
+                 JSON.dumps(detail, ensure_ascii=False), JSON.dumps(detail, ensure_ascii=False), synced_at, synced_at),
+            )
+
+    def mark_crawled(self, dept_ids: int | list[int], crawled_at: float | None = None):
+        crawled_at = crawled_at or time.time()
+        with self.db:
+            self.db.executemany("UPDATE departments SET crawled_at = ? WHERE dept_id = ?",
+                                [(crawled_at, d) for d in (dept_ids if isinstance(dept_ids, list) else [dept_ids])])
+
+    def set_user_departments(self, userid: str, dept_ids: list[int]):
+        """Make `userid` a member of exactly `dept_ids`; new memberships go last."""
+        with self.db:
+            self.db.execute(
+                f"DELETE FROM dept_users WHERE userid = ? AND dept_id NOT IN ({','.join('?' * len(dept_ids))})",
+                [userid, *dept_ids],
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO dept_users (dept_id, userid, seq) "
+                "SELECT ?, ?, COALESCE(MAX(seq) + 1, 0) FROM dept_users WHERE dept_id = ?",
+                [(d, userid, d) for d in dept_ids],
+            )
+
+    def remove_users(self, userids: list[str]):
+        with self.db:
+            self.db.executemany("DELETE FROM users WHERE userid = ?", [(u,) for u in userids])
+            self.db.executemany("DELETE FROM dept_users WHERE userid = ?", [(u,) for u in userids])
+
+    def remove_departments(self, dept_ids: list[int]):
+        with self.db:
+            self.db.executemany("DELETE FROM departments WHERE dept_id = ?", [(d,) for d in dept_ids])
+            self.db.executemany("DELETE FROM dept_users WHERE dept_id = ?", [(d,) for d in dept_ids])
+
+    def prune(self, before: float):
+        """Drop departments and users not seen since `before`, i.e. missing from the last full crawl."""
+        with self.db:
+            self.db.execute("DELETE FROM departments WHERE synced_at < ?", (before,))
+            self.db.execute("DELETE FROM users WHERE synced_at < ?", (before,))
+            self.db.execute("DELETE FROM dept_users WHERE dept_id NOT IN (SELECT dept_id FROM departments)")
+            self.db.execute("DELETE FROM dept_users WHERE userid NOT IN (SELECT userid FROM users)")
+
+    def set_meta(self, key: str, value: Any):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                            (key, JSON.dumps(value, ensure_ascii=False)))
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return JSON.loads(row["value"]) if row else default
+
+    # Reads
+
+    def get_department(self, dept_id: int) -> dict[str, Any] | None:
+        row = self.db.execute("SELECT data FROM departments WHERE dept_id = ?", (dept_id,)).fetchone()
+        return JSON.loads(row["data"]) if row else None
+
+    def sub_departments(self, dept_id: int) -> list[dict[str, Any]]:
+        rows = self.db.execute("SELECT data FROM departments WHERE parent_id = ? ORDER BY dept_id", (dept_id,))
+        return [JSON.loads(r["data"]) for r in rows]
+
+    def sub_department_ids(self, dept_id: int) -> list[int]:
+        rows = self.db.execute("SELECT dept_id FROM departments WHERE parent_id = ? ORDER BY dept_id", (dept_id,))
+        return [r["dept_id"] for r in rows]
+
+    def department_users(self, dept_id: int, cursor: int = 0, size: int = 100) -> dict[str, Any]:
+        """A page of a department's members, shaped like topapi/v2/user/list."""
+        rows = self.db.execute(
+            "SELECT u.data FROM dept_users d JOIN users u ON u.userid = d.userid "
+            "WHERE d.dept_id = ? ORDER BY d.seq LIMIT ? OFFSET ?",
+            (dept_id, size + 1, cursor),
+        ).fetchall()
+        page = {"has_more": len(rows) > size, "list": [JSON.loads(r["data"]) for r in rows[:size]]}
+        if page["has_more"]:
+            page["next_cursor"] = cursor + size
+        return page
+
+    def department_user_ids(self, dept_id: int) -> list[str]:
+        rows = self.db.execute("SELECT userid FROM dept_users WHERE dept_id = ? ORDER BY seq", (dept_id,))
+        return [r[0] for r in rows]
+
+    def department_members(self) -> dict[int, list[str]]:
+        """Member userids of every department, sorted."""
+        members: dict[int, list[str]] = {}
+        for dept_id, userid in self.db.execute("SELECT dept_id, userid FROM dept_users ORDER BY dept_id, userid"):
+            members.setdefault(dept_id, []).append(userid)
+        return members
+
+    def membership_count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM dept_users").fetchone()[0]
+
+    def member_count(self) -> int:
+        """Number of distinct users in mirrored departments."""
+        return self.db.execute("SELECT COUNT(DISTINCT userid) FROM dept_users").fetchone()[0]
+
+    def memberships(self, after: str | None = None, limit: int = -1) -> Iterator[tuple[dict[str, Any], list[int]]]:
+        """
+        (record, dept_ids) of every user in a mirrored department, by userid,
+        one at a time; with `after`, only users whose userid sorts after it.
+        """
+        rows = self.db.execute(
+            "SELECT u.data, group_concat(d.dept_id) FROM dept_users d JOIN users u ON u.userid = d.userid "
+            "WHERE d.userid > ? GROUP BY d.userid ORDER BY d.userid LIMIT ?", (after or "", limit)
+        )
+        for data, dept_ids in rows:
+            yield JSON.loads(data), [int(d) for d in dept_ids.split(",")]
+
+    def department_version(self) -> tuple[int, float]:
+        """Changes whenever departments are added, updated or removed."""
+        row = self.db.execute("SELECT COUNT(*), MAX(synced_at) FROM departments").fetchone()
+        return row[0], row[1] or 0.0
+
+    def department_edges(self, since: float | None = None) -> list[tuple[int, int | None]]:
+        """(dept_id, parent_id) of every department, or of those synced after `since`."""
+        if since is None:
+            rows = self.db.execute("SELECT dept_id, parent_id FROM departments")
+        else:
+            rows = self.db.execute("SELECT dept_id, parent_id FROM departments WHERE synced_at > ?", (since,))
+        return [tuple(r) for r in rows]
+
+    def department_ids(self) -> list[int]:
+        return [r[0] for r in self.db.execute("SELECT dept_id FROM departments")]
+
+    def departments_since(self, since: float | None = None) -> list[tuple[int, dict[str, Any]]]:
+        """(dept_id, record) of every department, or of those synced after `since`."""
+        rows = self.db.execute("SELECT dept_id, data FROM departments WHERE synced_at > ?", (since or 0,))
+        return [(r[0], JSON.loads(r[1])) for r in rows]
+
+    def department_records(self, after: int | None = None, limit: int = -1) -> list[tuple[int, dict[str, Any]]]:
+        """(dept_id, record) of departments by dept_id, those after `after` only if given."""
+        rows = self.db.execute("SELECT dept_id, data FROM departments WHERE dept_id > ? ORDER BY dept_id LIMIT ?",
+                               (after if after is not None else -2 ** 63, limit))
+        return [(r[0], JSON.loads(r[1])) for r in rows]
+
+    def user_version(self) -> tuple[int, float]:
+        """Changes whenever users are added, updated or removed."""
+        row = self.db.execute("SELECT COUNT(*), MAX(synced_at) FROM users").fetchone()
+        return row[0], row[1] or 0.0
+
+    def users_since(self, since: float | None = None) -> list[tuple[str, dict[str, Any]]]:
+        """(userid, record) of every user, or of those synced after `since`."""
+        rows = self.db.execute("SELECT userid, data FROM users WHERE synced_at > ?", (since or 0,))
+        return [(r[0], JSON.loads(r[1])) for r in rows]
+
+    def detail_version(self) -> tuple[int, float]:
+        """Changes whenever user details are recorded."""
+        row = self.db.execute("SELECT COUNT(detail), MAX(detail_synced_at) FROM users").fetchone()
+        return row[0], row[1] or 0.0
+
+    def user_managers(self) -> Iterator[tuple[str, str | None, bool]]:
+        """
+        (userid, manager_userid, whether the manager is known) of every user,
+        by userid. Managers come from user details, or from list records that
+        carry them.
+        """
+        rows = self.db.execute(
+            "SELECT userid, CASE WHEN detail IS NOT NULL THEN json_extract(detail, '$.manager_userid') "
+            "ELSE json_extract(data, '$.manager_userid') END, "
+            "detail IS NOT NULL OR json_type(data, '$.manager_userid') IS NOT NULL FROM users ORDER BY userid"
+        )
+        for userid, manager, known in rows:
+            yield userid, manager or None, bool(known)
+
+    def user_ids(self) -> list[str]:
+        return [r[0] for r in self.db.execute("SELECT userid FROM users")]
+
+    def user_department_ids(self, userid: str) -> list[int]:
+        rows = self.db.execute("SELECT dept_id FROM dept_users WHERE userid = ? ORDER BY dept_id", (userid,))
+        return [r[0] for r in rows]
+
+    def get_user(self, userid: str) -> dict[str, Any] | None:
+        row = self.db.execute("SELECT data FROM users WHERE userid = ?", (userid,)).fetchone()
+        return JSON.loads(row["data"]) if row else None
+
+    def get_users(self, userids: list[str]) -> dict[str, dict[str, Any]]:
+        rows = self.db.execute(
+            f"SELECT userid, data FROM users WHERE userid IN ({','.join('?' * len(userids))})", userids)
+        return {r[0]: JSON.loads(r[1]) for r in rows}
+
+    def users_synced_since(self, userids: list[str], since: float, detail: bool = False) -> dict[str, dict[str, Any]]:
+        """Records, or details, of those of `userids` synced at or after `since`."""
+        column, synced_at = ("detail", "detail_synced_at") if detail else ("data", "synced_at")
+        users = {}
+        for i in range(0, len(userids), 500):
+            chunk = userids[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT userid, {column} FROM users WHERE userid IN ({','.join('?' * len(chunk))}) "
+                f"AND {column} IS NOT NULL AND {synced_at} >= ?", [*chunk, since])
+            users.update((r[0], JSON.loads(r[1])) for r in rows)
+        return users
+
+    def get_user_detail(self, userid: str) -> dict[str, Any] | None:
+        row = self.db.execute("SELECT detail, detail_synced_at FROM users WHERE userid = ?", (userid,)).fetchone()
+        if row is None or row["detail"] is None or not self.is_fresh(row["detail_synced_at"]):
+            return None
+        return JSON.loads(row["detail"])
+
+    def crawled_at(self, dept_id: int) -> float | None:
+        row = self.db.execute("SELECT crawled_at FROM departments WHERE dept_id = ?", (dept_id,)).fetchone()
+        return row["crawled_at"] if row else None
+
+    def last_synced(self) -> float | None:
+        """When the whole mirror was last brought up to date, by a full crawl or an incremental sync."""
+        return max(self.get_meta("last_full_crawl") or 0, self.get_meta("last_sync") or 0) or None
+
+    def status(self) -> dict[str, Any]:
+        counts = self.db.execute(
+            "SELECT (SELECT COUNT(*) FROM departments) AS departments, (SELECT COUNT(*) FROM users) AS users, "
+            "(SELECT COUNT(*) FROM users WHERE detail IS NOT NULL) AS user_details"
+        ).fetchone()
+        return {**dict(counts), "last_full_crawl": self.get_meta("last_full_crawl"),
+                "last_sync": self.get_meta("last_sync"), "max_age": self.max_age}
+
+    # Serving API reads
+
+    @staticmethod
+    def _split(url: str, payload: dict[str, Any] | None) -> tuple[str, dict[str, Any]]:
+        """Separate query parameters from `url` and merge them into the payload."""
+        base, _, query = url.partition("?")
+        return base, {**dict(parse_qsl(query)), **(payload or {})}
+
+    def answer(self, url: str, payload: dict[str, Any] | None) -> Any:
+        """
+        Return the result of the API call `url` with `payload` from the mirror,
+        or None when the mirror can't answer it or its copy is stale.
+        """
+        url, payload = self._split(url, payload)
+        reader = self.readers.get(url)
+        return reader(payload) if reader else None
+
+    def record(self, url: str, payload: dict[str, Any] | None, result: Any):
+        """Keep live results the mirror can serve later."""
+        url, payload = self._split(url, payload)
+        if recorder := self.recorders.get(url):
+            recorder(payload, result)
+
+    def _record_user_get(self, payload: dict[str, Any], result: Any):
+        if isinstance(result, dict) and "userid" in result:
+            self.save_user_detail(result)
+
+    def _answer_listsub(self, payload: dict[str, Any]) -> Any:
+        dept_id = payload.get("dept_id", 1)
+        if payload.get("language", "zh_CN") != "zh_CN" or not self.is_fresh(self.crawled_at(dept_id)):
+            return None
+        return self.sub_departments(dept_id)
+
+    def _answer_listsubid(self, payload: dict[str, Any]) -> Any:
+        dept_id = payload.get("dept_id", 1)
+        if not self.is_fresh(self.crawled_at(dept_id)):
+            return None
+        return {"dept_id_list": self.sub_department_ids(dept_id)}
+
+    def _answer_user_list(self, payload: dict[str, Any]) -> Any:
+        if payload.get("order_field") not in (None, "custom") or payload.get("contain_access_limit") \
+                or payload.get("language") not in (None, "zh_CN"):
+            return None
+        if not self.is_fresh(self.crawled_at(payload["dept_id"])):
+            return None
+        return self.department_users(payload["dept_id"], payload.get("cursor") or 0, payload.get("size") or 100)
+
+    def _answer_user_get(self, payload: dict[str, Any]) -> Any:
+        if payload.get("language", "zh_CN") != "zh_CN":
+            return None
+        return self.get_user_detail(payload["userid"])
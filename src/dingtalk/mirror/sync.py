@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import DingtalkError, raw_results, result_transforms, use_mirror
+from dingtalk.mirror.crawler import USER_PAGE
+from dingtalk.mirror.store import MirrorStore
+
+SYNC_KEY = "last_sync"
+
+# Unchanged members seen in a row before the rest of a department, modified
+# even earlier, is taken as unchanged too.
+CONFIRM = 2
+
+# Leave records are fetched from a little before the last sync, in case they
+# were written late.
+LEAVE_OVERLAP = 600
+
+DEPARTMENT_NOT_FOUND = 60003
+
+def _iso(t: float) -> str:
+    return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class IncrementalSync:
+    """
+    Brings a mirror made by a full crawl up to date without re-reading it.
+
+    Departures since the last sync are read from the leave records. Each
+    mirrored department's members are then paged most recently modified
+    first, stopping as soon as they match the mirror: a department without
+    changes costs one call instead of a sub-department listing plus all its
+    member pages. The department lists of changed members say which
+    memberships changed; departments gaining or losing members, or parents
+    of departments the mirror doesn't know, get their sub-departments
+    re-listed, and new departments are crawled in full. Departments that
+    are only renamed, and new departments whose members all moved there
+    from elsewhere, are picked up by the next full crawl.
+    """
+
+    def __init__(self, contacts: DingtalkContactsServer, store: MirrorStore, concurrency: int = 8,
+                 page_size: int = USER_PAGE):
+        self.logger = logging.getLogger(__name__)
+        self.contacts = contacts
+        self.store = store
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.since = 0.0
+        self.started = 0.0
+        self.departures = 0
+        self.departments = 0
+        self.changed: dict[str, dict[str, Any]] = {}
+        self.changed_users = 0
+        self.new_departments: list[int] = []
+        self.removed_departments: list[int] = []
+        self.rechecked_departments: list[int] = []
+        self.calls = 0
+        self.clock_started = 0.0
+
+    def report(self) -> dict[str, Any]:
+        elapsed = time.monotonic() - self.clock_started if self.clock_started else 0
+        return {
+            "since": self.since,
+            "departures": self.departures,
+            "departments": self.departments,
+            "changed_users": self.changed_users,
+            "new_departments": self.new_departments,
+            "removed_departments": self.removed_departments,
+            "rechecked_departments": self.rechecked_departments,
+            "calls": self.calls,
+            "seconds": round(elapsed, 3),
+        }
+
+    async def run(self) -> dict[str, Any]:
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            return await self._run()
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+
+    async def _run(self) -> dict[str, Any]:
+        since = self.store.last_synced()
+        if since is None:
+            raise Exception("The mirror has not been crawled yet, run a full crawl first")
+        self.since = since
+        self.started = time.time()
+        self.clock_started = time.monotonic()
+
+        left = await self._leave_records(since - LEAVE_OVERLAP)
+        self.store.remove_users(left)
+        self.departures = len(left)
+
+        known = set(self.store.department_ids())
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def scan(dept_id: int):
+            async with semaphore:
+                self.changed.update(await self._changed_members(dept_id))
+
+        await asyncio.gather(*(scan(d) for d in known))
+        self.departments = len(known) - len(self.removed_departments)
+        self.store.remove_departments(self.removed_departments)
+        known.difference_update(self.removed_departments)
+
+        # Departments gaining or losing members may have gained or lost
+        # sub-departments too.
+        for userid in left:
+            self.changed.pop(userid, None)
+        recheck: set[int] = set()
+        unknown: set[int] = set()
+        for userid, record in self.changed.items():
+            before = set(self.store.user_department_ids(userid))
+            after = set(record.get("dept_id_list") or [])
+            recheck.update(d for d in before ^ after if d in known)
+            unknown.update(d for d in after if d not in known)
+        # New departments are crawled from their closest mirrored ancestor.
+        seen = set(unknown)
+        while unknown:
+            parent_id = (await self._call(self.contacts.get_department_detail(unknown.pop()))).get("parent_id")
+            if parent_id in known:
+                recheck.add(parent_id)
+            elif parent_id is not None and parent_id not in seen:
+                seen.add(parent_id)
+                unknown.add(parent_id)
+        for dept_id in sorted(recheck):
+            if dept_id in known:
+                await self._recheck(dept_id, known)
+
+        self.store.save_users(list(self.changed.values()))
+        for userid, record in self.changed.items():
+            self.store.set_user_departments(userid, [d for d in record.get("dept_id_list") or [] if d in known])
+        self.changed_users = len(self.changed)
+        self.store.mark_crawled(list(known), self.started)
+        self.store.set_meta(SYNC_KEY, self.started)
+        report = self.report()
+        self.logger.info(f"Incremental sync finished: {report}")
+        return report
+
+    async def _call(self, call):
+        self.calls += 1
+        return await call
+
+    async def _leave_records(self, since: float) -> list[str]:
+        userids, token = [], "0"
+        while True:
+            page = await self._call(self.contacts.get_employee_leave_records(_iso(since), _iso(self.started), token))
+            userids.extend(r["userId"] for r in page.get("records") or [] if r.get("userId"))
+            token = page.get("nextToken")
+            if not token or not page.get("records"):
+                return userids
+
+    async def _changed_members(self, dept_id: int) -> dict[str, dict[str, Any]]:
+        """Members of `dept_id` modified since the mirror copied them, most recent first."""
+        changed, unchanged, cursor = {}, 0, 0
+        while True:
+            try:
+                page = await self._call(self.contacts.get_department_user_details(
+                    dept_id, cursor, self.page_size, order_field="modify_desc"))
+            except DingtalkError as e:
+                if e.errcode != DEPARTMENT_NOT_FOUND:
+                    raise
+                self.removed_departments.append(dept_id)
+                return changed
+            records = page.get("list") or []
+            mirrored = self.store.get_users([r["userid"] for r in records]) if records else {}
+            for record in records:
+                if mirrored.get(record["userid"]) == record:
+                    unchanged += 1
+                    if unchanged >= CONFIRM:
+                        return changed
+                else:
+                    unchanged = 0
+                    changed[record["userid"]] = record
+            if not page.get("has_more"):
+                return changed
+            cursor = page["next_cursor"]
+
+    async def _recheck(self, dept_id: int, known: set[int]):
+        """Re-list the sub-departments of `dept_id`, crawling the new ones."""
+        subs = await self._call(self.contacts.get_department_list_old(dept_id=dept_id)) or []
+        self.rechecked_departments.append(dept_id)
+        gone = set(self.store.sub_department_ids(dept_id)) - {d["dept_id"] for d in subs}
+        self.store.save_sub_departments(dept_id, subs)
+        self.store.remove_departments(list(gone))
+        self.removed_departments.extend(gone)
+        known.difference_update(gone)
+        for dept in subs:
+            if dept["dept_id"] not in known:
+                await self._crawl_new(dept["dept_id"], known)
+
+    async def _crawl_new(self, dept_id: int, known: set[int]):
+        known.add(dept_id)
+        self.new_departments.append(dept_id)
+        members, cursor = [], 0
+        while True:
+            page = await self._call(self.contacts.get_department_user_details(dept_id, cursor, self.page_size))
+            members.extend(page.get("list") or [])
+            if not page.get("has_more"):
+                break
+            cursor = page["next_cursor"]
+        # Members moved here from mirrored departments changed too.
+        mirrored = self.store.get_users([m["userid"] for m in members]) if members else {}
+        self.changed.update((m["userid"], m) for m in members if m["userid"] in mirrored and mirrored[m["userid"]] != m)
+        self.store.save_department_users(dept_id, members)
+        await self._recheck(dept_id, known)
@@ -0,0 +1,159 @@
+from array import array
+from typing import Iterable
+
+from dingtalk.mirror.store import MirrorStore
+
+class DepartmentTree:
+    """
+    In-memory department hierarchy held as flat arrays.
+
+    Departments are numbered by their position in `ids`; `parent` holds the
+    parent's position (-1 for roots), `order` lists positions in pre-order,
+    so every subtree is the slice `order[start[p]:start[p] + size[p]]`, and
+    children of a position are consecutive in `child_index` from
+    `child_offsets[p]`. Only the id -> position lookup is a dict.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.positions: dict[int, int] = {}
+        self.parent = array("l")
+        self.parent_ids = array("q")
+        self.depth = array("l")
+        self.child_offsets = array("l", [0])
+        self.child_index = array("l")
+        self.order = array("l")
+        self.start = array("l")
+        self.size = array("l")
+        # (department count, last synced_at) of the store when loaded
+        self.version: tuple[int, float] | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, dept_id: int) -> bool:
+        return dept_id in self.positions
+
+    def load(self, edges: Iterable[tuple[int, int | None]]):
+        """Build the tree from (dept_id, parent_id) pairs."""
+        edges = sorted(edges)
+        self.ids = array("q", (d for d, _ in edges))
+        self.positions = {d: i for i, d in enumerate(self.ids)}
+        n = len(self.ids)
+        self.parent = array("l", (self.positions.get(p, -1) if p != d else -1 for d, p in edges))
+
+        # Parent ids as stored, 0 for none, so refreshes can relink departments
+        # whose parent shows up later.
+        self.parent_ids = array("q", (p or 0 for _, p in edges))
+
+        counts = array("l", [0] * (n + 1))
+        for p in self.parent:
+            if p >= 0:
+                counts[p + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        self.child_offsets = counts
+        self.child_index = array("l", [0] * (counts[n] if n else 0))
+        fill = array("l", counts[:n])
+        for i, p in enumerate(self.parent):
+            if p >= 0:
+                self.child_index[fill[p]] = i
+                fill[p] += 1
+
+        self.depth = array("l", [0] * n)
+        self.start = array("l", [0] * n)
+        self.size = array("l", [1] * n)
+        self.order = array("l")
+        # Iterative pre-order walk from every root; departments whose parent
+        # is missing from the mirror count as roots.
+        for root in (i for i in range(n) if self.parent[i] < 0):
+            stack = [root]
+            while stack:
+                p = stack.pop()
+                self.start[p] = len(self.order)
+                self.order.append(p)
+                children = self.child_index[self.child_offsets[p]:self.child_offsets[p + 1]]
+                for c in reversed(children):
+                    self.depth[c] = self.depth[p] + 1
+                    stack.append(c)
+        for p in reversed(self.order):
+            if self.parent[p] >= 0:
+                self.size[self.parent[p]] += self.size[p]
+
+    def refresh(self, store: MirrorStore) -> bool:
+        """
+        Bring the tree up to date with `store`, reading only departments
+        synced since the last refresh. Returns whether anything changed.
+        """
+        count, last_synced = store.department_version()
+        if self.version == (count, last_synced):
+            return False
+        if self.version is None:
+            self.load(store.department_edges())
+        else:
+            edges = {d: p or None for d, p in zip(self.ids, self.parent_ids)}
+            for dept_id, parent_id in store.department_edges(since=self.version[1]):
+                edges[dept_id] = parent_id
+            if len(edges) != count:
+                # Departments were removed: keep only the ones still mirrored.
+                current = set(store.department_ids())
+                edges = {d: p for d, p in edges.items() if d in current}
+            self.load(edges.items())
+        self.version = (count, last_synced)
+        return True
+
+    def _position(self, dept_id: int) -> int:
+        if dept_id not in self.positions:
+            raise ValueError(f"Department {dept_id} is not in the mirror")
+        return self.positions[dept_id]
+
+    def parent_id(self, dept_id: int) -> int | None:
+        p = self.parent[self._position(dept_id)]
+        return self.ids[p] if p >= 0 else None
+
+    def children(self, dept_id: int) -> list[int]:
+        p = self._position(dept_id)
+        return [self.ids[c] for c in self.child_index[self.child_offsets[p]:self.child_offsets[p + 1]]]
+
+    def depth_of(self, dept_id: int) -> int:
+        return self.depth[self._position(dept_id)]
+
+    def ancestors(self, dept_id: int) -> list[int]:
+        """The department followed by its parents up to the root."""
+        p = self._position(dept_id)
+        chain = []
+        while p >= 0 and len(chain) <= len(self.ids):
+            chain.append(self.ids[p])
+            p = self.parent[p]
+        return chain
+
+    def subtree(self, dept_id: int, max_depth: int | None = None) -> list[int]:
+        """The department and all departments below it, in pre-order."""
+        p = self._position(dept_id)
+        positions = self.order[self.start[p]:self.start[p] + self.size[p]]
+        if max_depth is not None:
+            limit = self.depth[p] + max_depth
+            return [self.ids[q] for q in positions if self.depth[q] <= limit]
+        return [self.ids[q] for q in positions]
+
+    def is_descendant(self, dept_id: int, ancestor_id: int) -> bool:
+        """Whether `dept_id` is `ancestor_id` or below it."""
+        p, a = self._position(dept_id), self._position(ancestor_id)
+        return self.start[a] <= self.start[p] < self.start[a] + self.size[a]
+
+    def lowest_common_ancestor(self, dept_ids: list[int]) -> int | None:
+        """The deepest department containing all of `dept_ids`, None if they are in different trees."""
+        if not dept_ids:
+            raise ValueError("At least one department is required")
+        a = self._position(dept_ids[0])
+        for dept_id in dept_ids[1:]:
+            b = self._position(dept_id)
+            while self.depth[a] > self.depth[b]:
+                a = self.parent[a]
+            while self.depth[b] > self.depth[a]:
+                b = self.parent[b]
+            while a != b:
+                a, b = self.parent[a], self.parent[b]
+            if a < 0:
+                return None
+        return self.ids[a]
@@ -0,0 +1,122 @@
+import json as JSON
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+OAPI = "https://oapi.dingtalk.com"
+
+class Paging:
+    """How an offset-paged endpoint takes its position and page size and shapes its pages."""
+
+    def __init__(self, max_size: int, default_size: int, cursor: str = "cursor", size: str = "size",
+                 items: str | None = "list", has_more: str | None = "has_more", next_cursor: str | None = "next_cursor"):
+        self.max_size = max_size
+        self.default_size = default_size
+        self.cursor = cursor
+        self.size = size
+        # None for endpoints answering with a bare list, which ends at the
+        # first page shorter than requested.
+        self.items = items
+        self.has_more = has_more
+        self.next_cursor = next_cursor
+
+# Offset-paged endpoints with their documented largest and default page sizes.
+PAGED = {
+    f"{OAPI}/topapi/v2/user/list": Paging(100, 10),
+    f"{OAPI}/topapi/user/listsimple": Paging(100, 10),
+    f"{OAPI}/topapi/industry/department/list": Paging(1000, 10),
+    f"{OAPI}/topapi/industry/user/list": Paging(1000, 10),
+    f"{OAPI}/topapi/role/list": Paging(200, 20, cursor="offset", has_more="hasMore", next_cursor=None),
+    f"{OAPI}/topapi/role/simplelist": Paging(100, 20, cursor="offset", has_more="hasMore", next_cursor="nextCursor"),
+    f"{OAPI}/topapi/extcontact/list": Paging(100, 20, cursor="offset", items=None, has_more=None, next_cursor=None),
+    f"{OAPI}/topapi/extcontact/listlabelgroups": Paging(100, 20, cursor="offset", items=None, has_more=None,
+                                                         next_cursor=None),
+}
+
+# Methods that only read; calls to any other method of an API family may
+# change what its lists return.
+READ_METHODS = ("get", "list", "query", "count", "search", "simplelist")
+
+def max_page_size(url: str) -> int:
+    return PAGED[url].max_size
+
+def api_family(url: str) -> str:
+    """The resource an OAPI url acts on, e.g. user for topapi/v2/user/create and role for role/add_role."""
+    path = [p for p in url.removeprefix(OAPI).split("/") if p and p not in ("topapi", "v2")]
+    return path[0] if len(path) > 1 else ""
+
+class PageCache:
+    """
+    Serves small pages of offset-paged endpoints out of full-size ones.
+
+    A request for fewer items than the endpoint allows is sent upstream
+    with the largest page size instead; the caller gets the slice it asked
+    for, shaped as the endpoint would have returned it, and the rest of the
+    page answers its following requests for `ttl` seconds. Paging through a
+    list ten items at a time then takes a tenth of the calls. At most
+    `max_entries` pages are kept, and the pages of an API family are
+    dropped once a call that may change it succeeds.
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 64):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (url, other parameters) -> (first offset, items, whether more follow, upstream page, expiry)
+        self.pages: OrderedDict[tuple[str, str], tuple[int, list, bool, Any, float]] = OrderedDict()
+        self.upstream_calls = 0
+        self.served = 0
+
+    def handles(self, url: str, payload: Any) -> bool:
+        """Whether a request would be served from a larger page."""
+        paging = PAGED.get(url)
+        if paging is None or not isinstance(payload, dict):
+            return False
+        return int(payload.get(paging.size) or paging.default_size) < paging.max_size
+
+    def written(self, url: str):
+        """Drop the pages of `url`'s API family unless `url` only reads."""
+        if url in PAGED or url.rsplit("/", 1)[-1].startswith(READ_METHODS):
+            return
+        family = api_family(url)
+        for key in [k for k in self.pages if api_family(k[0]) == family]:
+            del self.pages[key]
+
+    async def fetch(self, url: str, payload: dict[str, Any],
+                    request: Callable[[dict[str, Any]], Awaitable[Any]]) -> Any:
+        """The requested page, calling `request` with a full-size page payload when it isn't cached."""
+        paging = PAGED[url]
+        cursor = int(payload.get(paging.cursor) or 0)
+        size = int(payload.get(paging.size) or paging.default_size)
+        rest = {k: v for k, v in payload.items() if k not in (paging.cursor, paging.size)}
+        key = (url, JSON.dumps(rest, sort_keys=True, ensure_ascii=False))
+
+        now = time.monotonic()
+        cached = self.pages.get(key)
+        if cached is not None and cached[4] > now and cached[0] <= cursor \
+                and (cursor + size <= cached[0] + len(cached[1]) or not cached[2]):
+            start, items, more, page, _ = cached
+            self.served += 1
+        else:
+            page = await request({**rest, paging.cursor: cursor, paging.size: paging.max_size})
+            self.upstream_calls += 1
+            items = ((page or {}).get(paging.items) if paging.items else page) or []
+            more = bool((page or {}).get(paging.has_more)) if paging.has_more else len(items) >= paging.max_size
+            start = cursor
+            self.pages[key] = (start, items, more, page, now + self.ttl)
+            self.pages.move_to_end(key)
+            while len(self.pages) > self.max_entries:
+                self.pages.popitem(last=False)
+
+        offset = cursor - start
+        chunk = items[offset:offset + size]
+        if paging.items is None:
+            return chunk
+        has_more = offset + size < len(items) or more
+        result = {**(page or {}), paging.items: chunk}
+        if paging.has_more:
+            result[paging.has_more] = has_more
+        if paging.next_cursor:
+            result.pop(paging.next_cursor, None)
+            if has_more:
+                result[paging.next_cursor] = cursor + len(chunk)
+        return result
@@ -0,0 +1,123 @@
+import logging
+import math
+import time
+from typing import Any
+
+from dingtalk.bulk import stream_user_details
+from dingtalk.dingtalk_server import raw_results, result_transforms, use_mirror
+from dingtalk.pagination import OAPI, max_page_size
+
+# Largest page of topapi/user/listsimple and topapi/v2/user/list.
+PAGE = min(max_page_size(f"{OAPI}/topapi/user/listsimple"), max_page_size(f"{OAPI}/topapi/v2/user/list"))
+
+# Fields topapi/user/listsimple returns; topapi/v2/user/list returns the
+# rest of the usual fields, except those only topapi/v2/user/get has.
+SIMPLE_FIELDS = {"userid", "name"}
+DETAIL_ONLY_FIELDS = {"manager_userid", "senior", "real_authed", "role_list", "union_emp_ext", "leader_in_dept",
+                      "dept_order_list"}
+
+# Routes in order of preference among plans of equal cost.
+ROUTES = ["mirror", "listsimple", "list", "listid"]
+
+class DirectoryPlanner:
+    """
+    Chooses how to list a department's users, by the number of upstream
+    calls each route would take.
+
+    The routes are the tenant's mirror (no calls, while the department's
+    crawl is younger than the accepted age and the fields are in list
+    records), topapi/user/listsimple pages (userid and name only),
+    topapi/v2/user/list pages, and topapi/user/listid followed by
+    topapi/v2/user/get for each member the mirror has no fresh record of
+    (the only route for fields that only user details carry). Member counts
+    come from the mirror; without one, a department is assumed to fill one
+    page.
+    """
+
+    def __init__(self, contacts):
+        self.logger = logging.getLogger(__name__)
+        self.contacts = contacts
+
+    def plan(self, dept_id: int, fields: list[str] | None = None, max_age: float | None = None) -> dict[str, Any]:
+        """The cheapest route, its estimated call count and the estimates of the others."""
+        store = self.contacts.mirror
+        if max_age is None:
+            max_age = store.max_age if store is not None else 0
+        since = time.time() - max_age
+        fields = set(fields or [])
+        needs_detail = bool(fields & DETAIL_ONLY_FIELDS)
+
+        members = None
+        crawled_at = store.crawled_at(dept_id) if store is not None else None
+        if crawled_at is not None:
+            members = store.department_user_ids(dept_id)
+        count = len(members) if members is not None else PAGE
+        pages = max(math.ceil(count / PAGE), 1)
+
+        costs: dict[str, int] = {}
+        if crawled_at is not None and crawled_at >= since and not needs_detail:
+            costs["mirror"] = 0
+        if fields and fields <= SIMPLE_FIELDS:
+            costs["listsimple"] = pages
+        if not needs_detail:
+            costs["list"] = pages
+        cached = len(store.users_synced_since(members, since, needs_detail)) if members else 0
+        costs["listid"] = 1 + count - cached
+
+        route = min(costs, key=lambda r: (costs[r], ROUTES.index(r)))
+        plan = {
+            "route": route,
+            "estimated_calls": costs[route],
+            "estimated_members": count if members is not None else None,
+            "cached_members": cached,
+            "max_age": max_age,
+            "alternatives": {r: c for r, c in costs.items() if r != route},
+        }
+        self.logger.info(f"Department {dept_id} users plan: {plan}")
+        return plan
+
+    async def run(self, dept_id: int, fields: list[str] | None = None, max_age: float | None = None,
+                  concurrency: int = 10) -> dict[str, Any]:
+        """List the department's users along the planned route, with only `fields` if given."""
+        plan = self.plan(dept_id, fields, max_age)
+        tokens = raw_results.set(True), use_mirror.set(False), result_transforms.set(())
+        try:
+            users, calls = await getattr(self, f"_{plan['route']}")(dept_id, plan, fields, concurrency)
+        finally:
+            raw_results.reset(tokens[0])
+            use_mirror.reset(tokens[1])
+            result_transforms.reset(tokens[2])
+        if fields:
+            users = [{k: u[k] for k in ["userid", *fields, "error"] if k in u} for u in users]
+        return {"plan": {**plan, "calls": calls}, "count": len(users), "list": users}
+
+    async def _mirror(self, dept_id, plan, fields, concurrency) -> tuple[list[dict[str, Any]], int]:
+        return self.contacts.mirror.department_users(dept_id, 0, 2 ** 31)["list"], 0
+
+    async def _pages(self, method, dept_id: int) -> tuple[list[dict[str, Any]], int]:
+        users, cursor, calls = [], 0, 0
+        while True:
+            page = await method(dept_id, cursor, PAGE)
+            calls += 1
+            users.extend(page.get("list") or [])
+            if not page.get("has_more"):
+                return users, calls
+            cursor = page["next_cursor"]
+
+    async def _listsimple(self, dept_id, plan, fields, concurrency) -> tuple[list[dict[str, Any]], int]:
+        return await self._pages(self.contacts.get_department_user_simple, dept_id)
+
+    async def _list(self, dept_id, plan, fields, concurrency) -> tuple[list[dict[str, Any]], int]:
+        return await self._pages(self.contacts.get_department_user_details, dept_id)
+
+    async def _listid(self, dept_id, plan, fields, concurrency) -> tuple[list[dict[str, Any]], int]:
+        userids = (await self.contacts.get_department_user_id_list(dept_id)).get("userid_list") or []
+        cached = {}
+        if self.contacts.mirror is not None:
+            cached = self.contacts.mirror.users_synced_since(
+                userids, time.time() - plan["max_age"], bool(set(fields or []) & DETAIL_ONLY_FIELDS))
+        missing = [u for u in userids if u not in cached]
+        fetched = {}
+        async for entry in stream_user_details(self.contacts, missing, concurrency=concurrency):
+            fetched[entry["userid"]] = entry.get("detail") or {"userid": entry["userid"], "error": entry["error"]}
+        return [cached.get(u) or fetched[u] for u in userids], 1 + len(missing)
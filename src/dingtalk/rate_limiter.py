@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+class RateLimiter:
+    """
+    Token bucket limiting the number of Dingtalk API calls per second.
+
+    Waiters are served in arrival order; a qps of 0 disables limiting.
+    """
+
+    def __init__(self, qps: float, burst: int | None = None):
+        self.qps = qps
+        self.capacity = burst or max(1, int(qps))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n: int = 1):
+        if self.qps <= 0:
+            return
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.qps)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.qps)
+
+_rate_limiters: dict[str, RateLimiter] = {}
+
+def get_rate_limiter(name: str, qps: float) -> RateLimiter:
+    """
+    Return the process-wide rate limiter for `name`, creating it on first use.
+
+    Servers using the same app credentials share one budget.
+    """
+    if name not in _rate_limiters:
+        _rate_limiters[name] = RateLimiter(qps)
+    return _rate_limiters[name]
@@ -0,0 +1,132 @@
+from typing import Any, Callable
+
+_MISSING = object()
+
+FILTER_OPS = ["eq", "ne", "gt", "gte", "lt", "lte", "in", "contains", "startswith", "exists"]
+
+def find_items(data: Any) -> tuple[list | None, Callable[[list], Any]]:
+    """
+    Locate the list of items in a tool result.
+
+    A result is either a list of items, a page (a dict holding one list of
+    dicts next to scalar paging fields such as has_more/next_cursor), or a
+    single record. Returns the items, or None for a single record, together
+    with a function that rebuilds the result around a new item list.
+    """
+    if isinstance(data, list):
+        return data, lambda items: items
+    if isinstance(data, dict):
+        lists = [k for k, v in data.items() if isinstance(v, list)]
+        if len(lists) == 1 and all(isinstance(i, dict) for i in data[lists[0]]) \
+                and all(not isinstance(v, dict) for v in data.values()):
+            key = lists[0]
+            return data[key], lambda items: {**data, key: items}
+    return None, lambda items: data
+
+def get_path(value: Any, path: str) -> Any:
+    for key in path.split("."):
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return _MISSING
+    return value
+
+def _field_tree(fields: list[str]) -> dict[str, dict]:
+    tree: dict[str, dict] = {}
+    for field in fields:
+        node = tree
+        for key in field.split("."):
+            node = node.setdefault(key, {})
+    return tree
+
+def _project(value: Any, tree: dict[str, dict]) -> Any:
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(v, tree) for v in value]
+    if isinstance(value, dict):
+        return {k: _project(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+def _compare(actual: Any, op: str, expected: Any) -> bool:
+    match op:
+        case "exists":
+            return (actual is not _MISSING) == (expected if expected is not None else True)
+        case _ if actual is _MISSING:
+            return False
+        case "eq":
+            return actual == expected
+        case "ne":
+            return actual != expected
+        case "gt":
+            return actual is not None and actual > expected
+        case "gte":
+            return actual is not None and actual >= expected
+        case "lt":
+            return actual is not None and actual < expected
+        case "lte":
+            return actual is not None and actual <= expected
+        case "in":
+            return actual in expected
+        case "contains":
+            return actual is not None and expected in actual
+        case "startswith":
+            return isinstance(actual, str) and actual.startswith(expected)
+        case _:
+            raise ValueError(f"Unknown filter op: {op}")
+
+def matches(item: Any, predicates: list[dict[str, Any]]) -> bool:
+    return all(_compare(get_path(item, p["field"]), p.get("op", "eq"), p.get("value")) for p in predicates)
+
+def make_shaper(fields: list[str] | None = None,
+                filter: list[dict[str, Any]] | None = None) -> Callable[[Any], Any]:
+    """
+    Build a result transform keeping only items matching every `filter`
+    predicate and only the `fields` of each item.
+
+    Field paths are dotted and relative to each item. A predicate is
+    `{"field": ..., "op": ..., "value": ...}` with op one of eq (default),
+    ne, gt, gte, lt, lte, in, contains, startswith or exists.
+    """
+    tree = _field_tree(fields) if fields else {}
+    predicates = filter or []
+    for p in predicates:
+        if p.get("op", "eq") not in FILTER_OPS:
+            raise ValueError(f"Unknown filter op: {p['op']}")
+
+    def shape(data: Any) -> Any:
+        items, rebuild = find_items(data)
+        if items is None:
+            return _project(data, tree)
+        if predicates:
+            items = [item for item in items if matches(item, predicates)]
+        return rebuild([_project(item, tree) for item in items])
+
+    return shape
+
+TOOL_ARGUMENTS = {
+    "fields": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "只返回结果中每一项的这些字段，嵌套字段用 . 分隔，如 [\"userid\", \"name\"]。",
+    },
+    "filter": {
+        "type": "array",
+        "description": "只返回满足全部条件的项。",
+        "items": {
+            "type": "object",
+            "properties": {
+                "field": {"type": "string", "description": "字段路径，嵌套字段用 . 分隔。"},
+                "op": {
+                    "type": "string",
+                    "enum": FILTER_OPS,
+                    "description": "比较方式，默认为 eq。",
+                },
+                "value": {"description": "比较的值。"},
+            },
+            "required": ["field"],
+        },
+    },
+}
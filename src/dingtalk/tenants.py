@@ -0,0 +1,130 @@
+import json as JSON
+import logging
+import os
+from typing import Any
+
+from dotenv import load_dotenv
+
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.im import DingtalkIMServer
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.rate_limiter import RateLimiter
+
+class Tenant:
+    """
+    One Dingtalk app (corp) and the servers calling the API on its behalf.
+
+    The contacts and IM servers of a tenant use the tenant's own credentials,
+    token cache, HTTP connection pool and rate-limit bucket; nothing is shared
+    with other tenants except the event loop.
+
+    With a `mirror_path`, the tenant also keeps a local mirror of its
+    organization there, managed by `mirror`.
+    """
+
+    def __init__(self, name: str, app_key: str, app_secret: str,
+                 qps: float | None = None, max_connections: int | None = None,
+                 mirror_path: str | None = None):
+        # Only the default tenant may take its credentials from DD_APP_KEY
+        # and DD_APP_SECRET; any other tenant would silently use the default app.
+        if name != "default" and not (app_key and app_secret):
+            raise ValueError(f"Tenant {name} requires both app_key and app_secret.")
+        self.name = name
+        self.rate_limiter = RateLimiter(qps if qps is not None else float(os.getenv("DD_QPS", "20")))
+        kwargs = {
+            "tenant": name,
+            "app_key": app_key,
+            "app_secret": app_secret,
+            "qps": qps,
+            "max_connections": max_connections,
+            "rate_limiter": self.rate_limiter,
+        }
+        self.contacts = DingtalkContactsServer(**kwargs)
+        self.im = DingtalkIMServer(**kwargs)
+        self.mirror = None
+        if mirror_path:
+            os.makedirs(os.path.dirname(mirror_path) or ".", exist_ok=True)
+            store = MirrorStore(mirror_path, float(os.getenv("DD_MIRROR_MAX_AGE", "3600")))
+            self.mirror = DingtalkMirrorServer(self.contacts, store)
+
+    async def cleanup(self):
+        await self.contacts.cleanup()
+        await self.im.cleanup()
+        if self.mirror:
+            await self.mirror.cleanup()
+
+class TenantRegistry:
+    """
+    Tenant configurations by name, with servers created on first use.
+
+    Configurations look like:
+
+        {"corp_a": {"app_key": "...", "app_secret": "...", "qps": 20, "max_connections": 50,
+                    "mirror_path": "corp_a.db"}}
+
+    Without a `mirror_path`, tenants get an organization mirror at
+    `<DD_MIRROR_DIR>/<name>.db` when DD_MIRROR_DIR is set.
+    """
+
+    def __init__(self, configs: dict[str, dict[str, Any]], default: str | None = None):
+        if not configs:
+            raise ValueError("At least one tenant is required.")
+        self.logger = logging.getLogger(__name__)
+        self.configs = configs
+        self.default = default or ("default" if "default" in configs else next(iter(configs)))
+        self.tenants: dict[str, Tenant] = {}
+
+    @classmethod
+    def from_env(cls) -> "TenantRegistry":
+        """
+        Load tenants from the JSON file named by DD_TENANTS_FILE, each of which
+        must have its own app_key and app_secret. DD_APP_KEY and DD_APP_SECRET,
+        when set, add a tenant named "default".
+        """
+        load_dotenv()
+        configs: dict[str, dict[str, Any]] = {}
+        if os.getenv("DD_APP_KEY") or not os.getenv("DD_TENANTS_FILE"):
+            configs["default"] = {
+                "app_key": os.getenv("DD_APP_KEY"),
+                "app_secret": os.getenv("DD_APP_SECRET"),
+            }
+        if path := os.getenv("DD_TENANTS_FILE"):
+            with open(path, encoding="utf-8") as f:
+                tenants = JSON.load(f)
+            for name, config in tenants.items():
+                if not (config.get("app_key") and config.get("app_secret")):
+                    raise ValueError(f"Tenant {name} in {path} requires both app_key and app_secret.")
+            configs.update(tenants)
+        return cls(configs, os.getenv("DD_DEFAULT_TENANT"))
+
+    def names(self) -> list[str]:
+        return list(self.configs)
+
+    def mirror_path(self, name: str) -> str | None:
+        if path := self.configs[name].get("mirror_path"):
+            return path
+        if mirror_dir := os.getenv("DD_MIRROR_DIR"):
+            return os.path.join(mirror_dir, f"{name}.db")
+        return None
+
+    def get(self, name: str | None = None) -> Tenant:
+        name = name or self.default
+        if name not in self.tenants:
+            if name not in self.configs:
+                raise ValueError(f"Unknown tenant: {name}")
+            config = self.configs[name]
+            self.tenants[name] = Tenant(
+                name,
+                config.get("app_key"),
+                config.get("app_secret"),
+                qps=config.get("qps"),
+                max_connections=config.get("max_connections"),
+                mirror_path=self.mirror_path(name),
+            )
+            self.logger.info(f"Tenant {name} initialized.")
+        return self.tenants[name]
+
+    async def cleanup(self):
+        for tenant in self.tenants.values():
+            await tenant.cleanup()
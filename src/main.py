@@ -1,46 +1,258 @@
+import argparse
 import asyncio
+import inspect
+import json as JSON
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from contextlib import asynccontextmanager
 from typing import Any
+import aiohttp
+from dingtalk import batch, continuation, delta, shaping
+from dingtalk.broker import TokenBroker
 from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.continuation import ContinuationStore
+from dingtalk.delta import DeltaStore
+from dingtalk.dingtalk_server import progress, raw_results, result_transforms
 from dingtalk.im import DingtalkIMServer
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.tenants import TenantRegistry
 from mcp.server import Server as MCPServer
+from mcp.server.sse import SseServerTransport
 from mcp import stdio_server
 import mcp.types as types
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+import uvicorn
+from dotenv import load_dotenv
 
-async def serve():
+# Seconds to wait for open SSE streams on shutdown before cancelling them.
+SHUTDOWN_TIMEOUT = 5
+# Seconds to wait for the token broker to listen before giving up.
+BROKER_START_TIMEOUT = 10
+
+def add_tool_arguments(tools: list[types.Tool], properties: dict[str, Any],
+                       only: set[str] | None = None) -> list[types.Tool]:
+    """
+    Add arguments handled by the server itself, rather than by the tool
+    method, to the input schema of every tool, or of the tools named in
+    `only`. A tool's own argument of the same name takes precedence.
+    """
+    return [
+        tool.model_copy(update={"inputSchema": {
+            **tool.inputSchema,
+            "properties": {**properties, **tool.inputSchema.get("properties", {})},
+        }})
+        if only is None or tool.name in only else tool
+        for tool in tools
+    ]
+
+def pop_server_arguments(method: Any, arguments: dict[str, Any], names: list[str]) -> list[Any]:
+    """
+    Remove the server-handled arguments `names` from `arguments`, leaving
+    any the tool method takes itself.
+    """
+    parameters = inspect.signature(method).parameters
+    return [arguments.pop(n, None) if n not in parameters else None for n in names]
+
+def progress_reporter(mcp_server: MCPServer) -> Any:
+    """
+    Callback sending progress notifications for the current request, None
+    unless the client asked for them with a progress token.
+    """
+    try:
+        context = mcp_server.request_context
+    except LookupError:
+        return None
+    token = context.meta.progressToken if context.meta is not None else None
+    if token is None:
+        return None
+
+    async def report(done: float, total: float | None = None):
+        await context.session.send_progress_notification(token, done, total)
+    return report
+
+def create_server(registry: TenantRegistry | None = None) -> tuple[MCPServer, TenantRegistry]:
+    """
+    Build the MCP server and the tenant registry backing its tools.
+
+    Each tenant's Dingtalk servers own its HTTP session and access token, so
+    every client connected to the returned MCP server shares them. A call
+    picks its tenant with the `tenant` argument, defaulting to the
+    registry's default tenant.
+    """
+    registry = registry or TenantRegistry.from_env()
     _mcp_server = MCPServer(name="DingtalkIMServer")
-    dingtalkContactsServer = DingtalkContactsServer()
-    dingtalkIMServer = DingtalkIMServer()
 
     tool_contacts = [f for f in dir(DingtalkContactsServer) if not f.startswith("__")]
     tool_im = [f for f in dir(DingtalkIMServer) if not f.startswith("__")]
+    tool_mirror = [f for f in dir(DingtalkMirrorServer) if f.startswith("mirror_")]
+    # Tool schemas are static, build them once and share them across sessions.
+    default_tenant = registry.get()
+    continuations = ContinuationStore()
+    deltas = DeltaStore()
+    tools = default_tenant.contacts.list_tools() + default_tenant.im.list_tools()
+    if any(registry.mirror_path(n) for n in registry.names()):
+        tools += DingtalkMirrorServer.list_tools()
+    tools = add_tool_arguments(tools, {**shaping.TOOL_ARGUMENTS, **continuation.TOOL_ARGUMENTS})
+    tools = add_tool_arguments(tools, delta.TOOL_ARGUMENTS, delta.POLLING_TOOLS) + batch.list_tools()
+    if len(registry.names()) > 1:
+        tools = add_tool_arguments(tools, {
+            "tenant": {
+                "type": "string",
+                "enum": registry.names(),
+                "description": f"调用接口所使用的企业应用，默认为 {registry.default}。",
+            },
+        })
+    # Continuation handles are not tied to a tenant, so fetch_continuation
+    # takes no tenant argument.
+    tools += continuations.list_tools()
+
+    async def call_tool(name: str, arguments: dict[str, Any]) -> Any:
+        arguments = dict(arguments)
+        tenant = registry.get(arguments.pop("tenant", None))
+        method = None
+        match name:
+            case n if n in tool_im:
+                method = getattr(tenant.im, n)
+            case n if n in tool_contacts:
+                method = getattr(tenant.contacts, n)
+            case n if n in tool_mirror:
+                if tenant.mirror is None:
+                    raise Exception(f"Tenant {tenant.name} has no organization mirror")
+                method = getattr(tenant.mirror, n)
+
+        if not callable(method):
+            raise Exception(f"Tool {name} not found")
+        transforms = result_transforms.get()
+        fields, filter, since, max_output_chars = pop_server_arguments(
+            method, arguments, ["fields", "filter", "since", "max_output_chars"])
+        if fields or filter:
+            transforms += (shaping.make_shaper(fields, filter),)
+        if since is not None:
+            transforms += (deltas.make_differ(since),)
+        if max_output_chars:
+            transforms += (continuations.make_chunker(int(max_output_chars)),)
+        # The tool runs with raw results and no transforms, so the upstream
+        # calls it makes internally see whole records; the caller's
+        # transforms only apply to what the tool returns.
+        tokens = raw_results.set(True), result_transforms.set(())
+        try:
+            result = await method(**arguments)
+        finally:
+            raw_results.reset(tokens[0])
+            result_transforms.reset(tokens[1])
+        token = result_transforms.set(transforms)
+        try:
+            return tenant.contacts.render(result)
+        finally:
+            result_transforms.reset(token)
+
+    async def call_batch(calls: list[dict[str, Any]], max_concurrency: int = 10, tenant: str | None = None) -> str:
+        if tenant is not None:
+            calls = [{**c, "arguments": {"tenant": tenant, **c.get("arguments", {})}} for c in calls]
+        results = await batch.run_batch(calls, call_tool, int(max_concurrency))
+        return JSON.dumps(results, ensure_ascii=False, indent=4)
 
     @_mcp_server.list_tools()
     async def handle_list_tools() -> list[types.Tool]:
         """
         List all available tools.
         """
-        return dingtalkContactsServer.list_tools() + dingtalkIMServer.list_tools()
-    
+        return tools
+
     @_mcp_server.call_tool()
     async def handle_tool_call(
         name: str, arguments: dict[str, Any] | None = None
     ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        token = progress.set(progress_reporter(_mcp_server))
         try:
-            match name:
-                case n if n in tool_im:
-                    method = getattr(dingtalkIMServer, n)
-                case n if n in tool_contacts:
-                    method = getattr(dingtalkContactsServer, n)
-
-            if callable(method):
-                result = await method(**arguments)
-                return [types.TextContent(type="text", text=str(result))]
+            if name == "batch_call":
+                result = await call_batch(**(arguments or {}))
+            elif name == "fetch_continuation":
+                # Handles are not tied to a tenant; ignore one sent anyway.
+                result = continuations.fetch(**{k: v for k, v in (arguments or {}).items() if k != "tenant"})
             else:
-                raise Exception(f"Tool {name} not found")
+                result = await call_tool(name, arguments or {})
+            return [types.TextContent(type="text", text=str(result))]
 
         except Exception as e:
             return [types.TextContent(type="text", text=f"Error: {str(e)}")]
+        finally:
+            progress.reset(token)
+
+    return _mcp_server, registry
+
+async def cleanup(registry: TenantRegistry):
+    await registry.cleanup()
+
+def create_sse_app(mcp_server: MCPServer, worker_id: int | None = None, run_dir: str | None = None) -> Starlette:
+    """
+    Build an ASGI app serving the MCP server over HTTP with SSE.
+
+    Clients open a stream with GET /sse and post their requests to the
+    message endpoint announced on that stream; each stream is its own MCP
+    session.
+
+    In multi-worker mode the endpoint is /messages/<worker_id>/. The kernel
+    may hand a POST to any worker, so posts for another worker's session are
+    forwarded to that worker's Unix socket in `run_dir`, over one client
+    session per peer that is closed when the app shuts down.
+    """
+    message_path = "/messages/" if worker_id is None else f"/messages/{worker_id}/"
+    sse = SseServerTransport(message_path)
+
+    async def handle_sse(request):
+        async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+            await mcp_server.run(
+                read_stream,
+                write_stream,
+                mcp_server.create_initialization_options(),
+            )
 
+    routes = [
+        Route("/sse", endpoint=handle_sse),
+        Mount(message_path, app=sse.handle_post_message),
+    ]
+
+    peer_sessions: dict[int, aiohttp.ClientSession] = {}
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette):
+        app.state.peer_sessions = peer_sessions
+        try:
+            yield
+        finally:
+            for session in peer_sessions.values():
+                await session.close()
+            peer_sessions.clear()
+
+    if worker_id is not None:
+
+        async def forward_message(request):
+            peer = request.path_params["worker"]
+            if peer not in peer_sessions:
+                connector = aiohttp.UnixConnector(path=worker_socket_path(run_dir, peer))
+                peer_sessions[peer] = aiohttp.ClientSession(connector=connector)
+            async with peer_sessions[peer].post(
+                f"http://worker{request.url.path}",
+                params=request.query_params,
+                data=await request.body(),
+                headers={"content-type": request.headers.get("content-type", "application/json")},
+            ) as response:
+                return Response(await response.read(), status_code=response.status)
+
+        routes.append(Route("/messages/{worker:int}/", endpoint=forward_message, methods=["POST"]))
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+async def serve_stdio():
+    _mcp_server, registry = create_server()
     async with stdio_server() as (read_stream, write_stream):
         try:
             await _mcp_server.run(
@@ -51,15 +263,138 @@ async def serve():
         except Exception as e:
             raise
         finally:
-            await dingtalkContactsServer.cleanup()
-            await dingtalkIMServer.cleanup()
-    
+            await cleanup(registry)
+
+async def serve_sse(host: str, port: int):
+    _mcp_server, registry = create_server()
+    config = uvicorn.Config(create_sse_app(_mcp_server), host=host, port=port, log_level="info",
+                            timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
+    try:
+        await uvicorn.Server(config).serve()
+    finally:
+        await cleanup(registry)
+
+def worker_socket_path(run_dir: str, worker_id: int) -> str:
+    return os.path.join(run_dir, f"worker-{worker_id}.sock")
+
+async def run_token_broker(path: str):
+    registry = TenantRegistry.from_env()
+    broker = TokenBroker(path, lambda name: registry.get(name).contacts)
+    try:
+        await broker.serve_forever()
+    finally:
+        await broker.close()
+        await registry.cleanup()
+
+async def serve_worker(worker_id: int, sock: socket.socket, run_dir: str):
+    _mcp_server, registry = create_server()
+    uds = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    uds.bind(worker_socket_path(run_dir, worker_id))
+    config = uvicorn.Config(create_sse_app(_mcp_server, worker_id, run_dir), log_level="info",
+                            timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
+    try:
+        await uvicorn.Server(config).serve(sockets=[sock, uds])
+    finally:
+        await cleanup(registry)
+
+def run_token_broker_process(path: str):
+    asyncio.run(run_token_broker(path))
+
+def run_worker_process(worker_id: int, sock: socket.socket, run_dir: str, broker_path: str):
+    os.environ["DD_TOKEN_BROKER"] = broker_path
+    asyncio.run(serve_worker(worker_id, sock, run_dir))
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
+
+def serve_workers(host: str, port: int, workers: int):
+    """
+    Pre-fork `workers` SSE server processes sharing one listening socket.
+
+    A separate broker process owns each tenant's access token and
+    rate-limit budget; workers reach it through a Unix socket, so adding workers
+    neither multiplies token requests nor raises the QPS sent to Dingtalk.
+    """
+    run_dir = tempfile.mkdtemp(prefix="dingtalk-mcp-")
+    broker_path = os.path.join(run_dir, "broker.sock")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    ctx = multiprocessing.get_context("fork")
+    broker = ctx.Process(target=run_token_broker_process, args=(broker_path,), daemon=True)
+    processes = []
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(1024)
+        sock.set_inheritable(True)
+
+        broker.start()
+        deadline = time.monotonic() + BROKER_START_TIMEOUT
+        while not os.path.exists(broker_path):
+            if not broker.is_alive():
+                raise Exception(f"Token broker exited with code {broker.exitcode}")
+            if time.monotonic() > deadline:
+                raise Exception(f"Token broker did not start within {BROKER_START_TIMEOUT} seconds")
+            time.sleep(0.01)
+
+        processes = [
+            ctx.Process(target=run_worker_process, args=(i, sock, run_dir, broker_path))
+            for i in range(workers)
+        ]
+        for p in processes:
+            p.start()
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.kill()
+        if broker.is_alive():
+            broker.terminate()
+            broker.join(timeout=10)
+        sock.close()
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+async def serve(transport: str = "stdio", host: str = "127.0.0.1", port: int = 8000):
+    match transport:
+        case "stdio":
+            await serve_stdio()
+        case "sse":
+            await serve_sse(host, port)
+        case _:
+            raise ValueError(f"Unknown transport: {transport}")
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Dingtalk MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse"],
+                        default=os.getenv("DD_MCP_TRANSPORT", "stdio"))
+    parser.add_argument("--host", default=os.getenv("DD_MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("DD_MCP_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("DD_MCP_WORKERS", "1")),
+                        help="number of worker processes, sse transport only")
+    return parser.parse_args(argv)
+
 class ServerWrapper():
     """A wrapper to compat with mcp[cli]"""
     def run(self):
-        asyncio.run(serve())
+        load_dotenv()
+        asyncio.run(serve(os.getenv("DD_MCP_TRANSPORT", "stdio"),
+                          os.getenv("DD_MCP_HOST", "127.0.0.1"),
+                          int(os.getenv("DD_MCP_PORT", "8000"))))
 
 server = ServerWrapper()
 
 if __name__ == '__main__':
-    server.run()
\ No newline at end of file
+    load_dotenv()
+    args = parse_args()
+    if args.workers > 1:
+        if args.transport != "sse":
+            raise SystemExit("--workers requires --transport sse")
+        serve_workers(args.host, args.port, args.workers)
+    else:
+        asyncio.run(serve(args.transport, args.host, args.port))
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.batch import resolve_path, run_batch
+from dingtalk.dingtalk_server import raw_results
+
+class TestBatch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+
+    async def call_tool(self, name, arguments):
+        self.calls.append((name, arguments, raw_results.get()))
+        await asyncio.sleep(0)
+        match name:
+            case "list_ids":
+                return {"userid_list": ["u1", "u2"]}
+            case "get_user":
+                return {"userid": arguments["userid"], "name": arguments["userid"].upper()}
+            case "fail":
+                raise Exception("boom")
+
+    def test_resolve_path(self):
+        data = {"list": [{"userid": "a"}, {"userid": "b"}]}
+        self.assertEqual(resolve_path(data, ["list", "1", "userid"]), "b")
+        self.assertEqual(resolve_path(data, ["list", "*", "userid"]), ["a", "b"])
+
+    async def test_independent_calls(self):
+        results = await run_batch([
+            {"tool": "get_user", "arguments": {"userid": "a"}},
+            {"tool": "get_user", "arguments": {"userid": "b"}},
+        ], self.call_tool)
+        self.assertEqual([r["result"]["name"] for r in results], ["A", "B"])
+        self.assertEqual([r["id"] for r in results], ["0", "1"])
+        # steps get parsed results rather than JSON text
+        self.assertTrue(all(raw for _, _, raw in self.calls))
+        self.assertFalse(raw_results.get())
+
+    async def test_references(self):
+        results = await run_batch([
+            {"id": "second", "tool": "get_user", "arguments": {"userid": {"$ref": "ids.userid_list.1"}}},
+            {"id": "ids", "tool": "list_ids"},
+        ], self.call_tool)
+        self.assertEqual(results[0]["result"], {"userid": "u2", "name": "U2"})
+        self.assertEqual(self.calls[0][0], "list_ids")
+
+    async def test_errors_are_per_item(self):
+        results = await run_batch([
+            {"id": "bad", "tool": "fail"},
+            {"id": "after", "tool": "get_user", "arguments": {"userid": {"$ref": "bad.userid"}}},
+            {"id": "ok", "tool": "get_user", "arguments": {"userid": "c"}},
+        ], self.call_tool)
+        self.assertEqual(results[0]["error"], "boom")
+        self.assertIn("bad", results[1]["error"])
+        self.assertEqual(results[2]["result"]["userid"], "c")
+
+    async def test_invalid_graph(self):
+        with self.assertRaises(ValueError):
+            await run_batch([{"id": "a", "tool": "get_user", "arguments": {"userid": {"$ref": "missing"}}}], self.call_tool)
+        with self.assertRaises(ValueError):
+            await run_batch([
+                {"id": "a", "tool": "get_user", "arguments": {"userid": {"$ref": "b"}}},
+                {"id": "b", "tool": "get_user", "arguments": {"userid": {"$ref": "a"}}},
+            ], self.call_tool)
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.broker import BrokerClient, TokenBroker
+from dingtalk.rate_limiter import RateLimiter
+
+class FakeTokenSource:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.token_expires = time.time() + 7000
+        self.rate_limiter = RateLimiter(qps=1000)
+
+    async def get_access_token(self):
+        self.calls += 1
+        return f"token-{self.name}"
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_then_throttle(self):
+        limiter = RateLimiter(qps=50, burst=5)
+        start = time.monotonic()
+        for _ in range(10):
+            await limiter.acquire()
+        # 5 permits from the burst, 5 more at 50/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+
+    async def test_disabled(self):
+        limiter = RateLimiter(qps=0)
+        for _ in range(1000):
+            await limiter.acquire()
+
+class TestTokenBroker(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "broker.sock")
+        self.sources = {"default": FakeTokenSource("default"), "corp_b": FakeTokenSource("corp_b")}
+        self.broker = TokenBroker(self.path, lambda name: self.sources[name])
+        await self.broker.start()
+
+    async def asyncTearDown(self):
+        await self.broker.close()
+
+    async def test_token_shared_and_cached(self):
+        clients = [BrokerClient(self.path) for _ in range(3)]
+        for client in clients:
+            token, expires = await client.get_token()
+            self.assertEqual(token, "token-default")
+            await client.get_token()
+        self.assertEqual(self.sources["default"].calls, 3)
+        for client in clients:
+            await client.close()
+
+    async def test_token_per_tenant(self):
+        client = BrokerClient(self.path, "corp_b")
+        token, expires = await client.get_token()
+        self.assertEqual(token, "token-corp_b")
+        self.assertEqual(self.sources["default"].calls, 0)
+        await client.close()
+
+    async def test_concurrent_acquire(self):
+        client = BrokerClient(self.path)
+        await asyncio.gather(*(client.acquire() for _ in range(50)))
+        await client.close()
+
+    async def test_unknown_op(self):
+        client = BrokerClient(self.path)
+        with self.assertRaises(Exception):
+            await client.request("nope")
+        await client.close()
@@ -0,0 +1,70 @@
+import asyncio
+import json as JSON
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.bulk import parse_userids, stream_user_details
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import progress, raw_results
+from dingtalk.mirror.store import MirrorStore
+
+class TestBulkUserDetails(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:")
+        self.store.record("https://oapi.dingtalk.com/topapi/v2/user/get", {"userid": "m1"},
+                          {"userid": "m1", "name": "镜像用户"})
+        self.server = DingtalkContactsServer(app_key="key", app_secret="secret")
+        self.server.mirror = self.store
+        self.fetched = []
+        self.in_flight = self.max_in_flight = 0
+        self.server.get_user_detail = self.get_user_detail
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    async def get_user_detail(self, userid, language="zh_CN"):
+        self.fetched.append((userid, raw_results.get()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # later ids finish first
+        await asyncio.sleep(0.001 * (10 - int(userid[1:]) % 10))
+        self.in_flight -= 1
+        if userid == "u3":
+            raise Exception("POST request failed: {'errcode': 60121, 'errmsg': '找不到该用户'}")
+        return {"userid": userid, "name": userid.upper()}
+
+    def test_parse_userids(self):
+        self.assertEqual(parse_userids("u1, u2\nu1\n\nu3"), ["u1", "u2", "u3"])
+        self.assertEqual(parse_userids(["u2", "u1", "u2"]), ["u2", "u1"])
+
+    async def test_stream(self):
+        entries = [e async for e in stream_user_details(self.server, ["m1", "u1", "u2", "u3", "u1", "m1"], concurrency=2)]
+        self.assertEqual(entries[0], {"userid": "m1", "source": "mirror", "detail": {"userid": "m1", "name": "镜像用户"}})
+        # completion order, not request order
+        self.assertEqual([e["userid"] for e in entries[1:]], ["u2", "u1", "u3"])
+        self.assertIn("60121", entries[3]["error"])
+        self.assertEqual(sorted(self.fetched), [("u1", True), ("u2", True), ("u3", True)])
+        self.assertEqual(self.max_in_flight, 2)
+        self.assertFalse(raw_results.get())
+
+    async def test_tool(self):
+        reports = []
+
+        async def report(done, total=None):
+            reports.append((done, total))
+        token = progress.set(report)
+        try:
+            result = JSON.loads(await self.server.get_user_details_bulk(
+                [f"u{i}" for i in range(8)] + ["m1", "u0"], max_concurrency=3))
+        finally:
+            progress.reset(token)
+        self.assertEqual((result["count"], result["from_mirror"], result["fetched"], result["failed"]), (9, 1, 7, 1))
+        self.assertEqual([e["userid"] for e in result["list"]], [f"u{i}" for i in range(8)] + ["m1"])
+        self.assertEqual(result["list"][4]["detail"]["name"], "U4")
+        self.assertEqual(reports, [(i, 9) for i in range(1, 10)])
+        self.assertLessEqual(self.max_in_flight, 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.mirror.columns import UserColumns
+
+USERS = [
+    {"userid": "u2", "name": "张三", "title": "工程师", "active": True, "hired_date": 1600000000000,
+     "dept_id_list": [2, 3], "extension": "{\"爱好\":\"旅游\"}"},
+    {"userid": "u1", "name": "李四", "title": "工程师", "active": False, "dept_id_list": [2]},
+    {"userid": "u3", "mobile": "13800000000"},
+]
+
+class TestUserColumns(unittest.TestCase):
+    def setUp(self):
+        self.users = UserColumns()
+        self.users.extend((u, None) for u in USERS)
+
+    def test_round_trip(self):
+        for user in USERS:
+            self.assertEqual(self.users.get(user["userid"]), {"dept_id_list": [], **user})
+        self.assertIsNone(self.users.get("u4"))
+
+    def test_columns(self):
+        self.assertEqual(len(self.users.interned["title"].values), 1)
+        self.assertEqual(list(self.users.departments(0)), [2, 3])
+        self.assertEqual(self.users.value("hired_date", 1), None)
+        self.assertEqual(self.users.value("active", 1), False)
+
+    def test_memberships_override_record(self):
+        self.users.append({"userid": "u5", "dept_id_list": [9]}, [4, 5])
+        self.assertEqual(self.users.get("u5")["dept_id_list"], [4, 5])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json as JSON
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.continuation import ContinuationStore
+
+def users_page(n):
+    return {
+        "has_more": False,
+        "list": [{"userid": str(i), "name": f"user {i}", "title": "Engineer"} for i in range(n)],
+    }
+
+class TestContinuation(unittest.TestCase):
+    def setUp(self):
+        self.store = ContinuationStore()
+
+    def test_small_result_untouched(self):
+        page = users_page(2)
+        self.assertIs(self.store.make_chunker(10000)(page), page)
+
+    def test_chunks_at_item_boundaries(self):
+        chunk = self.store.make_chunker(1000)
+        first = chunk(users_page(50))
+        self.assertLessEqual(len(JSON.dumps(first, ensure_ascii=False, indent=4)), 1000)
+        self.assertFalse(first["has_more"])
+        handle = first["continuation"]["handle"]
+        seen = [u["userid"] for u in first["list"]]
+        self.assertEqual(first["continuation"]["remaining"], 50 - len(seen))
+
+        while True:
+            text = self.store.fetch(handle, 1000)
+            self.assertLessEqual(len(text), 1000)
+            page = JSON.loads(text)
+            seen += [u["userid"] for u in page["list"]]
+            if "continuation" not in page:
+                break
+            self.assertEqual(page["continuation"]["handle"], handle)
+        self.assertEqual(seen, [str(i) for i in range(50)])
+        with self.assertRaises(ValueError):
+            self.store.fetch(handle)
+
+    def test_list_result_wrapped(self):
+        depts = [{"dept_id": i, "name": f"dept {i}"} for i in range(100)]
+        first = self.store.make_chunker(500)(depts)
+        self.assertEqual(first["list"][0]["dept_id"], 0)
+        self.assertIn("continuation", first)
+
+    def test_at_least_one_item(self):
+        first = self.store.make_chunker(10)(users_page(3))
+        self.assertEqual(len(first["list"]), 1)
+
+    def test_max_entries(self):
+        store = ContinuationStore(max_entries=2)
+        for _ in range(3):
+            store.make_chunker(300)(users_page(20))
+        self.assertEqual(len(store.entries), 2)
@@ -0,0 +1,41 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.delta import POLLING_TOOLS, DeltaStore, diff
+from dingtalk.im import DingtalkIMServer
+
+class TestDelta(unittest.TestCase):
+    def test_diff(self):
+        self.assertIsNone(diff({"a": [1, 2]}, {"a": [1, 2]}))
+        self.assertEqual(diff({"progress": {"done": 1}, "status": 1}, {"progress": {"done": 3}, "status": 1}),
+                         {"progress": {"done": {"old": 1, "new": 3}}})
+        self.assertEqual(diff({"read_user_id_list": ["a", "b"]}, {"read_user_id_list": ["b", "c"]}),
+                         {"read_user_id_list": {"added": ["c"], "removed": ["a"]}})
+        self.assertEqual(
+            diff([{"userId": "a", "nick": "x"}, {"userId": "b"}], [{"userId": "a", "nick": "y"}, {"userId": "c"}]),
+            {"added": [{"userId": "c"}], "removed": ["b"], "changed": [{"userId": "a", "nick": "y"}]},
+        )
+
+    def test_polling(self):
+        store = DeltaStore()
+        first = store.make_differ("")({"memberUserIds": ["a"], "hasMore": False})
+        handle = first["delta_handle"]
+        self.assertEqual(first["result"]["memberUserIds"], ["a"])
+
+        second = store.make_differ(handle)({"memberUserIds": ["a"], "hasMore": False})
+        self.assertEqual(second, {"delta_handle": handle, "changed": False, "diff": None})
+
+        third = store.make_differ(handle)({"memberUserIds": ["a", "b"], "hasMore": False})
+        self.assertEqual(third["diff"], {"memberUserIds": {"added": ["b"]}})
+
+    def test_polling_tools_registered(self):
+        tools = DingtalkContactsServer(app_key="key", app_secret="secret").list_tools() \
+            + DingtalkIMServer(app_key="key", app_secret="secret").list_tools()
+        self.assertLessEqual(POLLING_TOOLS, {t.name for t in tools})
+
+    def test_unknown_handle(self):
+        with self.assertRaises(ValueError):
+            DeltaStore().make_differ("nope")
@@ -0,0 +1,129 @@
+import unittest
+import csv
+import json as JSON
+import tempfile
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.mirror import export
+from dingtalk.mirror.export import Exporter, export_dir
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.store import MirrorStore
+
+CONTACTS = [{"userid": f"ext{i:03d}", "name": f"客户{i}", "label_ids": [1, 2]} for i in range(250)]
+
+class FakeContacts:
+    def __init__(self):
+        self.offsets = []
+
+    async def get_external_contact_list(self, size=None, offset=None):
+        self.offsets.append(offset)
+        return CONTACTS[offset:offset + size]
+
+class Interrupted(Exception):
+    pass
+
+class TestExporter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = MirrorStore(os.path.join(self.dir.name, "mirror.db"))
+        self.store.save_departments([{"dept_id": 1, "name": "root"}, {"dept_id": 2, "parent_id": 1, "name": "研发"}])
+        self.store.save_department_users(1, [{"userid": f"u{i:02d}", "name": f"用户{i}", "active": True}
+                                             for i in range(10)])
+        self.store.save_department_users(2, [{"userid": "u03", "name": "用户3", "active": True}])
+        self.roles = RoleIndex(self.store)
+        self.roles.save([{"id": 5, "name": "主管", "groupId": 1, "groupName": "职务"}],
+                        {5: [{"userid": "u01", "name": "用户1", "manageScopes": [{"dept_id": 2}]}]})
+        self.contacts = FakeContacts()
+        self.directory = export_dir(self.store, "full")
+
+    async def asyncTearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def read_jsonl(self, entity: str) -> list[dict]:
+        manifest = self.manifest()
+        rows = []
+        for name in manifest["entities"][entity]["files"]:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                rows.extend(JSON.loads(line) for line in f)
+        return rows
+
+    def manifest(self) -> dict:
+        with open(os.path.join(self.directory, "manifest.json"), encoding="utf-8") as f:
+            return JSON.load(f)
+
+    async def test_jsonl_rotation(self):
+        report = await Exporter(self.contacts, self.store, self.roles, self.directory, rows_per_file=4).run()
+        self.assertEqual(report["rows"], 2 + 10 + 1 + 1 + 250)
+        self.assertEqual(report["entities"]["users"]["files"],
+                         ["users-00001.jsonl", "users-00002.jsonl", "users-00003.jsonl"])
+        self.assertEqual(report["entities"]["users"]["total"], 10)
+        users = self.read_jsonl("users")
+        self.assertEqual([u["userid"] for u in users], [f"u{i:02d}" for i in range(10)])
+        self.assertEqual(users[3]["dept_id_list"], [1, 2])
+        self.assertEqual(self.read_jsonl("role_members"),
+                         [{"role_id": 5, "userid": "u01", "name": "用户1", "manageScopes": [{"dept_id": 2}]}])
+        self.assertEqual(len(self.read_jsonl("external_contacts")), 250)
+        self.assertEqual(self.contacts.offsets, [0, 100, 200])
+        self.assertFalse([f for f in os.listdir(self.directory) if f.endswith(".partial")])
+
+    async def test_csv(self):
+        await Exporter(self.contacts, self.store, self.roles, self.directory, "csv").run(["users", "external_contacts"])
+        with open(os.path.join(self.directory, "users-00001.csv"), encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual((rows[3]["userid"], rows[3]["active"], rows[3]["dept_id_list"]), ("u03", "True", "[1, 2]"))
+        with open(os.path.join(self.directory, "external_contacts-00001.csv"), encoding="utf-8-sig", newline="") as f:
+            self.assertEqual(next(csv.DictReader(f))["label_ids"], "[1, 2]")
+
+    async def test_resume(self):
+        exporter = Exporter(self.contacts, self.store, self.roles, self.directory, rows_per_file=3)
+        original = exporter._rows
+
+        async def interrupted(entity, after):
+            count = 0
+            async for item in original(entity, after):
+                if entity == "users" and count == 7:
+                    raise Interrupted()
+                count += 1
+                yield item
+        exporter._rows = interrupted
+        with self.assertRaises(Interrupted):
+            await exporter.run(["departments", "users"])
+        manifest = self.manifest()
+        self.assertTrue(manifest["entities"]["departments"]["done"])
+        self.assertEqual(manifest["entities"]["users"]["files"], ["users-00001.jsonl", "users-00002.jsonl"])
+        self.assertEqual(manifest["entities"]["users"]["after"], "u05")
+
+        report = await Exporter(self.contacts, self.store, self.roles, self.directory, rows_per_file=3).run(
+            ["departments", "users"])
+        self.assertTrue(report["resumed"])
+        self.assertEqual(report["rows"], 4)
+        self.assertEqual([u["userid"] for u in self.read_jsonl("users")], [f"u{i:02d}" for i in range(10)])
+        self.assertEqual(len(self.read_jsonl("departments")), 2)
+
+        with self.assertRaises(ValueError):
+            await Exporter(self.contacts, self.store, self.roles, self.directory, "csv").run(["users"])
+        report = await Exporter(self.contacts, self.store, self.roles, self.directory, "csv").run(["users"], resume=False)
+        self.assertFalse(report["resumed"])
+        self.assertEqual(sorted(os.listdir(self.directory)), ["manifest.json", "users-00001.csv"])
+
+    async def test_parquet_requires_pyarrow(self):
+        if export.pyarrow is not None:
+            self.skipTest("pyarrow is installed")
+        with self.assertRaises(Exception):
+            Exporter(self.contacts, self.store, self.roles, self.directory, "parquet")
+
+    def test_export_dir(self):
+        self.assertEqual(self.directory, os.path.join(self.dir.name, "mirror.db.exports", "full"))
+        with self.assertRaises(ValueError):
+            export_dir(self.store, "../elsewhere")
+        store = MirrorStore(":memory:")
+        with self.assertRaises(ValueError):
+            export_dir(store, "full")
+        store.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results
+from dingtalk.mirror.external import ExternalContactIndex, mobile_key
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+
+URL = "https://oapi.dingtalk.com/topapi/extcontact"
+
+def contact(n, **fields):
+    return {"userid": f"ext{n}", "name": f"客户{n}", "mobile": f"1390000{n:04d}", "state_code": "86",
+            "company_name": "甲公司" if n % 2 else "乙公司", "follower_user_id": f"u{n % 3}",
+            "label_ids": [1] if n % 2 else [1, 2], **fields}
+
+LABEL_GROUPS = [{"name": "客户类型", "labels": [{"id": 1, "name": "重要"}, {"id": 2, "name": "新客户"}]}]
+
+class FakeContacts:
+    def __init__(self, contacts):
+        self.contacts = contacts
+        self.calls = 0
+
+    async def get_external_contact_list(self, size=None, offset=None):
+        self.calls += 1
+        return self.contacts[offset:offset + size]
+
+    async def get_external_contact_label_list(self, size=None, offset=None):
+        self.calls += 1
+        return LABEL_GROUPS[offset:offset + size]
+
+class TestExternalContactIndex(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:")
+        self.index = ExternalContactIndex(self.store)
+        self.contacts = [contact(n) for n in range(150)]
+        self.report = await self.index.refresh(FakeContacts(self.contacts))
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    def test_refresh(self):
+        self.assertEqual((self.report["contacts"], self.report["added"], self.report["label_groups"]), (150, 150, 1))
+
+    async def test_incremental_refresh(self):
+        contacts = [contact(n, title="经理") if n == 5 else contact(n) for n in range(1, 150)]
+        contacts.insert(0, contact(200))
+        report = await self.index.refresh(FakeContacts(contacts))
+        self.assertEqual((report["added"], report["changed"], report["removed"]), (1, 1, 1))
+        self.assertEqual(self.index.find(size=2)["list"], [contact(200), contact(1)])
+        self.assertIsNone(self.index.get("ext0"))
+
+    def test_find(self):
+        result = self.index.find(label_ids=[1, 2], follower_user_id="u0", size=3)
+        self.assertEqual((result["count"], result["hasMore"]), (25, True))
+        self.assertEqual([c["userid"] for c in result["list"]], ["ext0", "ext6", "ext12"])
+        self.assertEqual(self.index.find(company_name="甲公司")["count"], 75)
+        self.assertEqual(self.index.find(mobile="139-0000-0042")["list"], [contact(42)])
+        self.assertEqual(self.index.find(name=" 客户 7 ")["list"], [contact(7)])
+        self.assertEqual(self.index.find(mobile="13900000042", state_code="852")["count"], 0)
+
+    def test_duplicates(self):
+        created = {k: v for k, v in contact(42).items() if k != "userid"}
+        self.store.record(f"{URL}/create", {"contact": {**created, "name": "客户 9"}}, "dup")
+        groups = self.index.duplicates("mobile")
+        self.assertEqual([(g["mobile"], [c["userid"] for c in g["list"]]) for g in groups],
+                         [("13900000042", ["ext42", "dup"])])
+        self.assertEqual([c["userid"] for c in self.index.duplicates("name")[0]["list"]], ["ext9", "dup"])
+        with self.assertRaises(ValueError):
+            self.index.duplicates("company")
+
+    def test_recorded_calls(self):
+        self.store.record(f"{URL}/update", {"contact": {"user_id": "ext3", "label_ids": [2], "remark": "续约"}}, None)
+        self.assertEqual(self.index.get("ext3")["remark"], "续约")
+        self.assertEqual(self.index.find(label_ids=[2])["count"], 76)
+        self.store.record(f"{URL}/delete", {"user_id": "ext3"}, None)
+        self.assertIsNone(self.index.get("ext3"))
+        self.store.record(f"{URL}/get", {"user_id": "ext300"}, {"name": "新客户", "mobile": "13800000000"})
+        self.assertEqual(self.index.get("ext300")["userid"], "ext300")
+
+    def test_answer_reads(self):
+        self.assertEqual(self.store.answer(f"{URL}/list", {"offset": 140, "size": 20}), self.contacts[140:])
+        self.assertEqual(self.store.answer(f"{URL}/listlabelgroups", {"offset": 0, "size": 20}), LABEL_GROUPS)
+        self.assertEqual(self.store.answer(f"{URL}/get", {"user_id": "ext8"}), contact(8))
+        self.assertEqual(mobile_key({"mobile": "5123 4567", "state_code": "+852"}), "852-51234567")
+
+class TestExternalContactTools(unittest.IsolatedAsyncioTestCase):
+    async def test_refreshed_on_first_use(self):
+        store = MirrorStore(":memory:")
+        contacts = DingtalkContactsServer(app_key="key", app_secret="secret")
+        fake = FakeContacts([contact(n) for n in range(10)])
+        contacts.get_external_contact_list = fake.get_external_contact_list
+        contacts.get_external_contact_label_list = fake.get_external_contact_label_list
+        mirror = DingtalkMirrorServer(contacts, store)
+        token = raw_results.set(True)
+        try:
+            result = await mirror.mirror_external_contacts(follower_user_id="u1")
+            self.assertEqual([c["userid"] for c in result["list"]], ["ext1", "ext4", "ext7"])
+            result = await mirror.mirror_external_contact_duplicates()
+            self.assertEqual(result["groups"], 0)
+            self.assertEqual(fake.calls, 2)
+        finally:
+            raw_results.reset(token)
+            await mirror.cleanup()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.mirror.identity import IdentityIndex
+from dingtalk.mirror.store import MirrorStore
+
+OAPI = "https://oapi.dingtalk.com/topapi"
+API = "https://api.dingtalk.com/v1.0/contact/orgAccount"
+
+class FakeContacts:
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+
+    async def get_user_by_mobile(self, mobile):
+        self.calls.append(mobile)
+        if mobile == "13900000000":
+            raise Exception("POST request failed")
+        self.store.record(f"{OAPI}/v2/user/getbymobile", {"mobile": mobile}, {"userid": f"user_{mobile}"})
+
+class TestIdentityIndex(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store = MirrorStore(":memory:")
+        self.identities = IdentityIndex(self.store)
+        self.store.save_users([
+            {"userid": "u1", "mobile": "13800000001", "unionid": "union1"},
+            {"userid": "u2", "mobile": "13800000002", "unionid": "union2"},
+        ])
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_bulk_load_and_resolve(self):
+        self.assertEqual(self.identities.load_users(), 2)
+        self.assertEqual(self.identities.load_users(), 0)
+        found = self.identities.resolve_many("mobile", ["13800000001", "13800000009"])
+        self.assertEqual(found["13800000001"], {"mobile": "13800000001", "userid": "u1", "unionid": "union1"})
+        self.assertEqual(found["13800000009"], {"mobile": "13800000009"})
+
+    def test_lazy_fill_from_api_results(self):
+        self.store.record(f"{API}/getMigrationUnionIdByUnionIds?unionId=old1", None, {"result": "union1"})
+        self.identities.load_users()
+        # original unionid -> unionid -> userid -> mobile
+        found = self.identities.resolve_many("original_unionid", ["old1"])["old1"]
+        self.assertEqual(found["unionid"], "union1")
+        self.assertEqual(found["mobile"], "13800000001")
+        self.assertEqual(self.store.answer(f"{API}/getUnionIdByMigrationUnionIds", {"migrationUnionId": "union1"}),
+                         {"result": "old1"})
+        self.assertEqual(self.store.answer(f"{OAPI}/user/getbyunionid", {"unionid": "union2"}),
+                         {"contact_type": 0, "userid": "u2"})
+
+    async def test_fetch_missing(self):
+        contacts = FakeContacts(self.store)
+        errors = await self.identities.fetch_missing(contacts, "mobile", ["13800000003", "13900000000"], ["userid"])
+        self.assertEqual(errors, {"13900000000": "POST request failed"})
+        self.assertEqual(self.identities.lookup("mobile", "13800000003", "userid"), "user_13800000003")
+        self.assertEqual(self.identities.lookup("userid", "user_13800000003", "mobile"), "13800000003")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import json as JSON
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+import aiohttp
+import mcp.types as types
+import main
+from main import create_server, create_sse_app, cleanup
+from dingtalk.tenants import TenantRegistry
+
+async def call_tool(mcp_server, name, arguments=None):
+    handler = mcp_server.request_handlers[types.CallToolRequest]
+    request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(name=name, arguments=arguments),
+    )
+    result = await handler(request)
+    return result.root.content[0].text
+
+class TestMain(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mcp_server, self.registry = create_server()
+
+    async def asyncTearDown(self):
+        await cleanup(self.registry)
+        return await super().asyncTearDown()
+
+    async def test_unknown_tool(self):
+        text = await call_tool(self.mcp_server, "no_such_tool", {})
+        self.assertEqual(text, "Error: Tool no_such_tool not found")
+
+    async def test_list_tools_shared(self):
+        handler = self.mcp_server.request_handlers[types.ListToolsRequest]
+        first = await handler(types.ListToolsRequest(method="tools/list"))
+        second = await handler(types.ListToolsRequest(method="tools/list"))
+        self.assertGreater(len(first.root.tools), 0)
+        self.assertEqual(len(first.root.tools), len(second.root.tools))
+
+    def test_sse_app_routes(self):
+        app = create_sse_app(self.mcp_server)
+        paths = [route.path for route in app.routes]
+        self.assertIn("/sse", paths)
+        self.assertIn("/messages", paths)
+
+    def test_worker_sse_app_routes(self):
+        app = create_sse_app(self.mcp_server, worker_id=2, run_dir="/tmp")
+        paths = [route.path for route in app.routes]
+        self.assertIn("/messages/2", paths)
+        self.assertIn("/messages/{worker:int}/", paths)
+
+    async def test_worker_sessions_closed(self):
+        app = create_sse_app(self.mcp_server, worker_id=2, run_dir="/tmp")
+        async with app.router.lifespan_context(app):
+            session = aiohttp.ClientSession()
+            app.state.peer_sessions[1] = session
+        self.assertTrue(session.closed)
+        self.assertEqual(app.state.peer_sessions, {})
+
+class TestServeWorkers(unittest.TestCase):
+    def test_broker_exit(self):
+        run_dir = tempfile.mkdtemp(prefix="dingtalk-mcp-test-")
+        with patch.object(main, "run_token_broker_process", lambda path: None), \
+                patch.object(main.tempfile, "mkdtemp", lambda prefix: run_dir):
+            with self.assertRaises(Exception):
+                main.serve_workers("127.0.0.1", 0, 1)
+        self.assertFalse(os.path.exists(run_dir))
+
+class TestMainTenants(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        registry = TenantRegistry({
+            "corp_a": {"app_key": "key_a", "app_secret": "secret_a"},
+            "corp_b": {"app_key": "key_b", "app_secret": "secret_b"},
+        })
+        self.mcp_server, self.registry = create_server(registry)
+
+    async def asyncTearDown(self):
+        await cleanup(self.registry)
+
+    async def test_tenant_argument_listed(self):
+        handler = self.mcp_server.request_handlers[types.ListToolsRequest]
+        result = await handler(types.ListToolsRequest(method="tools/list"))
+        tenant = result.root.tools[0].inputSchema["properties"]["tenant"]
+        self.assertEqual(tenant["enum"], ["corp_a", "corp_b"])
+
+    async def test_unknown_tenant(self):
+        handler = self.mcp_server.request_handlers[types.CallToolRequest]
+        request = types.CallToolRequest(
+            method="tools/call",
+            params=types.CallToolRequestParams(name="get_user_detail", arguments={"tenant": "corp_c", "userid": "1"}),
+        )
+        result = await handler(request)
+        self.assertEqual(result.root.content[0].text, "Error: Unknown tenant: corp_c")
+
+    async def test_fetch_continuation(self):
+        users = [{"userid": f"u{i:02d}", "name": f"用户{i}"} for i in range(40)]
+        contacts = self.registry.get("corp_b").contacts
+        contacts.post_old = AsyncMock(side_effect=lambda url, json=None: contacts.render(
+            {"has_more": False, "list": users}))
+        text = await call_tool(self.mcp_server, "get_department_user_details", {
+            "tenant": "corp_b", "dept_id": 1, "cursor": 0, "size": 100, "max_output_chars": 500,
+        })
+        handle = JSON.loads(text)["continuation"]["handle"]
+        handler = self.mcp_server.request_handlers[types.ListToolsRequest]
+        result = await handler(types.ListToolsRequest(method="tools/list"))
+        tool = next(t for t in result.root.tools if t.name == "fetch_continuation")
+        self.assertNotIn("tenant", tool.inputSchema["properties"])
+        text = await call_tool(self.mcp_server, "fetch_continuation", {
+            "tenant": "corp_b", "handle": handle, "max_output_chars": 100000,
+        })
+        self.assertEqual(JSON.loads(text)["list"][-1], users[-1])
+
+class TestMainMirror(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        registry = TenantRegistry({"corp_a": {"app_key": "key_a", "app_secret": "secret_a",
+                                              "mirror_path": os.path.join(self.dir.name, "corp_a.db")}})
+        self.mcp_server, self.registry = create_server(registry)
+
+    async def asyncTearDown(self):
+        await cleanup(self.registry)
+        self.dir.cleanup()
+
+    async def test_mirror_tools_shaped(self):
+        handler = self.mcp_server.request_handlers[types.ListToolsRequest]
+        result = await handler(types.ListToolsRequest(method="tools/list"))
+        tool = next(t for t in result.root.tools if t.name == "mirror_search_users")
+        self.assertIn("fields", tool.inputSchema["properties"])
+        self.assertIn("max_output_chars", tool.inputSchema["properties"])
+        text = await call_tool(self.mcp_server, "mirror_search_users", {"queryWord": "张", "fields": ["userid"]})
+        self.assertEqual(JSON.loads(text)["list"], [])
+
+class TestMainBatch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.mcp_server, self.registry = create_server()
+
+    async def asyncTearDown(self):
+        await cleanup(self.registry)
+
+    async def test_batch_call(self):
+        self.registry.get().contacts.post_old = AsyncMock(side_effect=lambda url, json=None: {"userid": json["userid"]})
+        handler = self.mcp_server.request_handlers[types.CallToolRequest]
+        request = types.CallToolRequest(
+            method="tools/call",
+            params=types.CallToolRequestParams(name="batch_call", arguments={"calls": [
+                {"tool": "get_user_detail", "arguments": {"userid": "a"}},
+                {"tool": "no_such_tool"},
+            ]}),
+        )
+        result = await handler(request)
+        items = JSON.loads(result.root.content[0].text)
+        self.assertEqual(items[0]["result"], {"userid": "a"})
+        self.assertEqual(items[1]["error"], "Tool no_such_tool not found")
+
+    async def test_fields_applied_before_serialization(self):
+        contacts = self.registry.get().contacts
+        contacts.post_old = AsyncMock(side_effect=lambda url, json=None: contacts.render(
+            {"has_more": False, "list": [{"userid": "1", "name": "Alice", "title": "Engineer"}]}))
+        handler = self.mcp_server.request_handlers[types.CallToolRequest]
+        request = types.CallToolRequest(
+            method="tools/call",
+            params=types.CallToolRequestParams(name="get_department_user_details", arguments={
+                "dept_id": 1, "cursor": 0, "size": 10, "fields": ["userid"],
+            }),
+        )
+        result = await handler(request)
+        self.assertEqual(JSON.loads(result.root.content[0].text)["list"], [{"userid": "1"}])
+
+    async def test_transforms_not_applied_to_inner_calls(self):
+        contacts = self.registry.get().contacts
+        users = [{"userid": f"u{i:02d}", "name": f"用户{i}", "title": "工程师"} for i in range(40)]
+        inner = []
+        def page(url, json=None):
+            result = {"has_more": json["cursor"] + json["size"] < len(users),
+                      "next_cursor": json["cursor"] + json["size"],
+                      "list": users[json["cursor"]:json["cursor"] + json["size"]]}
+            inner.append(contacts.render(result))
+            return inner[-1]
+        contacts.post_old = AsyncMock(side_effect=page)
+        text = await call_tool(self.mcp_server, "list_department_users", {
+            "dept_id": 5, "fields": ["name"], "max_output_chars": 500, "max_age": 0,
+        })
+        self.assertTrue(inner)
+        self.assertEqual(sum(len(p["list"]) for p in inner), 40)
+        result = JSON.loads(text)
+        self.assertEqual(result["count"], 40)
+
+    async def test_tool_own_fields_argument_kept(self):
+        contacts = self.registry.get().contacts
+        contacts.put_new = AsyncMock(side_effect=lambda url, json=None: json)
+        text = await call_tool(self.mcp_server, "authorize_org_account_visibility", {
+            "toCorpIds": ["c1"], "optUserId": "u1", "fields": ["name"],
+        })
+        self.assertIn("name", text)
@@ -0,0 +1,90 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results
+from dingtalk.mirror.managers import ManagerGraph
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+
+# ceo <- (cto, cfo), cto <- (dev1, dev2), dev1 <- intern; x <-> y is a cycle,
+# z reports to y, "new" has no detail yet
+MANAGERS = {"ceo": None, "cto": "ceo", "cfo": "ceo", "dev1": "cto", "dev2": "cto", "intern": "dev1",
+            "x": "y", "y": "x", "z": "y"}
+
+class TestManagerGraph(unittest.TestCase):
+    def setUp(self):
+        self.store = MirrorStore(":memory:")
+        for userid, manager in MANAGERS.items():
+            detail = {"userid": userid, "name": userid.upper()}
+            if manager:
+                detail["manager_userid"] = manager
+            self.store.save_user_detail(detail)
+        self.store.save_users([{"userid": "new"}, {"userid": "ext", "manager_userid": "outside"}])
+        self.graph = ManagerGraph(self.store)
+        self.assertTrue(self.graph.refresh())
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_chain(self):
+        self.assertEqual(self.graph.chain("intern"),
+                         {"chain": ["dev1", "cto", "ceo"], "depth": 3, "in_cycle": False, "complete": True})
+        self.assertEqual(self.graph.chain("ceo")["chain"], [])
+        # the manager of "outside" isn't known
+        self.assertEqual(self.graph.chain("ext"),
+                         {"chain": ["outside"], "depth": 1, "in_cycle": False, "complete": False})
+        self.assertFalse(self.graph.chain("new")["complete"])
+        with self.assertRaises(ValueError):
+            self.graph.chain("nobody")
+
+    def test_reports(self):
+        self.assertEqual(self.graph.reports("cto"), [("dev1", 1), ("intern", 2), ("dev2", 1)])
+        self.assertEqual(self.graph.reports("ceo", max_depth=1), [("cfo", 1), ("cto", 1)])
+        self.assertEqual(self.graph.direct_reports("cto"), ["dev1", "dev2"])
+        self.assertEqual(self.graph.reports("intern"), [])
+
+    def test_cycles(self):
+        self.assertEqual(self.graph.cycles, [["x", "y"]])
+        self.assertEqual(self.graph.chain("z"), {"chain": ["y", "x"], "depth": 2, "in_cycle": True, "complete": False})
+        self.assertEqual(self.graph.reports("x"), [("y", 1), ("z", 2)])
+
+    def test_span(self):
+        stats = self.graph.span()
+        self.assertEqual((stats["users"], stats["unknown_manager"], stats["top_level"]), (12, 2, 1))
+        self.assertEqual(stats["span_distribution"], {"1": 4, "2-3": 2})
+        self.assertEqual(stats["widest"][0], {"userid": "ceo", "direct_reports": 2, "total_reports": 5})
+        stats = self.graph.span("cto", top=1)
+        self.assertEqual((stats["direct_reports"], stats["total_reports"], stats["managers"], stats["levels"]),
+                         (2, 3, 2, 3))
+        self.assertEqual((stats["mean_span"], stats["max_span"]), (1.5, 2))
+
+    def test_cached_until_details_change(self):
+        self.assertFalse(self.graph.refresh())
+        self.store.save_user_detail({"userid": "new", "manager_userid": "cfo"})
+        self.assertTrue(self.graph.refresh())
+        self.assertEqual(self.graph.chain("new")["chain"], ["cfo", "ceo"])
+
+class TestManagerTools(unittest.IsolatedAsyncioTestCase):
+    async def test_tools(self):
+        store = MirrorStore(":memory:")
+        for userid, manager in MANAGERS.items():
+            store.save_user_detail({"userid": userid, "name": userid.upper(), "manager_userid": manager or ""})
+        mirror = DingtalkMirrorServer(DingtalkContactsServer(app_key="key", app_secret="secret"), store)
+        token = raw_results.set(True)
+        try:
+            result = await mirror.mirror_management_chain("dev2")
+            self.assertEqual([u["name"] for u in result["chain"]], ["CTO", "CEO"])
+            result = await mirror.mirror_reports("ceo", offset=1, size=2)
+            self.assertEqual((result["direct_reports"], result["count"], result["hasMore"]), (2, 5, True))
+            self.assertEqual([(u["userid"], u["level"]) for u in result["list"]], [("cto", 1), ("dev1", 2)])
+            result = await mirror.mirror_span_stats()
+            self.assertEqual(result["cycles"], [["x", "y"]])
+        finally:
+            raw_results.reset(token)
+            await mirror.cleanup()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import tempfile
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.mirror.mapped import MappedSnapshot, snapshot_path, write_snapshot
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import OAPI, MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+class TestMappedSnapshot(unittest.TestCase):
+    def setUp(self):
+        # 1 -> 2 -> (3, 4), 1 -> 5
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = MirrorStore(os.path.join(self.dir.name, "mirror.db"))
+        self.store.save_departments([
+            {"dept_id": 1, "name": "root"}, {"dept_id": 2, "parent_id": 1, "name": "研发"},
+            {"dept_id": 3, "parent_id": 2, "name": "后端"}, {"dept_id": 4, "parent_id": 2, "name": "前端"},
+            {"dept_id": 5, "parent_id": 1, "name": "销售"},
+        ])
+        self.store.save_department_users(3, [{"userid": "u1", "name": "张三", "mobile": "13800000001", "unionid": "x1"}])
+        self.store.save_department_users(4, [{"userid": "u1", "name": "张三", "mobile": "13800000001", "unionid": "x1"},
+                                             {"userid": "u2", "name": "李四", "unionid": "x2"}])
+        self.store.save_department_users(5, [{"userid": "u0", "name": "王五", "mobile": "13800000000"}])
+        self.path = snapshot_path(self.store)
+        self.report = write_snapshot(self.store, self.path)
+        self.snapshot = MappedSnapshot(self.path)
+        self.tree = DepartmentTree()
+        self.tree.refresh(self.store)
+
+    def tearDown(self):
+        self.snapshot.close()
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_report(self):
+        self.assertEqual(self.report["departments"], 5)
+        self.assertEqual(self.report["users"], 3)
+        self.assertEqual(os.path.getsize(self.path), self.report["bytes"])
+        store = MirrorStore(":memory:")
+        self.assertIsNone(snapshot_path(store))
+        store.close()
+
+    def test_departments_match_tree(self):
+        self.assertEqual(self.snapshot.version, self.store.department_version())
+        self.assertEqual(len(self.snapshot), len(self.tree))
+        self.assertIn(4, self.snapshot)
+        self.assertNotIn(6, self.snapshot)
+        for dept_id in self.tree.ids:
+            self.assertEqual(self.snapshot.ancestors(dept_id), self.tree.ancestors(dept_id))
+            self.assertEqual(self.snapshot.subtree(dept_id), self.tree.subtree(dept_id))
+            self.assertEqual(self.snapshot.children(dept_id), self.tree.children(dept_id))
+            self.assertEqual(self.snapshot.parent_id(dept_id), self.tree.parent_id(dept_id))
+        self.assertEqual(self.snapshot.subtree(1, max_depth=1), [1, 2, 5])
+        self.assertEqual(self.snapshot.name(4), "前端")
+        self.assertTrue(self.snapshot.is_descendant(4, 2))
+        self.assertFalse(self.snapshot.is_descendant(5, 2))
+        self.assertEqual(self.snapshot.lowest_common_ancestor([3, 4]), 2)
+        self.assertEqual(self.snapshot.lowest_common_ancestor([3, 5]), 1)
+        with self.assertRaises(ValueError):
+            self.snapshot.ancestors(6)
+
+    def test_users(self):
+        self.assertEqual(self.snapshot.user_by("userid", "u1"), {"userid": "u1", "name": "张三", "dept_id_list": [3, 4]})
+        self.assertEqual(self.snapshot.user_by("mobile", "13800000000")["userid"], "u0")
+        self.assertEqual(self.snapshot.user_by("unionid", "x2")["dept_id_list"], [4])
+        self.assertIsNone(self.snapshot.user_by("userid", "u9"))
+        self.assertIsNone(self.snapshot.user_by("mobile", "13900000000"))
+
+    def test_identity_reads(self):
+        mirror = DingtalkMirrorServer(DingtalkContactsServer(app_key="key", app_secret="secret"), self.store)
+        try:
+            self.assertEqual(self.store.db.execute("SELECT COUNT(*) FROM identity_links").fetchone()[0], 0)
+            self.assertEqual(self.store.answer(f"{OAPI}/topapi/v2/user/getbymobile", {"mobile": "13800000001"}),
+                             {"userid": "u1"})
+            self.assertEqual(self.store.answer(f"{OAPI}/topapi/user/getbyunionid", {"unionid": "x2"})["userid"], "u2")
+            # users changed since the snapshot was written
+            self.store.save_department_users(5, [{"userid": "u3", "mobile": "13800000003"}])
+            self.assertIsNone(self.store.answer(f"{OAPI}/topapi/v2/user/getbymobile", {"mobile": "13800000001"}))
+        finally:
+            mirror.mapped.close()
+
+    def test_rewrite_keeps_open_map(self):
+        self.store.save_departments([{"dept_id": 6, "parent_id": 5, "name": "华东"}])
+        write_snapshot(self.store, self.path)
+        self.assertNotIn(6, self.snapshot)
+        new = MappedSnapshot(self.path)
+        self.assertIn(6, new)
+        self.assertEqual(new.ancestors(6), [6, 5, 1])
+        self.assertEqual(new.version, self.store.department_version())
+        new.close()
+
+    def test_rejects_other_files(self):
+        with open(self.path, "r+b") as f:
+            f.write(b"NOTASNAP")
+        with self.assertRaises(ValueError):
+            MappedSnapshot(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
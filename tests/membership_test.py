@@ -0,0 +1,106 @@
+import unittest
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results
+from dingtalk.mirror.membership import Bitset, MembershipSets, operand_kinds, parse_expression
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+class TestBitset(unittest.TestCase):
+    def test_operations(self):
+        a = Bitset.of([1, 5, 1000, 5000])
+        b = Bitset.of([5, 5000, 70000])
+        self.assertEqual(list(a | b), [1, 5, 1000, 5000, 70000])
+        self.assertEqual(list(a & b), [5, 5000])
+        self.assertEqual(list(a - b), [1, 1000])
+        self.assertEqual(list(b - a), [70000])
+        self.assertEqual(len(a), 4)
+        self.assertIn(1000, a)
+        self.assertNotIn(1001, a)
+        # chunks left empty are dropped
+        self.assertEqual((a - a).chunks, {})
+
+    def test_span(self):
+        self.assertEqual(list(Bitset.span(1020, 1030)), list(range(1020, 1030)))
+        self.assertEqual(Bitset.span(0, 3000), Bitset.of(range(3000)))
+        self.assertEqual(len(Bitset.span(5, 5)), 0)
+
+class TestExpressions(unittest.TestCase):
+    def test_precedence(self):
+        self.assertEqual(parse_expression("dept:1 | role:2 & group:3 - direct:4"),
+                         ("|", ("dept", 1), ("&", ("role", 2), ("-", ("group", 3), ("direct", 4)))))
+        self.assertEqual(parse_expression("(dept:1|role:2)&all"), ("&", ("|", ("dept", 1), ("role", 2)), ("all",)))
+        self.assertEqual(parse_expression("dept:1 - dept:2 - dept:3"),
+                         ("-", ("-", ("dept", 1), ("dept", 2)), ("dept", 3)))
+        self.assertEqual(operand_kinds(parse_expression("dept:1 - (role:2 | all)")), {"dept", "role", "all"})
+
+    def test_errors(self):
+        for expression in ["", "dept:1 &", "(dept:1", "dept:1)", "user:1", "dept:x", "dept:1 dept:2"]:
+            with self.assertRaises(ValueError, msg=expression):
+                parse_expression(expression)
+
+class TestMembershipSets(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # 1 -> 2 -> (3, 4), 1 -> 5
+        self.store = MirrorStore(":memory:")
+        self.store.save_departments([
+            {"dept_id": 1}, {"dept_id": 2, "parent_id": 1}, {"dept_id": 3, "parent_id": 2},
+            {"dept_id": 4, "parent_id": 2}, {"dept_id": 5, "parent_id": 1},
+        ])
+        self.store.save_department_users(3, [{"userid": "a"}, {"userid": "b"}])
+        self.store.save_department_users(4, [{"userid": "b"}, {"userid": "c"}])
+        self.store.save_department_users(5, [{"userid": "c"}, {"userid": "d"}])
+        self.roles = RoleIndex(self.store)
+        self.roles.save([{"id": 7, "name": "主管", "groupId": 70}, {"id": 8, "name": "财务", "groupId": 70},
+                         {"id": 9, "name": "负责人", "groupId": 90}],
+                        {7: [{"userid": "a"}, {"userid": "d"}], 8: [{"userid": "x"}], 9: [{"userid": "b"}]})
+        self.sets = MembershipSets(self.store, DepartmentTree(), self.roles)
+        self.assertTrue(self.sets.refresh())
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    def query(self, expression: str) -> list[str]:
+        return sorted(self.sets.members(self.sets.evaluate(parse_expression(expression))))
+
+    def test_sets(self):
+        self.assertEqual(self.query("dept:2"), ["a", "b", "c"])
+        self.assertEqual(self.query("direct:2"), [])
+        self.assertEqual(self.query("dept:2 - role:7"), ["b", "c"])
+        self.assertEqual(self.query("dept:5 & group:70"), ["d"])
+        self.assertEqual(self.query("group:70"), ["a", "d", "x"])
+        self.assertEqual(self.query("group:70 - all"), ["x"])
+        self.assertEqual(self.query("(dept:3 | dept:5) - dept:4"), ["a", "d"])
+        self.assertEqual(self.query("all"), ["a", "b", "c", "d"])
+        with self.assertRaises(ValueError):
+            self.query("role:99")
+        with self.assertRaises(ValueError):
+            self.query("dept:99")
+
+    def test_cached_until_mirror_changes(self):
+        self.assertFalse(self.sets.refresh())
+        self.store.save_department_users(5, [{"userid": "e"}], synced_at=time.time() + 1)
+        self.assertTrue(self.sets.refresh())
+        self.assertEqual(self.query("dept:5"), ["e"])
+
+    async def test_tool(self):
+        mirror = DingtalkMirrorServer(DingtalkContactsServer(app_key="key", app_secret="secret"), self.store)
+        token = raw_results.set(True)
+        try:
+            result = await mirror.mirror_member_sets("dept:1 - role:9", size=2)
+            self.assertEqual((result["count"], result["hasMore"]), (3, True))
+            self.assertEqual([u["userid"] for u in result["list"]], ["a", "c"])
+            result = await mirror.mirror_member_sets("dept:1 - role:9", offset=2)
+            self.assertEqual([u["userid"] for u in result["list"]], ["d"])
+        finally:
+            raw_results.reset(token)
+            await mirror.cleanup()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.mirror.crawler import crawl
+from dingtalk.mirror.merkle import Snapshots, Verifier
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+class FakeOrg:
+    def __init__(self):
+        self.departments = {
+            1: {"dept_id": 1, "name": "root"},
+            2: {"dept_id": 2, "parent_id": 1, "name": "研发"},
+            3: {"dept_id": 3, "parent_id": 2, "name": "后端"},
+            4: {"dept_id": 4, "parent_id": 1, "name": "销售"},
+        }
+        self.members = {1: [], 2: ["u1", "u2"], 3: ["u3"], 4: ["u4", "u5"]}
+        self.calls = []
+
+    async def get_department_detail(self, dept_id):
+        return self.departments[dept_id]
+
+    async def get_department_list_old(self, dept_id=None, language=None):
+        self.calls.append(("listsub", dept_id))
+        return [d for d in self.departments.values() if d.get("parent_id") == dept_id]
+
+    async def get_sub_department_ids(self, dept_id):
+        self.calls.append(("listsubid", dept_id))
+        return {"dept_id_list": [d for d, v in self.departments.items() if v.get("parent_id") == dept_id]}
+
+    async def get_department_user_id_list(self, dept_id):
+        self.calls.append(("listid", dept_id))
+        return {"userid_list": self.members[dept_id]}
+
+    async def get_department_user_details(self, dept_id, cursor, size):
+        self.calls.append(("users", dept_id))
+        return {"has_more": False, "list": [{"userid": u, "name": u} for u in self.members[dept_id]]}
+
+class TestMerkle(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:")
+        self.org = FakeOrg()
+        await crawl(self.org, self.store)
+        self.snapshots = Snapshots(self.store, DepartmentTree())
+        self.first = self.snapshots.take()["snapshot"]
+        self.org.calls.clear()
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    def test_unchanged_tree_is_skipped(self):
+        second = self.snapshots.take()
+        diff = self.snapshots.diff(self.first, second["snapshot"])
+        self.assertEqual(diff["unchanged_subtrees"], 1)
+        self.assertEqual(diff["members"], [])
+
+    async def test_verify_refetches_changed_departments(self):
+        self.org.members[3] = ["u3", "u6"]
+        self.org.departments[5] = {"dept_id": 5, "parent_id": 4, "name": "华东"}
+        self.org.members[5] = ["u7"]
+        report = await Verifier(self.org, self.store, self.snapshots).run()
+
+        self.assertEqual(report["probed"], 5)
+        self.assertEqual(sorted(report["refetched_members"]), [3, 5])
+        self.assertEqual(report["refetched_departments"], [4])
+        self.assertNotIn(("users", 2), self.org.calls)
+        self.assertEqual(self.store.department_user_ids(5), ["u7"])
+
+        diff = report["diff"]
+        self.assertEqual(diff["added"], [5])
+        self.assertEqual(diff["members"], [
+            {"dept_id": 3, "added": ["u6"], "removed": []},
+            {"dept_id": 5, "added": ["u7"], "removed": []},
+        ])
+        # department 2's subtree changed through 3, while 4 itself changed
+        self.assertEqual(diff["unchanged_subtrees"], 0)
+
+    async def test_moved_department(self):
+        self.org.departments[3] = {"dept_id": 3, "parent_id": 4, "name": "后端"}
+        report = await Verifier(self.org, self.store, self.snapshots).run()
+        self.assertEqual(report["diff"]["moved"], [{"dept_id": 3, "from": 2, "to": 4}])
+        self.assertEqual(report["diff"]["changed"], [3])
+        self.assertEqual(self.store.sub_department_ids(4), [3])
+
+if __name__ == "__main__":
+    unittest.main()
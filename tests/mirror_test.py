@@ -0,0 +1,161 @@
+import unittest
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk import shaping
+from dingtalk.dingtalk_server import raw_results, result_transforms
+from dingtalk.mirror.crawler import CHECKPOINT_KEY, Crawler, crawl
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+
+# 1 -> 2 -> 3, users u0..u4 in department 2 and u5 in department 3
+DEPARTMENTS = {
+    1: {"dept_id": 1, "name": "root"},
+    2: {"dept_id": 2, "parent_id": 1, "name": "研发"},
+    3: {"dept_id": 3, "parent_id": 2, "name": "后端"},
+}
+MEMBERS = {
+    1: [],
+    2: [{"userid": f"u{i}", "name": f"用户{i}", "unionid": f"union{i}"} for i in range(5)],
+    3: [{"userid": "u5", "name": "用户5"}],
+}
+
+class FakeContacts:
+    def __init__(self, fail_on=None):
+        self.calls = 0
+        self.fail_on = fail_on
+        self.listed = []
+
+    async def get_department_detail(self, dept_id):
+        self.calls += 1
+        return DEPARTMENTS[dept_id]
+
+    async def get_department_list_old(self, dept_id=None, language=None):
+        self.calls += 1
+        if dept_id == self.fail_on:
+            raise Exception("POST request failed")
+        self.listed.append(dept_id)
+        return [d for d in DEPARTMENTS.values() if d.get("parent_id") == dept_id]
+
+    async def get_department_user_details(self, dept_id, cursor, size):
+        self.calls += 1
+        users = MEMBERS[dept_id]
+        page = {"has_more": cursor + size < len(users), "list": users[cursor:cursor + size]}
+        if page["has_more"]:
+            page["next_cursor"] = cursor + size
+        return page
+
+class TestMirror(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:", max_age=60)
+        self.contacts = FakeContacts()
+        self.stats = await crawl(self.contacts, self.store, page_size=2)
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    async def test_crawl(self):
+        self.assertEqual(self.stats["departments"], 3)
+        self.assertEqual(self.stats["memberships"], 6)
+        self.assertEqual(self.store.sub_department_ids(1), [2])
+        self.assertEqual(self.store.get_user("u5")["name"], "用户5")
+        self.assertIsNotNone(self.store.get_meta("last_full_crawl"))
+
+    async def test_answer_reads(self):
+        url = "https://oapi.dingtalk.com/topapi/v2"
+        self.assertEqual(self.store.answer(f"{url}/department/listsub", {"dept_id": 2}), [DEPARTMENTS[3]])
+        self.assertEqual(self.store.answer(f"{url}/department/listsubid", {"dept_id": 1}), {"dept_id_list": [2]})
+        page = self.store.answer(f"{url}/user/list", {"dept_id": 2, "cursor": 0, "size": 3})
+        self.assertEqual([u["userid"] for u in page["list"]], ["u0", "u1", "u2"])
+        self.assertEqual(page["next_cursor"], 3)
+        page = self.store.answer(f"{url}/user/list", {"dept_id": 2, "cursor": 3, "size": 3})
+        self.assertEqual([u["userid"] for u in page["list"]], ["u3", "u4"])
+        self.assertFalse(page["has_more"])
+        # orderings and details the mirror doesn't hold go to the API
+        self.assertIsNone(self.store.answer(f"{url}/user/list", {"dept_id": 2, "order_field": "entry_asc"}))
+        self.assertIsNone(self.store.answer(f"{url}/user/get", {"userid": "u1"}))
+        self.assertIsNone(self.store.answer("https://oapi.dingtalk.com/topapi/role/list", {}))
+
+    async def test_stale_mirror_is_not_used(self):
+        self.store.mark_crawled(2, time.time() - 120)
+        url = "https://oapi.dingtalk.com/topapi/v2/department/listsub"
+        self.assertIsNone(self.store.answer(url, {"dept_id": 2}))
+        self.assertIsNotNone(self.store.answer(url, {"dept_id": 1}))
+
+    async def test_recrawl_prunes_removed_users(self):
+        MEMBERS[3] = []
+        try:
+            await crawl(self.contacts, self.store)
+        finally:
+            MEMBERS[3] = [{"userid": "u5", "name": "用户5"}]
+        self.assertIsNone(self.store.get_user("u5"))
+        self.assertEqual(self.store.department_users(3)["list"], [])
+
+    async def test_resume_after_failure(self):
+        store = MirrorStore(":memory:")
+        with self.assertRaises(Exception):
+            await Crawler(FakeContacts(fail_on=3), store, concurrency=2).run()
+        checkpoint = store.get_meta(CHECKPOINT_KEY)
+        self.assertEqual(checkpoint["pending"], [3])
+        self.assertEqual(checkpoint["departments"], 2)
+
+        contacts = FakeContacts()
+        report = await Crawler(contacts, store, concurrency=2).run()
+        self.assertTrue(report["resumed"])
+        self.assertEqual(contacts.listed, [3])
+        self.assertEqual(report["departments"], 3)
+        self.assertIsNone(store.get_meta(CHECKPOINT_KEY))
+        self.assertEqual(store.get_user("u5")["name"], "用户5")
+        store.close()
+
+    async def test_caller_transforms_not_stored(self):
+        store = MirrorStore(":memory:")
+        contacts = FakeContacts()
+        server = DingtalkContactsServer(app_key="key", app_secret="secret")
+        fetch = contacts.get_department_user_details
+        async def rendered(dept_id, cursor, size):
+            return server.render(await fetch(dept_id, cursor, size))
+        contacts.get_department_user_details = rendered
+        token = result_transforms.set((shaping.make_shaper(["userid"]),))
+        try:
+            await Crawler(contacts, store).run()
+        finally:
+            result_transforms.reset(token)
+        self.assertEqual(store.get_user("u5")["name"], "用户5")
+        store.close()
+
+    async def test_parent_departments(self):
+        mirror = DingtalkMirrorServer(DingtalkContactsServer(app_key="key", app_secret="secret"), self.store)
+        url = "https://oapi.dingtalk.com/topapi/v2/department"
+        self.assertEqual(self.store.answer(f"{url}/listparentbydept", {"dept_id": 3}), {"parent_id_list": [3, 2, 1]})
+        self.assertEqual(self.store.answer(f"{url}/listparentbyuser", {"userid": "u5"}),
+                         {"parent_list": [{"parent_dept_id_list": [3, 2, 1]}]})
+        self.assertIsNone(self.store.answer(f"{url}/listparentbyuser", {"userid": "nobody"}))
+        token = raw_results.set(True)
+        try:
+            self.assertEqual((await mirror.mirror_common_ancestor([3, 2]))["dept_id"], 2)
+            self.assertEqual((await mirror.mirror_department_subtree(2))["dept_id_list"], [2, 3])
+        finally:
+            raw_results.reset(token)
+
+    async def test_server_reads_from_mirror(self):
+        server = DingtalkContactsServer(app_key="key", app_secret="secret")
+        server.mirror = self.store
+        self.store.record("https://oapi.dingtalk.com/topapi/v2/user/get", {"userid": "u1"},
+                          {"userid": "u1", "name": "用户1", "title": "工程师"})
+        token = raw_results.set(True)
+        try:
+            # no session or token needed, nothing goes to the network
+            self.assertEqual((await server.get_user_detail("u1"))["title"], "工程师")
+            self.assertEqual(await server.get_sub_department_ids(1), {"dept_id_list": [2]})
+            users = await server.get_department_user_details(3, 0, 10)
+            self.assertEqual([u["userid"] for u in users["list"]], ["u5"])
+        finally:
+            raw_results.reset(token)
+        self.assertIsNone(server.session)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import DingtalkError, raw_results, use_mirror
+from dingtalk.pagination import OAPI, PageCache
+
+USERS = [{"userid": f"u{i}"} for i in range(250)]
+CONTACTS = [{"userid": f"ext{i}"} for i in range(130)]
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def json(self):
+        return self.data
+
+class FakeSession:
+    def __init__(self):
+        self.requests = []
+
+    def post(self, url, params=None, json=None):
+        self.requests.append((url, json))
+        if url.endswith("/extcontact/create"):
+            CONTACTS.append({"userid": f"ext{len(CONTACTS)}"})
+            return FakeResponse({"errcode": 0, "userid": CONTACTS[-1]["userid"]})
+        if json.get("dept_id") == 404:
+            return FakeResponse({"errcode": 60003, "errmsg": "部门不存在"})
+        if url.endswith("/extcontact/get"):
+            return FakeResponse({"errcode": 0, "result": CONTACTS[int(json["user_id"][3:])]})
+        if url.endswith("/extcontact/list"):
+            return FakeResponse({"errcode": 0, "results": CONTACTS[json["offset"]:json["offset"] + json["size"]]})
+        cursor, size = json["cursor"], json["size"]
+        result = {"has_more": cursor + size < len(USERS), "list": USERS[cursor:cursor + size]}
+        if result["has_more"]:
+            result["next_cursor"] = cursor + size
+        return FakeResponse({"errcode": 0, "result": result})
+
+class TestPageCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = DingtalkContactsServer(app_key="key", app_secret="secret")
+        self.server.session = FakeSession()
+        self.server.access_token, self.server.token_expires = "token", 2 ** 40
+        self.token = raw_results.set(True)
+
+    async def asyncTearDown(self):
+        raw_results.reset(self.token)
+
+    async def test_small_pages_from_full_pages(self):
+        users, cursor, pages = [], 0, 0
+        while True:
+            page = await self.server.get_department_user_details(1, cursor, 10)
+            pages += 1
+            self.assertLessEqual(len(page["list"]), 10)
+            users.extend(page["list"])
+            if not page["has_more"]:
+                self.assertNotIn("next_cursor", page)
+                break
+            cursor = page["next_cursor"]
+        self.assertEqual(users, USERS)
+        self.assertEqual(pages, 25)
+        self.assertEqual([json["size"] for _, json in self.server.session.requests], [100, 100, 100])
+        self.assertEqual([json["cursor"] for _, json in self.server.session.requests], [0, 100, 200])
+
+    async def test_bare_list(self):
+        first = await self.server.get_external_contact_list(20, 0)
+        rest = [await self.server.get_external_contact_list(20, offset) for offset in range(20, 160, 20)]
+        self.assertEqual(first + sum(rest, []), CONTACTS)
+        self.assertEqual(rest[-1], [])
+        # offsets 100 and on come from a second full page
+        self.assertEqual(len(self.server.session.requests), 2)
+
+    async def test_bypassed(self):
+        # full pages and callers needing live data go upstream as asked
+        await self.server.get_department_user_details(1, 0, 100)
+        token = use_mirror.set(False)
+        try:
+            await self.server.get_department_user_details(1, 0, 10)
+            await self.server.get_department_user_details(1, 10, 10)
+        finally:
+            use_mirror.reset(token)
+        self.assertEqual([json["size"] for _, json in self.server.session.requests], [100, 10, 10])
+
+    async def test_write_drops_pages(self):
+        self.assertEqual(len(await self.server.get_external_contact_list(20, 120)), 10)
+        # reads of other families and single records keep the pages
+        await self.server.get_department_user_details(1, 0, 10)
+        await self.server.post_old(f"{OAPI}/topapi/extcontact/get", json={"user_id": "ext1"})
+        self.assertEqual(len(await self.server.get_external_contact_list(20, 120)), 10)
+        await self.server.add_external_contact_old({"name": "客户"})
+        try:
+            self.assertEqual(len(await self.server.get_external_contact_list(20, 120)), 11)
+            self.assertEqual([url for url, _ in self.server.pages.pages],
+                             [f"{OAPI}/topapi/v2/user/list", f"{OAPI}/topapi/extcontact/list"])
+        finally:
+            CONTACTS.pop()
+        self.assertEqual([url.rsplit("/", 1)[-1] for url, _ in self.server.session.requests],
+                         ["list", "list", "get", "create", "list"])
+
+    async def test_error_code(self):
+        with self.assertRaises(DingtalkError) as raised:
+            await self.server.get_department_user_details(404, 0, 10)
+        self.assertEqual((raised.exception.errcode, raised.exception.errmsg), (60003, "部门不存在"))
+
+    async def test_expiry_and_parameters(self):
+        cache = PageCache(ttl=0)
+        calls = []
+
+        async def request(payload):
+            calls.append(payload)
+            return {"has_more": False, "list": USERS[payload["cursor"]:5]}
+        url = f"{OAPI}/topapi/v2/user/list"
+        await cache.fetch(url, {"dept_id": 1, "cursor": 0, "size": 2}, request)
+        await cache.fetch(url, {"dept_id": 1, "cursor": 2, "size": 2}, request)
+        self.assertEqual(len(calls), 2)
+
+        cache = PageCache()
+        calls.clear()
+        page = await cache.fetch(url, {"dept_id": 1, "cursor": 4, "size": 2}, request)
+        self.assertEqual(page, {"has_more": False, "list": USERS[4:5]})
+        await cache.fetch(url, {"dept_id": 2, "cursor": 4, "size": 2}, request)
+        await cache.fetch(url, {"dept_id": 1, "cursor": 0, "size": 2}, request)
+        self.assertEqual([(c["dept_id"], c["cursor"]) for c in calls], [(1, 4), (2, 4), (1, 0)])
+        self.assertFalse(cache.handles(url, {"dept_id": 1, "cursor": 0, "size": 100}))
+        self.assertFalse(cache.handles(f"{OAPI}/topapi/v2/department/listsub", {"dept_id": 1}))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.dingtalk_server import use_mirror
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.planner import DirectoryPlanner
+
+USERS = [{"userid": f"u{i:03d}", "name": f"用户{i}", "title": "工程师"} for i in range(250)]
+
+class FakeContacts:
+    def __init__(self, mirror=None):
+        self.mirror = mirror
+        self.calls = []
+
+    def page(self, name, cursor, size, fields=None):
+        self.calls.append(name)
+        assert not use_mirror.get()
+        users = USERS[cursor:cursor + size]
+        if fields:
+            users = [{k: u[k] for k in fields} for u in users]
+        page = {"has_more": cursor + size < len(USERS), "list": users}
+        if page["has_more"]:
+            page["next_cursor"] = cursor + size
+        return page
+
+    async def get_department_user_simple(self, dept_id, cursor, size):
+        return self.page("listsimple", cursor, size, ["userid", "name"])
+
+    async def get_department_user_details(self, dept_id, cursor, size):
+        return self.page("list", cursor, size)
+
+    async def get_department_user_id_list(self, dept_id):
+        self.calls.append("listid")
+        return {"userid_list": [u["userid"] for u in USERS]}
+
+    async def get_user_detail(self, userid, language="zh_CN"):
+        self.calls.append("get")
+        return {**next(u for u in USERS if u["userid"] == userid), "manager_userid": "boss"}
+
+class TestDirectoryPlanner(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:")
+        self.store.save_departments([{"dept_id": 1}])
+        self.store.save_department_users(1, USERS)
+        self.store.mark_crawled(1)
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    async def test_without_mirror(self):
+        contacts = FakeContacts()
+        result = await DirectoryPlanner(contacts).run(1, ["userid", "name"])
+        self.assertEqual(result["plan"]["route"], "listsimple")
+        self.assertEqual(result["plan"]["estimated_calls"], 1)
+        self.assertEqual((result["plan"]["calls"], result["count"]), (3, 250))
+        self.assertEqual(result["list"][0], {"userid": "u000", "name": "用户0"})
+
+        plan = DirectoryPlanner(contacts).plan(1, ["title"])
+        self.assertEqual((plan["route"], plan["estimated_members"]), ("list", None))
+
+    async def test_fresh_mirror(self):
+        contacts = FakeContacts(self.store)
+        result = await DirectoryPlanner(contacts).run(1, ["title"])
+        self.assertEqual(result["plan"]["route"], "mirror")
+        self.assertEqual((result["plan"]["calls"], result["count"]), (0, 250))
+        self.assertEqual(result["list"][1], {"userid": "u001", "title": "工程师"})
+        self.assertEqual(contacts.calls, [])
+
+    async def test_live_data_required(self):
+        contacts = FakeContacts(self.store)
+        plan = DirectoryPlanner(contacts).plan(1, ["title"], max_age=0)
+        self.assertEqual(plan["route"], "list")
+        self.assertEqual(plan["alternatives"], {"listid": 251})
+        # records synced a moment ago still count as fresh with max_age=60
+        plan = DirectoryPlanner(contacts).plan(1, ["title"], max_age=60)
+        self.assertEqual(plan["route"], "mirror")
+
+    async def test_cached_details(self):
+        for user in USERS[:249]:
+            self.store.save_user_detail({**user, "manager_userid": "boss"})
+        self.store.mark_crawled(1, time.time() - 7200)
+        contacts = FakeContacts(self.store)
+        result = await DirectoryPlanner(contacts).run(1, ["manager_userid"])
+        self.assertEqual(result["plan"]["route"], "listid")
+        self.assertEqual((result["plan"]["estimated_calls"], result["plan"]["calls"]), (2, 2))
+        self.assertEqual(contacts.calls, ["listid", "get"])
+        self.assertEqual(result["list"][249], {"userid": "u249", "manager_userid": "boss"})
+        self.assertNotIn("mirror", result["plan"]["alternatives"])
+
+if __name__ == "__main__":
+    unittest.main()
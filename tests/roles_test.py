@@ -0,0 +1,82 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.dingtalk_server import raw_results
+from dingtalk.mirror.roles import RoleIndex
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+
+GROUPS = [
+    {"groupId": 10, "name": "职务", "roles": [{"id": 1, "name": "主管"}, {"id": 2, "name": "财务"}]},
+    {"groupId": 20, "name": "默认", "roles": [{"id": 3, "name": "负责人"}]},
+]
+MEMBERS = {
+    1: [{"userid": f"u{i}", "name": f"用户{i}", "manageScopes": [{"dept_id": 2, "name": "研发"}]} for i in range(5)],
+    2: [{"userid": "u1", "name": "用户1"}],
+    3: [],
+}
+
+class FakeContacts:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_role_list(self, size=20, offset=0):
+        self.calls += 1
+        return {"hasMore": offset + size < len(GROUPS), "list": GROUPS[offset:offset + size]}
+
+    async def get_employee_list_by_role(self, role_id, size=20, offset=0):
+        self.calls += 1
+        # a small page size, so refreshes page through members
+        members = MEMBERS[role_id][offset:offset + 2]
+        return {"hasMore": offset + 2 < len(MEMBERS[role_id]), "nextCursor": offset + 2, "list": members}
+
+class TestRoleIndex(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:")
+        self.roles = RoleIndex(self.store)
+        self.report = await self.roles.refresh(FakeContacts())
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    def test_indexes(self):
+        self.assertEqual(self.report["roles"], 3)
+        self.assertEqual(self.report["assignments"], 6)
+        self.assertEqual([m["userid"] for m in self.roles.members_of(1)], ["u0", "u1", "u2", "u3", "u4"])
+        self.assertEqual([(r["id"], r["groupName"]) for r in self.roles.roles_of("u1")], [(1, "职务"), (2, "职务")])
+        self.assertEqual(self.roles.roles_of("u1")[0]["manageScopes"], [{"dept_id": 2, "name": "研发"}])
+        self.assertEqual(self.roles.roles_of("nobody"), [])
+
+    def test_persisted(self):
+        reloaded = RoleIndex(self.store)
+        self.assertEqual(reloaded.roles_of("u3"), self.roles.roles_of("u3"))
+
+    def test_answer_reads(self):
+        url = "https://oapi.dingtalk.com/topapi/role"
+        self.assertEqual(self.store.answer(f"{url}/list", {"size": 1, "offset": 1}),
+                         {"hasMore": False, "list": [{"groupId": 20, "name": "默认", "roles": [{"id": 3, "name": "负责人"}]}]})
+        page = self.store.answer(f"{url}/simplelist", {"role_id": 1, "size": 3, "offset": 3})
+        self.assertEqual([m["userid"] for m in page["list"]], ["u3", "u4"])
+        self.assertFalse(page["hasMore"])
+        self.assertIsNone(self.store.answer(f"{url}/simplelist", {"role_id": 99}))
+
+    async def test_role_members_in_department(self):
+        self.store.save_departments([{"dept_id": 1}, {"dept_id": 2, "parent_id": 1}, {"dept_id": 3, "parent_id": 2}])
+        self.store.save_department_users(3, [{"userid": "u2"}])
+        self.store.save_department_users(1, [{"userid": "u0"}])
+        mirror = DingtalkMirrorServer(DingtalkContactsServer(app_key="key", app_secret="secret"), self.store)
+        token = raw_results.set(True)
+        try:
+            result = await mirror.mirror_role_members(1, dept_id=2)
+            self.assertEqual([m["userid"] for m in result["list"]], ["u2"])
+            result = await mirror.mirror_role_members(1, dept_id=2, include_sub_departments=False)
+            self.assertEqual(result["count"], 0)
+        finally:
+            raw_results.reset(token)
+            await mirror.cleanup()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import time
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.mirror.rollups import Rollups, hire_bucket
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+YEAR_MS = 365 * 24 * 3600 * 1000
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        # 1 -> 2 -> (3, 4), 1 -> 5
+        self.store = MirrorStore(":memory:")
+        self.store.save_departments([
+            {"dept_id": 1}, {"dept_id": 2, "parent_id": 1}, {"dept_id": 3, "parent_id": 2},
+            {"dept_id": 4, "parent_id": 2}, {"dept_id": 5, "parent_id": 1},
+        ])
+        now = time.time() * 1000
+        users = {
+            "a": {"userid": "a", "title": "工程师", "hired_date": now - 0.5 * YEAR_MS},
+            "b": {"userid": "b", "title": "工程师", "hired_date": now - 2 * YEAR_MS, "active": False},
+            "c": {"userid": "c", "title": "销售", "hired_date": now - 12 * YEAR_MS},
+            "d": {"userid": "d"},
+        }
+        self.store.save_department_users(3, [users["a"], users["b"]])
+        # b is in both 3 and 4, c in both 4 and 5
+        self.store.save_department_users(4, [users["b"], users["c"]])
+        self.store.save_department_users(5, [users["c"], users["d"]])
+        self.rollups = Rollups(self.store, DepartmentTree())
+        self.assertTrue(self.rollups.refresh())
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_distinct_headcount(self):
+        self.assertEqual(self.rollups.rollup(1)["headcount"], 4)
+        self.assertEqual(self.rollups.rollup(2)["headcount"], 3)
+        self.assertEqual(self.rollups.rollup(3)["headcount"], 2)
+        self.assertEqual(self.rollups.rollup(5)["headcount"], 2)
+        self.assertEqual(self.rollups.rollup(2)["direct_headcount"], 0)
+        self.assertEqual(self.rollups.rollup(2)["sub_departments"], 2)
+
+    def test_attributes(self):
+        root = self.rollups.rollup(1)
+        self.assertEqual((root["active"], root["inactive"]), (3, 1))
+        self.assertEqual(root["hired"], {"<1y": 1, "1-3y": 1, "10y+": 1, "unknown": 1})
+        self.assertEqual(root["titles"], {"工程师": 2, "销售": 1, "未设置": 1})
+        self.assertEqual(self.rollups.rollup(2)["titles"], {"工程师": 2, "销售": 1})
+
+    def test_cached_until_mirror_changes(self):
+        self.assertFalse(self.rollups.refresh())
+        self.store.save_department_users(5, [{"userid": "e"}], synced_at=time.time() + 1)
+        self.assertTrue(self.rollups.refresh())
+        self.assertEqual(self.rollups.rollup(5)["headcount"], 1)
+
+    def test_hire_bucket(self):
+        now = time.time()
+        self.assertEqual(hire_bucket(None, now), "unknown")
+        self.assertEqual(hire_bucket((now - 4 * 365 * 24 * 3600) * 1000, now), "3-5y")
+
+if __name__ == "__main__":
+    unittest.main()
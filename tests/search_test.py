@@ -0,0 +1,89 @@
+import time
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.contacts import DingtalkContactsServer
+from dingtalk.mirror import search
+from dingtalk.mirror.search import MirrorSearch, SearchIndex, USER_FIELDS
+from dingtalk.mirror.server import DingtalkMirrorServer
+from dingtalk.mirror.store import MirrorStore
+
+USERS = [
+    {"userid": "u1", "name": "张三", "nickname": "San Zhang", "job_number": "E001", "title": "工程师"},
+    {"userid": "u2", "name": "张三丰", "job_number": "E002", "title": "高级工程师"},
+    {"userid": "u3", "name": "李四", "nickname": "Lee", "job_number": "E100", "title": "产品经理"},
+    {"userid": "u4", "name": "Zhang Wei", "job_number": "E003", "title": "张三的助理"},
+]
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex(USER_FIELDS)
+        for user in USERS:
+            self.index.set(user["userid"], user)
+
+    def docs(self, query, mode="fuzzy", **kwargs):
+        return [doc for doc, _, _ in self.index.search(query, mode, **kwargs)[0]]
+
+    def test_exact(self):
+        self.assertEqual(self.docs("张三", "exact"), ["u1"])
+        self.assertEqual(self.docs("e100", "exact"), ["u3"])
+        self.assertEqual(self.docs("张", "exact"), [])
+
+    def test_prefix_ranks_exact_first(self):
+        self.assertEqual(self.docs("张三", "prefix"), ["u1", "u2", "u4"])
+        self.assertEqual(self.docs("E00", "prefix"), ["u1", "u2", "u4"])
+        self.assertEqual(self.docs("工程", "prefix"), ["u1"])
+
+    def test_words_and_fuzzy(self):
+        self.assertEqual(self.docs("zhang", "exact"), ["u4", "u1"])
+        self.assertEqual(self.docs("zhangwei")[0], "u4")
+        self.assertEqual(self.docs("lee"), ["u3"])
+        # a typo still finds the name
+        self.assertIn("u4", self.docs("zhang wie"))
+        self.assertEqual(self.docs("zhang wie", "prefix"), [])
+
+    def test_limit_and_remove(self):
+        hits, more = self.index.search("张三", "prefix", limit=1)
+        self.assertEqual([doc for doc, _, _ in hits], ["u1"])
+        self.assertTrue(more)
+        self.index.remove("u1")
+        self.assertEqual(self.docs("张三", "exact"), [])
+
+    @unittest.skipIf(search.lazy_pinyin is None, "pypinyin is not installed")
+    def test_pinyin(self):
+        self.assertEqual(self.docs("zhangsan", "exact"), ["u1"])
+        self.assertEqual(self.docs("zs", "prefix")[:2], ["u1", "u2"])
+
+class TestMirrorSearch(unittest.TestCase):
+    def test_refresh(self):
+        store = MirrorStore(":memory:")
+        store.save_department_users(1, USERS[:2], synced_at=100)
+        mirror_search = MirrorSearch(store)
+        self.assertEqual(len(mirror_search.search_users("张三")["list"]), 2)
+
+        store.save_department_users(1, [USERS[0], USERS[2]], synced_at=200)
+        store.prune(150)
+        result = mirror_search.search_users("E", "prefix")
+        self.assertEqual([doc for doc, _, _ in result["list"]], ["u1", "u3"])
+        store.close()
+
+    def test_search_api_total_count(self):
+        store = MirrorStore(":memory:")
+        store.save_department_users(1, [{"userid": f"u{i}", "name": f"张三{i}"} for i in range(5)])
+        store.save_departments([{"dept_id": 1, "name": "研发一部"}, {"dept_id": 2, "name": "研发二部"},
+                                {"dept_id": 3, "name": "研发三部"}])
+        store.set_meta("last_full_crawl", time.time())
+        mirror = DingtalkMirrorServer(DingtalkContactsServer(app_key="key", app_secret="secret"), store)
+        url = "https://api.dingtalk.com/v1.0/contact"
+        result = store.answer(f"{url}/users/search", {"queryWord": "张三", "offset": 1, "size": 2})
+        self.assertEqual((result["totalCount"], result["hasMore"], len(result["list"])), (5, True, 2))
+        result = store.answer(f"{url}/users/search", {"queryWord": "张三", "offset": 3, "size": 2})
+        self.assertEqual((result["totalCount"], result["hasMore"], len(result["list"])), (5, False, 2))
+        result = store.answer(f"{url}/departments/search", {"queryWord": "研发", "size": 1})
+        self.assertEqual((result["totalCount"], result["hasMore"]), (3, True))
+        store.close()
+
+if __name__ == "__main__":
+    unittest.main()
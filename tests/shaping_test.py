@@ -0,0 +1,50 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.shaping import find_items, make_shaper
+
+USERS_PAGE = {
+    "has_more": False,
+    "next_cursor": 2,
+    "list": [
+        {"userid": "1", "name": "Alice", "active": True, "title": "Engineer", "dept_id_list": [1, 2],
+         "dept_order_list": [{"dept_id": 1, "order": 10}]},
+        {"userid": "2", "name": "Bob", "active": False, "title": "Manager", "dept_id_list": [2],
+         "dept_order_list": [{"dept_id": 2, "order": 20}]},
+    ],
+}
+
+class TestShaping(unittest.TestCase):
+    def test_find_items(self):
+        items, rebuild = find_items(USERS_PAGE)
+        self.assertIs(items, USERS_PAGE["list"])
+        self.assertEqual(rebuild([])["next_cursor"], 2)
+        # a user detail is a single record, not a page of dept orders
+        items, _ = find_items(USERS_PAGE["list"][0])
+        self.assertIsNone(items)
+        items, _ = find_items([{"dept_id": 1}])
+        self.assertEqual(items, [{"dept_id": 1}])
+
+    def test_projection(self):
+        shaped = make_shaper(fields=["userid", "dept_order_list.dept_id"])(USERS_PAGE)
+        self.assertEqual(shaped["list"][0], {"userid": "1", "dept_order_list": [{"dept_id": 1}]})
+        self.assertFalse(shaped["has_more"])
+
+    def test_projection_single_record(self):
+        shaped = make_shaper(fields=["name"])(USERS_PAGE["list"][1])
+        self.assertEqual(shaped, {"name": "Bob"})
+
+    def test_filter(self):
+        shape = make_shaper(fields=["userid"], filter=[{"field": "active", "value": True}])
+        self.assertEqual(shape(USERS_PAGE)["list"], [{"userid": "1"}])
+        shape = make_shaper(filter=[{"field": "dept_id_list", "op": "contains", "value": 2},
+                                    {"field": "title", "op": "startswith", "value": "Man"}])
+        self.assertEqual([u["userid"] for u in shape(USERS_PAGE)["list"]], ["2"])
+        shape = make_shaper(filter=[{"field": "missing", "op": "exists", "value": False}])
+        self.assertEqual(len(shape(USERS_PAGE)["list"]), 2)
+
+    def test_unknown_op(self):
+        with self.assertRaises(ValueError):
+            make_shaper(filter=[{"field": "name", "op": "like", "value": "A"}])
@@ -0,0 +1,107 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.dingtalk_server import DingtalkError
+from dingtalk.mirror.crawler import crawl
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.sync import IncrementalSync
+
+class FakeOrg:
+    """An organization whose users are listed most recently modified first."""
+
+    def __init__(self):
+        self.departments = {
+            1: {"dept_id": 1, "name": "root"},
+            2: {"dept_id": 2, "parent_id": 1, "name": "研发"},
+            3: {"dept_id": 3, "parent_id": 1, "name": "销售"},
+        }
+        # in modification order, oldest first
+        self.users = [{"userid": f"u{i}", "name": f"用户{i}", "dept_id_list": [2 if i < 6 else 3]} for i in range(10)]
+        self.left = []
+        self.calls = []
+
+    def modify(self, userid, **fields):
+        user = next(u for u in self.users if u["userid"] == userid)
+        self.users.remove(user)
+        self.users.append({**user, **fields})
+
+    async def get_department_detail(self, dept_id):
+        self.calls.append(("get", dept_id))
+        return self.departments[dept_id]
+
+    async def get_department_list_old(self, dept_id=None, language=None):
+        self.calls.append(("listsub", dept_id))
+        return [d for d in self.departments.values() if d.get("parent_id") == dept_id]
+
+    async def get_department_user_details(self, dept_id, cursor, size, order_field=None):
+        self.calls.append(("users", dept_id))
+        if dept_id not in self.departments:
+            raise DingtalkError("POST request failed: {'errcode': 60003, 'errmsg': '部门不存在'}", 60003, "部门不存在")
+        users = [u for u in self.users if dept_id in u["dept_id_list"]]
+        if order_field == "modify_desc":
+            users.reverse()
+        page = {"has_more": cursor + size < len(users), "list": users[cursor:cursor + size]}
+        if page["has_more"]:
+            page["next_cursor"] = cursor + size
+        return page
+
+    async def get_employee_leave_records(self, start_time, end_time=None, next_token="0", max_results=50):
+        self.calls.append(("leave", next_token))
+        return {"records": [{"userId": u} for u in self.left]}
+
+class TestIncrementalSync(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.store = MirrorStore(":memory:")
+        self.org = FakeOrg()
+        await crawl(self.org, self.store, page_size=3)
+        self.org.calls.clear()
+
+    async def asyncTearDown(self):
+        self.store.close()
+
+    async def sync(self):
+        return await IncrementalSync(self.org, self.store, page_size=3).run()
+
+    async def test_unchanged(self):
+        report = await self.sync()
+        # one member page per department, no sub-department listings
+        self.assertEqual(sorted(c for c in self.org.calls if c[0] == "users"), [("users", 1), ("users", 2), ("users", 3)])
+        self.assertEqual(report["changed_users"], 0)
+        self.assertIsNotNone(self.store.get_meta("last_sync"))
+
+    async def test_changes(self):
+        self.org.modify("u0", name="新名字")
+        self.org.modify("u1", dept_id_list=[3])
+        self.org.departments[4] = {"dept_id": 4, "parent_id": 3, "name": "华东"}
+        self.org.modify("u7", dept_id_list=[4])
+        self.org.users = [u for u in self.org.users if u["userid"] != "u9"]
+        self.org.left = ["u9"]
+        report = await self.sync()
+
+        self.assertEqual(report["changed_users"], 3)
+        self.assertEqual(report["departures"], 1)
+        self.assertEqual(report["new_departments"], [4])
+        self.assertEqual(self.store.get_user("u0")["name"], "新名字")
+        self.assertIsNone(self.store.get_user("u9"))
+        self.assertEqual(self.store.user_department_ids("u1"), [3])
+        self.assertEqual(self.store.user_department_ids("u7"), [4])
+        self.assertEqual([u["userid"] for u in self.store.department_users(3)["list"]], ["u6", "u8", "u1"])
+        self.assertEqual(self.store.sub_department_ids(3), [4])
+
+    async def test_removed_department(self):
+        del self.org.departments[3]
+        for userid in ("u6", "u7", "u8", "u9"):
+            self.org.modify(userid, dept_id_list=[2])
+        report = await self.sync()
+        self.assertEqual(report["removed_departments"], [3])
+        self.assertIsNone(self.store.get_department(3))
+        self.assertEqual(len(self.store.department_users(2)["list"]), 10)
+
+    async def test_requires_crawl(self):
+        with self.assertRaises(Exception):
+            await IncrementalSync(self.org, MirrorStore(":memory:")).run()
+
+if __name__ == "__main__":
+    unittest.main()
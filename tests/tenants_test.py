@@ -0,0 +1,52 @@
+import json as JSON
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.tenants import TenantRegistry
+
+class TestTenantRegistry(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.registry = TenantRegistry({
+            "corp_a": {"app_key": "key_a", "app_secret": "secret_a", "qps": 10, "max_connections": 5},
+            "corp_b": {"app_key": "key_b", "app_secret": "secret_b"},
+        })
+
+    async def asyncTearDown(self):
+        await self.registry.cleanup()
+
+    def test_default_is_first_tenant(self):
+        self.assertEqual(self.registry.get().name, "corp_a")
+
+    def test_tenants_are_isolated(self):
+        a = self.registry.get("corp_a")
+        b = self.registry.get("corp_b")
+        self.assertIs(a, self.registry.get("corp_a"))
+        self.assertEqual(a.contacts.app_key, "key_a")
+        self.assertEqual(b.im.app_key, "key_b")
+        self.assertEqual(a.contacts.max_connections, 5)
+        # contacts and IM of one tenant share a budget, tenants don't
+        self.assertIs(a.contacts.rate_limiter, a.im.rate_limiter)
+        self.assertIsNot(a.contacts.rate_limiter, b.contacts.rate_limiter)
+        self.assertEqual(a.contacts.rate_limiter.qps, 10)
+
+    def test_unknown_tenant(self):
+        with self.assertRaises(ValueError):
+            self.registry.get("corp_c")
+
+    async def test_missing_credentials(self):
+        registry = TenantRegistry({"corp_c": {"app_key": "key_c", "app_secret": ""}})
+        with patch.dict(os.environ, {"DD_APP_KEY": "key", "DD_APP_SECRET": "secret"}):
+            with self.assertRaises(ValueError):
+                registry.get("corp_c")
+
+    def test_tenants_file_missing_credentials(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            JSON.dump({"corp_a": {"app_key": "key_a", "app_secret": "secret_a"}, "corp_b": {"app_key": "key_b"}}, f)
+            f.flush()
+            with patch.dict(os.environ, {"DD_APP_KEY": "key", "DD_APP_SECRET": "secret", "DD_TENANTS_FILE": f.name}):
+                with self.assertRaises(ValueError):
+                    TenantRegistry.from_env()
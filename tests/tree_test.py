@@ -0,0 +1,59 @@
+import unittest
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/src')
+from dingtalk.mirror.store import MirrorStore
+from dingtalk.mirror.tree import DepartmentTree
+
+#        1
+#      /   \
+#     2     3
+#    / \     \
+#   4   5     6
+#             |
+#             7
+EDGES = [(1, None), (2, 1), (3, 1), (4, 2), (5, 2), (6, 3), (7, 6)]
+
+class TestDepartmentTree(unittest.TestCase):
+    def setUp(self):
+        self.store = MirrorStore(":memory:")
+        self.store.save_departments([{"dept_id": d, "parent_id": p} for d, p in EDGES], synced_at=100)
+        self.tree = DepartmentTree()
+        self.assertTrue(self.tree.refresh(self.store))
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_queries(self):
+        tree = self.tree
+        self.assertEqual(tree.ancestors(7), [7, 6, 3, 1])
+        self.assertEqual(tree.depth_of(7), 3)
+        self.assertEqual(tree.parent_id(1), None)
+        self.assertEqual(tree.children(2), [4, 5])
+        self.assertEqual(tree.subtree(1), [1, 2, 4, 5, 3, 6, 7])
+        self.assertEqual(tree.subtree(3, max_depth=1), [3, 6])
+        self.assertTrue(tree.is_descendant(7, 3))
+        self.assertTrue(tree.is_descendant(3, 3))
+        self.assertFalse(tree.is_descendant(4, 3))
+        self.assertEqual(tree.lowest_common_ancestor([4, 5]), 2)
+        self.assertEqual(tree.lowest_common_ancestor([4, 7]), 1)
+        self.assertEqual(tree.lowest_common_ancestor([7, 6, 3]), 3)
+        with self.assertRaises(ValueError):
+            tree.ancestors(99)
+
+    def test_incremental_refresh(self):
+        self.assertFalse(self.tree.refresh(self.store))
+        # 5 moves under 3, 8 is new under 5
+        self.store.save_departments([{"dept_id": 5, "parent_id": 3}, {"dept_id": 8, "parent_id": 5}], synced_at=200)
+        self.assertTrue(self.tree.refresh(self.store))
+        self.assertEqual(self.tree.ancestors(8), [8, 5, 3, 1])
+        self.assertEqual(self.tree.subtree(2), [2, 4])
+
+        self.store.save_sub_departments(6, [])
+        self.assertTrue(self.tree.refresh(self.store))
+        self.assertNotIn(7, self.tree)
+        self.assertEqual(self.tree.subtree(3), [3, 5, 8, 6])
+
+if __name__ == "__main__":
+    unittest.main()